@@ -1,91 +1,352 @@
-from flask import Flask, redirect, render_template, request, session, g, jsonify
-import sqlite3
-from werkzeug.utils import secure_filename
-from werkzeug.security import check_password_hash
+from flask import Flask, redirect, render_template, request, session, g, jsonify, abort, send_from_directory, url_for, make_response
+from flask import has_app_context, has_request_context, before_render_template, template_rendered, stream_with_context
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.local import LocalProxy
+import click
+from jinja2 import FileSystemBytecodeCache
 import os
+import functools
+import json
+import sqlite3
 import time
 from datetime import date, datetime, timedelta
 from calendar import monthrange
-import smtplib
-from email.message import EmailMessage
-from dotenv import load_dotenv
-import re
+from db import ConnectionPool, fetch_records
+from migrations import MIGRATIONS, current_version, migrate, rebuild_rankings
+from cycle import CycleCache
+from cache import CodeRegistry, Generations
+from mailer import Mailer
+from images import ImageError, make_variants, remove_images, save_recipe_image
+from assets import Assets
+from search import highlight, search_recipes
+from pagination import paginate
+from recipe_text import lines_json, stored_lines
+from pagecache import PageCache
+from claims import CLAIMED, REWARD_TABLES, claim_reward
+from metrics import Metrics, normalize_sql
+from importer import KINDS as IMPORT_KINDS, ImportFileError, import_rows, parse_rows
+from exporter import EXPORTS, FORMATS, current_season, export_range, season_range, stream_export
+from rollover import archived_seasons, live_since, pending_seasons, roll_over
+from events import EventFeed
+from reminders import send_reminders
+from capacity import BookingCache, calendar, day_limit, reserve
+from tenants import ENVIRON_KEY as TENANT_KEY, TenantConfig, TenantRegistry, TenantRouter, load_tenants
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-load_dotenv(os.path.join(BASE_DIR, ".env"))
+#dotenv is only imported when there is a .env to read
+if os.path.exists(os.path.join(BASE_DIR, ".env")):
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(BASE_DIR, ".env"))
 
-app = Flask(__name__)
+#static files are served by static_file below so they can be fingerprinted
+app = Flask(__name__, static_folder=None)
 app.secret_key = os.getenv("SECRET_KEY")
 
+#compiled templates are kept on disk, so a fresh worker loads them instead of compiling
+#each one on its first request. `flask precompile-templates` fills the cache at deploy
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", os.path.join(BASE_DIR, ".template-cache"))
+if TEMPLATE_CACHE_DIR:
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)}
+
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+RECIPES_PER_PAGE = int(os.getenv("RECIPES_PER_PAGE", "20"))
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_MB", "10")) * 1024 * 1024
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpeg")
+#leave headroom for the text fields sent alongside the image
+app.config["MAX_CONTENT_LENGTH"] = MAX_IMAGE_BYTES + 1024 * 1024
+
 EMAIL = os.getenv("EMAIL")
 APP_PASSWORD = os.getenv("APP_PASSWORD")
+COORDINATOR_NAME = os.getenv("COORDINATOR_NAME", "Kovid Cerejo")
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_SSL = os.getenv("SMTP_SSL", "1") == "1"
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", "2"))
+
+DATABASE = os.getenv("DATABASE", os.path.join(BASE_DIR, "meals.db"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))
+DB_SHARED_CACHE = os.getenv("DB_SHARED_CACHE", "1") == "1"
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
+PAGE_CACHE_BYTES = int(float(os.getenv("PAGE_CACHE_MB", "32")) * 1024 * 1024)
+PAGE_CACHE_MAX_AGE = float(os.getenv("PAGE_CACHE_MAX_AGE", "300"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+WARM_CACHES = os.getenv("WARM_CACHES", "0") == "1"
+EVENT_POLL_INTERVAL = float(os.getenv("EVENT_POLL_INTERVAL", "0.5"))
+EVENT_STREAM_SECONDS = float(os.getenv("EVENT_STREAM_SECONDS", "300"))
+DROPOFF_MAX_PER_DAY = int(os.getenv("DROPOFF_MAX_PER_DAY", "0"))
+#several schools from one deployment: TENANTS is a json file listing them (see the readme)
+TENANTS = os.getenv("TENANTS")
+TENANT_MAX_OPEN = int(os.getenv("TENANT_MAX_OPEN", "8"))
+TENANT_IDLE_SECONDS = float(os.getenv("TENANT_IDLE_SECONDS", "600"))
+
+#the school this request is for, or outside a request the one TENANT names (the only
+#school, without TENANTS)
+def current_tenant():
+    if has_app_context() and "tenant" in g:
+        return g.tenant
+    return tenants.default()
+
+def get_pool():
+    return current_tenant().pool
 
-#create function to get new db during each request
+#registered first, so the portal gates and timers below all see the request's school
+@app.before_request
+def select_tenant():
+    g.tenant = tenants.acquire(request.environ.get(TENANT_KEY) or tenants.default_name)
+
+#registered before close_connection, which needs the tenant, so it runs after it
+@app.teardown_appcontext
+def release_tenant(exception):
+    tenant = g.pop("tenant", None)
+    if tenant is not None:
+        tenants.release(tenant.config.name)
+
+#redirects are written as paths from the site root, so under a path prefix they get the
+#school's prefix put in front
+@app.after_request
+def prefix_redirect(response):
+    root = request.script_root
+    location = response.headers.get("Location")
+    if root and location and location.startswith("/") and not location.startswith(("//", root + "/")):
+        response.headers["Location"] = root + location
+    return response
+
+#check out a pooled read connection for the rest of the request
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db_path = os.path.join(BASE_DIR, "meals.db")
-        db = g._database = sqlite3.connect(db_path)
-        db.row_factory = sqlite3.Row
+        db = g._database = get_pool().acquire()
     return db
 
-#close db after request
+#hand the read connection back to the pool after request
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        get_pool().release(db)
 
-#easier way to query. submit one as true if expecting only one row
+#easier way to query. submit one as true if expecting only one row.
+#selects run on the request's read connection and come back as records with date
+#columns already parsed, everything else runs on the shared writer
 def query_db(query, args=(), one=False):
-    db = get_db()
-    cur = db.execute(query, args)
+    started = time.perf_counter()
     if query.strip().lower().startswith("select"):
-        rv = cur.fetchall()
+        cur = get_db().cursor()
+        cur.row_factory = None
+        cur.execute(query, args)
+        rv = fetch_records(cur)
+        cur.close()
     else:
-        db.commit()
+        with get_pool().writer() as db:
+            db.execute(query, args)
+            db.commit()
+        #after the commit, so a page built from the old data is never stored under the new generation
+        pages.note_write(query)
         rv = None
-    cur.close()
+    elapsed = time.perf_counter() - started
+    if has_request_context():
+        g.db_time = g.get("db_time", 0.0) + elapsed
+        g.db_queries = g.get("db_queries", 0) + 1
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        log_slow_query(query, args, elapsed)
     return (rv[0] if rv else None) if one else rv
 
-def send_email(teacher_email, volunteer_email, teacher_name, meal_name, volunteer_name, dropoff_date):
-    msg = EmailMessage()
-    msg["Subject"] = f"Meals of Gratitude {datetime.today().strftime('%B %Y')}"
-    msg["From"] = EMAIL
-    msg["To"] = teacher_email
-    msg["Cc"] = volunteer_email
-    date = datetime.strptime(dropoff_date, "%Y-%m-%d")
-    formatted_date = date.strftime("%A, %B ") + str(date.day)
-    email_body_text = (
-        f"Dear {teacher_name},\n\nThis email comes from the Meals of Gratitude program letting you "
-        f"know that your meal, {meal_name}, will be delivered on the afternoon of {formatted_date} "
-        f"by {volunteer_name} at the front office.\n\nPlease note that the parent volunteer has selected "
-        f"this date and it may not be changed. Please let the volunteer (copied on this email) "
-        f"know if you will be out of school on this date.\n\nIf you like the meal or would like to "
-        f"provide feedback to make this program better, our volunteers would love to hear from you!\n\n"
-        f"Sincerely,\n\nKovid Cerejo\n\nMeals of Gratitude Coordinator"
-    )
-    email_body_html = f"""
-    <html>
-        <body>
-            <p>Dear {teacher_name},</p>
-            <p>This email comes from the Meals of Gratitude program letting you know that your meal, <b>{meal_name}</b>, will be delivered on the afternoon of <b>{formatted_date}</b> by <b>{volunteer_name}</b> at the front office.</p>
-            <p>Please note that the parent volunteer has selected this date and it may not be changed. Please let the volunteer (copied on this email) know if you will be out of school on this date.</p>
-            <p>If you like the meal or would like to provide feedback to make this program better, our volunteers would love to hear from you!</p>
-            <p>Sincerely,<br>
-            Kovid Cerejo<br>
-            Meals of Gratitude Coordinator</p>
-        </body>
-    </html>
-    """
-    msg.set_content(email_body_text)
-    msg.add_alternative(email_body_html, subtype="html")
-
-    recipients = [msg["To"], msg["Cc"]]
-
-    with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-        smtp.login(EMAIL, APP_PASSWORD)
-        smtp.send_message(msg, to_addrs=recipients)
+metrics = Metrics()
+
+#log a statement over SLOW_QUERY_MS with its query plan, to spot full scans
+def log_slow_query(query, args, elapsed):
+    metrics.slow_query()
+    plan = []
+    if has_app_context():
+        try:
+            plan = [row[3] for row in get_db().execute("EXPLAIN QUERY PLAN " + query, args)]
+        except sqlite3.Error as e:
+            plan = [f"no plan: {e}"]
+    where = f" on {request.method} {request.path}" if has_request_context() else ""
+    app.logger.warning("slow query %.1f ms%s: %s%s", elapsed * 1000, where, normalize_sql(query),
+                       "".join("\n    " + line for line in plan))
+
+#registered before the portal gates so redirects from them are timed too
+@app.before_request
+def start_request_timer():
+    g.started = time.perf_counter()
+
+#pick up writes made by other workers: one PRAGMA per request, plus a read of the
+#generations table when something was committed since the last request
+@app.before_request
+def sync_generations():
+    generations.sync()
+
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+def stop_render_timer(sender, template, context, **extra):
+    if "render_started" in g:
+        g.render_time = g.get("render_time", 0.0) + time.perf_counter() - g.pop("render_started")
+
+before_render_template.connect(start_render_timer, app)
+template_rendered.connect(stop_render_timer, app)
+
+#Server-Timing shows up in the browser's network panel. the same numbers feed /admin/metrics
+@app.after_request
+def server_timing(response):
+    started = g.get("started")
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    db_time = g.get("db_time", 0.0)
+    queries = g.get("db_queries", 0)
+    response.headers["Server-Timing"] = (f'db;dur={db_time * 1000:.1f};desc="{queries} queries", '
+                                         f'render;dur={g.get("render_time", 0.0) * 1000:.1f}, total;dur={total * 1000:.1f}')
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.record(route, request.method, response.status_code, total, db_time, queries)
+    return response
+
+#everything one school needs: its connection pool, and the caches, event feed and mailer
+#built on it. the names below (generations, pages, cycles, codes, reward_events, mailer)
+#stand for the current school's
+class Tenant:
+    def __init__(self, config):
+        self.config = config
+        self.pool = ConnectionPool(config.database, size=DB_POOL_SIZE, busy_timeout=DB_BUSY_TIMEOUT,
+                                   shared_cache=DB_SHARED_CACHE)
+        #bring the schema up to date before serving anything
+        if AUTO_MIGRATE:
+            with self.pool.writer() as db:
+                migrate(db)
+        #per-table write counters shared by every worker through the database
+        self.generations = Generations(self.pool.connect)
+        #rendered pages, invalidated by query_db's writes to the tables they read. the
+        #memory budget is split between the schools that may be open at once
+        self.pages = PageCache(max_bytes=PAGE_CACHE_BYTES // min(tenants.max_open, len(tenants.configs)),
+                               max_age=PAGE_CACHE_MAX_AGE, shared=self.generations)
+        #deadlines only change when the admin edits them, so every route shares one parsed copy
+        self.cycles = CycleCache(query_db, generation=lambda: self.generations.get("deadlines"))
+        #dropoffs booked per day, for the signup forms
+        self.bookings = BookingCache(query_db, generation=lambda: (self.generations.get("meals"),
+                                                                   self.generations.get("gift_cards")))
+        #access code versions checked by the portal gates on every request
+        self.codes = CodeRegistry(self.pool.connect, self.generations)
+        #claim, unclaim and hide events pushed to the open teacher reward pages
+        self.reward_events = EventFeed(self.pool.connect, interval=EVENT_POLL_INTERVAL)
+        #reminder emails are queued in the outbox and sent by background workers
+        self.mailer = Mailer(self.pool.writer, host=config.smtp_host, port=config.smtp_port, username=config.email,
+                             password=config.app_password, use_ssl=config.smtp_ssl, workers=MAIL_WORKERS)
+
+    #a school still sending mail isn't closed
+    def busy(self):
+        return self.mailer.busy()
+
+    def close(self):
+        self.reward_events.close()
+        self.codes.close()
+        self.generations.close()
+        self.pool.close()
+
+if TENANTS:
+    tenant_configs = load_tenants(TENANTS, {"email": EMAIL, "app_password": APP_PASSWORD, "coordinator": COORDINATOR_NAME,
+                                            "smtp_host": SMTP_HOST, "smtp_port": SMTP_PORT, "smtp_ssl": SMTP_SSL})
+else:
+    tenant_configs = [TenantConfig(name="default", database=DATABASE, email=EMAIL, app_password=APP_PASSWORD,
+                                   coordinator=COORDINATOR_NAME, smtp_host=SMTP_HOST, smtp_port=SMTP_PORT, smtp_ssl=SMTP_SSL)]
+tenants = TenantRegistry(tenant_configs, Tenant, max_open=TENANT_MAX_OPEN, idle_seconds=TENANT_IDLE_SECONDS,
+                         default=os.getenv("TENANT") or None)
+app.wsgi_app = TenantRouter(app.wsgi_app, tenants)
+
+#each school signs its session cookie with its own salt and, under a path prefix, scopes
+#it to that prefix, so being logged in at one school counts for nothing at another
+class TenantSessionInterface(SecureCookieSessionInterface):
+    def get_signing_serializer(self, app):
+        serializer = super().get_signing_serializer(app)
+        if serializer is not None:
+            serializer.salt = f"{self.salt}-{request.environ.get(TENANT_KEY)}".encode()
+        return serializer
+
+    def get_cookie_path(self, app):
+        return request.script_root or super().get_cookie_path(app)
+
+if TENANTS:
+    app.session_interface = TenantSessionInterface()
+
+generations = LocalProxy(lambda: current_tenant().generations)
+pages = LocalProxy(lambda: current_tenant().pages)
+cycles = LocalProxy(lambda: current_tenant().cycles)
+bookings = LocalProxy(lambda: current_tenant().bookings)
+codes = LocalProxy(lambda: current_tenant().codes)
+reward_events = LocalProxy(lambda: current_tenant().reward_events)
+mailer = LocalProxy(lambda: current_tenant().mailer)
+
+#a single school is opened (and migrated) before serving anything
+if not TENANTS:
+    tenants.default()
+
+#serve a view's GET responses from the page cache. `tables` are the tables the page reads.
+#runs after the before_request gates, and the key includes today's date since the pages
+#show the current month
+def cached_page(*tables):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+            key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))),
+                   date.today(), request.script_root)
+            def build():
+                response = make_response(view(*args, **kwargs))
+                return response.get_data(), response.status_code, list(response.headers)
+            body, status, headers = pages.get_or_build(key, tables, build,
+                                                       size=lambda page: len(page[0]) + 512 if page[1] == 200 else None)
+            return app.response_class(body, status=status, headers=headers)
+        return wrapper
+    return decorator
+
+assets = Assets(STATIC_DIR)
+
+#link to the current page with one list's cursor swapped, keeping the other lists' cursors
+@app.template_global()
+def page_url(param, cursor):
+    args = request.args.to_dict()
+    args[param] = cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+#every url_for("static", ...) gets ?v=<content hash>, so changed files get new urls
+@app.url_defaults
+def fingerprint_static(endpoint, values):
+    if endpoint == "static" and "v" not in values:
+        version = assets.version(values.get("filename", ""))
+        if version:
+            values["v"] = version
+
+#local copy of a third party asset when it has been vendored, otherwise its cdn url
+def vendor_asset(name):
+    local, url, integrity = assets.vendor(name)
+    return {"url": url_for("static", filename=local) if local else url, "integrity": integrity}
+
+@app.context_processor
+def asset_helpers():
+    return {"vendor_asset": vendor_asset}
+
+#fingerprinted urls are cached for a year without revalidation. anything else must
+#revalidate, which the content-hash etag turns into a 304 when nothing changed
+@app.route("/static/<path:filename>", endpoint="static")
+def static_file(filename):
+    version = assets.version(filename)
+    if version is None:
+        abort(404)
+    response = send_from_directory(STATIC_DIR, filename, etag=version)
+    if request.args.get("v") == version:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+        response.cache_control.max_age = None
+    return response
 
 @app.before_request
 def login_required():
@@ -96,15 +357,13 @@ def login_required():
 @app.before_request
 def volunteer_code_required():
     if request.path.startswith("/volunteers") and request.path != "/volunteers/enter-code":
-        current_version = query_db("SELECT id FROM volunteer_codes ORDER BY id DESC LIMIT 1", one=True)["id"]
-        if not session.get("volunteer_verified") or session.get("volunteer_code_version") != current_version:
+        if not session.get("volunteer_verified") or session.get("volunteer_code_version") != codes.version("volunteer"):
             return redirect("/volunteers/enter-code")
 
 @app.before_request
 def teacher_code_required():
     if request.path.startswith("/teachers") and request.path != "/teachers/enter-code":
-        current_version = query_db("SELECT id FROM teacher_codes ORDER BY id DESC LIMIT 1", one=True)["id"]
-        if not session.get("teacher_verified") or session.get("teacher_code_version") != current_version:
+        if not session.get("teacher_verified") or session.get("teacher_code_version") != codes.version("teacher"):
             return redirect("/teachers/enter-code")
 
 @app.route("/")
@@ -113,233 +372,229 @@ def index():
 
 @app.route("/volunteers/")
 def volunteers():
-    dates_const = query_db("SELECT month_year, volunteer_start, volunteer_end FROM deadlines ORDER BY id DESC LIMIT 1", one=True)
-    date = dict(dates_const)
-    date["volunteer_start"] = datetime.strptime(date["volunteer_start"], "%Y-%m-%d").date()
-    date["volunteer_end"] = datetime.strptime(date["volunteer_end"], "%Y-%m-%d").date()
     today = datetime.today().date()
-    return render_template("volunteers.html", date=date, today=today)
+    return render_template("volunteers.html", date=cycles.latest(), today=today)
 
 @app.route("/volunteers/enter-code", methods=["GET", "POST"])
 def enter_volunteer_code():
     if request.method == "POST":
         entered_code = request.form.get("code")
-        valid_code = query_db("SELECT id, code FROM volunteer_codes ORDER BY id DESC LIMIT 1", one=True)
-        if entered_code != valid_code["code"]:
+        code_id, valid_code = codes.current("volunteer")
+        if entered_code != valid_code:
             return render_template("invalid_volunteer_code.html")
         else:
             session["volunteer_verified"] = True
-            session["volunteer_code_version"] = valid_code["id"]
+            session["volunteer_code_version"] = code_id
         return redirect("/volunteers")
     else:
         return render_template("volunteer_code.html")
 
 @app.route("/volunteers/signups/")
+@cached_page("meals", "gift_cards", "volunteers", "recipes", "teachers", "deadlines")
 def volunteer_signups():
     beg_month = datetime.today().strftime("%Y-%m")
     beg_month = beg_month + "-01"
-    meals_const = query_db("""SELECT meals.id AS meal_id, recipes.name AS meal_name, date, volunteers.name 
+    meals = query_db("""SELECT meals.id AS meal_id, recipes.name AS meal_name, date, volunteers.name 
                            AS volunteer_name, recipes.id AS recipe_id, teachers.name AS teacher_name, 
                            teachers.email AS teacher_email FROM meals JOIN volunteers ON meals.volunteer_id = volunteers.id 
                            JOIN recipes ON meals.recipe_id = recipes.id LEFT JOIN teachers ON meals.teacher_id = teachers.id 
                            WHERE date >= ? ORDER BY volunteer_name, date""", 
                            (beg_month,))
-    gcs_const = query_db("""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, date, volunteers.name AS volunteer_name, 
+    gcs = query_db("""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, date, volunteers.name AS volunteer_name, 
                          teachers.name AS teacher_name, teachers.email AS teacher_email FROM gift_cards JOIN volunteers 
                          ON gift_cards.volunteer_id = volunteers.id LEFT JOIN teachers ON gift_cards.teacher_id = teachers.id 
                          WHERE date >= ? ORDER BY volunteer_name, date""", (beg_month,))
-    meals = []
-    gcs = []
-    for row in meals_const:
-        meal = dict(row)
-        meal["date"] = datetime.strptime(meal["date"], "%Y-%m-%d").date()
-        meals.append(meal)
-    for row in gcs_const:
-        gc = dict(row)
-        gc["date"] = datetime.strptime(gc["date"], "%Y-%m-%d").date()
-        gcs.append(gc)
-    today_1 = datetime.today().date()
-    month_year = today_1.strftime("%B %Y")
-    dates_const = query_db("SELECT month_year, volunteer_start, volunteer_end, teacher_end FROM deadlines WHERE month_year = ? ORDER BY id DESC LIMIT 1", (month_year,), one=True)
-    date = dict(dates_const)
-    date["volunteer_start"] = datetime.strptime(date["volunteer_start"], "%Y-%m-%d").date()
-    date["volunteer_end"] = datetime.strptime(date["volunteer_end"], "%Y-%m-%d").date()
-    date["month_year"] = datetime.strptime(date["month_year"], "%B %Y").date()
-    date["teacher_end"] = datetime.strptime(date["teacher_end"], "%Y-%m-%d").date()
     today = datetime.today().date()
-    return render_template("volunteer_signups.html", meals=meals, gcs=gcs, date=date, today=today)
+    return render_template("volunteer_signups.html", meals=meals, gcs=gcs, date=cycles.for_month(today), today=today)
 
 @app.route("/volunteers/signups/all-time")
 def volunteer_signups_all():
-    today = datetime.today().date()
-    if today.month >= 8:
-        year = today.year
+    year = current_season()
+    season = request.args.get("season", type=int)
+    archived = archived_seasons(get_db())
+    #nothing older than the first archived season was ever kept
+    if season is not None and season < (archived[0] if archived else year):
+        abort(400)
+    #a past season reads the archive as well, the current one only the live tables
+    if season is not None and season < year:
+        first, last = season_range(season)
+        meals_table, gcs_table = "all_meals AS meals", "all_gift_cards AS gift_cards"
     else:
-        year = today.year - 1
-    first = f"{year}-08-01"
-    meals_const = query_db("""SELECT meals.id AS meal_id, recipes.name AS meal_name, date, volunteers.name 
+        season = year
+        first, last = season_range(year)[0], "9999-12-31"
+        meals_table, gcs_table = "meals", "gift_cards"
+    meals = paginate(query_db, f"""SELECT meals.id AS meal_id, recipes.name AS meal_name, date, volunteers.name 
                            AS volunteer_name, recipes.id AS recipe_id, teachers.name AS teacher_name 
-                           FROM meals JOIN volunteers ON meals.volunteer_id = volunteers.id JOIN recipes 
-                           ON meals.recipe_id = recipes.id LEFT JOIN teachers ON meals.teacher_id = teachers.id
-                           WHERE date >= ? ORDER BY date, volunteer_name""", 
-                           (first,))
-    gcs_const = query_db("""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, date, volunteers.name AS volunteer_name, 
-                         teachers.name AS teacher_name FROM gift_cards JOIN volunteers ON gift_cards.volunteer_id = volunteers.id 
-                         LEFT JOIN teachers ON gift_cards.teacher_id = teachers.id WHERE date >= ? ORDER BY date, volunteer_name""", (first,))
-    meals = []
-    gcs = []
-    for row in meals_const:
-        meal = dict(row)
-        meal["date"] = datetime.strptime(meal["date"], "%Y-%m-%d").date()
-        meals.append(meal)
-    for row in gcs_const:
-        gc = dict(row)
-        gc["date"] = datetime.strptime(gc["date"], "%Y-%m-%d").date()
-        gcs.append(gc)
-    return render_template("volunteer_signups_all.html", meals=meals, gcs=gcs)
+                           FROM {meals_table} JOIN volunteers ON meals.volunteer_id = volunteers.id JOIN recipes 
+                           ON meals.recipe_id = recipes.id LEFT JOIN teachers ON meals.teacher_id = teachers.id""",
+                     [("meals.date", "date"), ("volunteers.name", "volunteer_name"), ("meals.id", "meal_id")],
+                     where="meals.date BETWEEN ? AND ?", args=(first, last), cursor=request.args.get("meals"),
+                     per_page=PAGE_SIZE)
+    gcs = paginate(query_db, f"""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, date, volunteers.name AS volunteer_name, 
+                         teachers.name AS teacher_name FROM {gcs_table} JOIN volunteers ON gift_cards.volunteer_id = volunteers.id 
+                         LEFT JOIN teachers ON gift_cards.teacher_id = teachers.id""",
+                   [("gift_cards.date", "date"), ("volunteers.name", "volunteer_name"), ("gift_cards.id", "gc_id")],
+                   where="gift_cards.date BETWEEN ? AND ?", args=(first, last), cursor=request.args.get("gcs"),
+                   per_page=PAGE_SIZE)
+    return render_template("volunteer_signups_all.html", meals=meals, gcs=gcs, season=season, current=year,
+                           archived=archived)
+
+#each day of the cycle's dropoff window with its booked and remaining slots
+def dropoff_slots(cycle):
+    if cycle is None or not cycle.dropoff_start or not cycle.dropoff_end:
+        return []
+    booked = bookings.booked(cycle.dropoff_start.isoformat(), cycle.dropoff_end.isoformat())
+    return calendar(cycle, booked, day_limit(cycle, DROPOFF_MAX_PER_DAY))
+
+#write a signup onto `day` unless that day is full for the current cycle (see
+#capacity.reserve). returns whether it was written
+def book_dropoff(day, sql, args, meal=None, gift_card=None):
+    limit = day_limit(cycles.latest(), DROPOFF_MAX_PER_DAY)
+    with get_pool().writer() as db:
+        booked = reserve(db, day, limit, sql, args, meal, gift_card)
+    if booked:
+        pages.note_write(sql)
+    return booked
+
+#the dropoff date posted in `name` as YYYY-MM-DD, or a 400 for a missing or malformed one,
+#or one outside the current cycle's dropoff window
+def form_date(name="date"):
+    try:
+        day = date.fromisoformat(request.form.get(name) or "")
+    except ValueError:
+        abort(400)
+    cycle = cycles.latest()
+    if cycle is not None and cycle.dropoff_start and cycle.dropoff_end and not cycle.dropoff_start <= day <= cycle.dropoff_end:
+        abort(400)
+    return day.isoformat()
 
 @app.route("/volunteers/signups/edit-meal-<int:mealid>", methods=["GET", "POST"])
 def edit_meal(mealid):
     if request.method == "POST":
-        id = request.form.get("id")
         action = request.form.get("action")
         if action == "delete":
-            query_db("DELETE FROM meals WHERE id = ?", (id,))
+            query_db("DELETE FROM meals WHERE id = ?", (mealid,))
         else:
-            date = request.form.get("date")
-            recipe_id = request.form.get("recipe_id")
-            query_db("UPDATE meals SET date = ?, recipe_id = ? WHERE id = ?", (date, recipe_id, id))
+            day = form_date()
+            recipe_id = request.form.get("recipe_id", type=int)
+            if recipe_id is None:
+                abort(400)
+            if not book_dropoff(day, "UPDATE meals SET date = ?, recipe_id = ? WHERE id = ?", (day, recipe_id, mealid),
+                                meal=mealid):
+                return redirect(f"/volunteers/signups/edit-meal-{mealid}?full={day}")
         return redirect("/volunteers/signups")
     else:
-        meal_const = query_db("""SELECT meals.id AS meal_id, meals.date AS date, 
+        meal = query_db("""SELECT meals.id AS meal_id, meals.date AS date, 
                             volunteers.name AS volunteer_name, recipes.name AS recipe_name,
                             recipes.id AS recipe_id FROM meals JOIN recipes ON meals.recipe_id = recipes.id
                             JOIN volunteers ON meals.volunteer_id = volunteers.id WHERE meals.id = ?""", 
                             (mealid,), one=True)
         
-        if not meal_const:
+        if not meal:
             return redirect("/volunteers/signups")
         else:
-            meal = dict(meal_const)
-            meal["date"] = datetime.strptime(meal["date"], "%Y-%m-%d").date()
-            dates_const = query_db("SELECT month_year, volunteer_start, volunteer_end FROM deadlines ORDER BY id DESC LIMIT 1", 
-                                   one=True)
-            date = dict(dates_const)
-            date["volunteer_start"] = datetime.strptime(date["volunteer_start"], "%Y-%m-%d").date()
-            date["volunteer_end"] = datetime.strptime(date["volunteer_end"], "%Y-%m-%d").date()
-            date["month_year"] = datetime.strptime(date["month_year"], "%B %Y").date()
+            cycle = cycles.latest()
             today = datetime.today().date()
             recipes = query_db("SELECT name, id FROM recipes")
-            start = query_db("SELECT dropoff_start FROM deadlines ORDER BY id DESC LIMIT 1", one=True)["dropoff_start"]
-            end = query_db("SELECT dropoff_end FROM deadlines ORDER BY id DESC LIMIT 1", one=True)["dropoff_end"]
-            return render_template("edit_meal.html", meal=meal, recipes=recipes, start=start, end=end, date=date, today=today)
+            return render_template("edit_meal.html", meal=meal, recipes=recipes, start=cycle.dropoff_start,
+                                   end=cycle.dropoff_end, date=cycle, today=today, slots=dropoff_slots(cycle),
+                                   full=request.args.get("full"))
 
 @app.route("/volunteers/signups/edit-gc-<int:gcid>", methods=["GET", "POST"])
 def edit_gc(gcid):  
     if request.method == "POST":
-        id = request.form.get("id")
         action = request.form.get("action")
         if action == "delete":
-            query_db("DELETE FROM gift_cards WHERE id = ?", (id,))
+            query_db("DELETE FROM gift_cards WHERE id = ?", (gcid,))
         else:
-            date = request.form.get("date")
+            day = form_date()
             gc_name = request.form.get("gc_name")
-            query_db("UPDATE gift_cards SET name = ?, date = ? WHERE id = ?", (gc_name, date, id))
+            if not gc_name:
+                abort(400)
+            if not book_dropoff(day, "UPDATE gift_cards SET name = ?, date = ? WHERE id = ?", (gc_name, day, gcid),
+                                gift_card=gcid):
+                return redirect(f"/volunteers/signups/edit-gc-{gcid}?full={day}")
         return redirect("/volunteers/signups")
     else:
-        gc_const = query_db("""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, 
+        gc = query_db("""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, 
                       gift_cards.date AS date, volunteers.name AS volunteer_name 
                       FROM gift_cards JOIN volunteers ON gift_cards.volunteer_id = 
                       volunteers.id WHERE gift_cards.id = ?""", (gcid,), one=True)
-        if not gc_const:
+        if not gc:
             return redirect("/volunteers/signups")
-        gc = dict(gc_const)
-        gc["date"] = datetime.strptime(gc["date"], "%Y-%m-%d").date()
-        dates_const = query_db("SELECT month_year, volunteer_start, volunteer_end FROM deadlines ORDER BY id DESC LIMIT 1", 
-                               one=True)
-        date = dict(dates_const)
-        date["volunteer_start"] = datetime.strptime(date["volunteer_start"], "%Y-%m-%d").date()
-        date["volunteer_end"] = datetime.strptime(date["volunteer_end"], "%Y-%m-%d").date()
-        date["month_year"] = datetime.strptime(date["month_year"], "%B %Y").date()
+        cycle = cycles.latest()
         today = datetime.today().date()
-        start = query_db("SELECT dropoff_start FROM deadlines ORDER BY id DESC LIMIT 1", one=True)["dropoff_start"]
-        end = query_db("SELECT dropoff_end FROM deadlines ORDER BY id DESC LIMIT 1", one=True)["dropoff_end"]
-        return render_template("edit_gc.html", gc=gc, start=start, end=end, today=today, date=date)
+        return render_template("edit_gc.html", gc=gc, start=cycle.dropoff_start, end=cycle.dropoff_end, today=today,
+                               date=cycle, slots=dropoff_slots(cycle), full=request.args.get("full"))
 
 @app.route("/volunteers/gc-signup", methods=["GET", "POST"])
 def gc_signup():
     if request.method == "POST":
         volunteer_name = request.form.get("name")
         gc_name = request.form.get("gc_name")
-        date = request.form.get("date")
-        volunteer_id = query_db("SELECT id FROM volunteers WHERE name = ?", (volunteer_name,), one=True)["id"]
-        query_db("INSERT INTO gift_cards (name, date, volunteer_id) VALUES (?, ?, ?)", (gc_name, date, volunteer_id))
+        day = form_date()
+        volunteer = query_db("SELECT id FROM volunteers WHERE name = ?", (volunteer_name,), one=True)
+        if not gc_name or volunteer is None:
+            abort(400)
+        if not book_dropoff(day, "INSERT INTO gift_cards (name, date, volunteer_id) VALUES (?, ?, ?)",
+                            (gc_name, day, volunteer["id"])):
+            return redirect(f"/volunteers/gc-signup?full={day}")
         return redirect("/volunteers/signups")
     else:
-        dates_const = query_db("SELECT month_year, volunteer_start, volunteer_end FROM deadlines ORDER BY id DESC LIMIT 1", one=True)
-        date = dict(dates_const)
-        date["volunteer_start"] = datetime.strptime(date["volunteer_start"], "%Y-%m-%d").date()
-        date["volunteer_end"] = datetime.strptime(date["volunteer_end"], "%Y-%m-%d").date()
+        cycle = cycles.latest()
         today = datetime.today().date()
         volunteers = query_db("SELECT name FROM volunteers")
-        start = query_db("SELECT dropoff_start FROM deadlines ORDER BY id DESC LIMIT 1", one=True)["dropoff_start"]
-        end = query_db("SELECT dropoff_end FROM deadlines ORDER BY id DESC LIMIT 1", one=True)["dropoff_end"]
-        return render_template("gc_signup.html", volunteers=volunteers, start=start, end=end, today=today, date=date)
+        return render_template("gc_signup.html", volunteers=volunteers, start=cycle.dropoff_start, end=cycle.dropoff_end,
+                               today=today, date=cycle, slots=dropoff_slots(cycle), full=request.args.get("full"))
 
 @app.route("/volunteers/meal-signup", methods=["GET", "POST"])
 def meal_signup():
     if request.method == "POST":
         volunteer_name = request.form.get("name")
         meal_name = request.form.get("meal")
-        recipe_id = query_db("SELECT id FROM recipes WHERE name = ?", (meal_name,), one=True)["id"]
-        date = request.form.get("date")
-        volunteer_id = query_db("SELECT id FROM volunteers WHERE name = ?",
-                                (volunteer_name,), one=True)["id"]
-        query_db("INSERT INTO meals (recipe_id, date, volunteer_id) VALUES (?, ?, ?)",
-                  (recipe_id, date, volunteer_id))
+        recipe = query_db("SELECT id FROM recipes WHERE name = ?", (meal_name,), one=True)
+        day = form_date()
+        volunteer = query_db("SELECT id FROM volunteers WHERE name = ?",
+                             (volunteer_name,), one=True)
+        if recipe is None or volunteer is None:
+            abort(400)
+        if not book_dropoff(day, "INSERT INTO meals (recipe_id, date, volunteer_id) VALUES (?, ?, ?)",
+                            (recipe["id"], day, volunteer["id"])):
+            return redirect(f"/volunteers/meal-signup?full={day}")
         return redirect("/volunteers/signups")
     else:
-        dates_const = query_db("SELECT month_year, volunteer_start, volunteer_end FROM deadlines ORDER BY id DESC LIMIT 1", one=True)
-        date = dict(dates_const)
-        date["volunteer_start"] = datetime.strptime(date["volunteer_start"], "%Y-%m-%d").date()
-        date["volunteer_end"] = datetime.strptime(date["volunteer_end"], "%Y-%m-%d").date()
+        cycle = cycles.latest()
         today = datetime.today().date()
         volunteers = query_db("SELECT name FROM volunteers")
         recipes = query_db("SELECT name FROM recipes ORDER BY name")
-        start = query_db("SELECT dropoff_start FROM deadlines ORDER BY id DESC LIMIT 1", one=True)["dropoff_start"]
-        end = query_db("SELECT dropoff_end FROM deadlines ORDER BY id DESC LIMIT 1", one=True)["dropoff_end"]
-        start_datetime = datetime.strptime(start, '%Y-%m-%d').date()
-        end_datetime = datetime.strptime(end, '%Y-%m-%d').date()
-        return render_template("meal_signup.html", volunteers=volunteers, recipes=recipes, start=start, end=end, today=today, 
-                               date=date, start_datetime=start_datetime, end_datetime=end_datetime)
+        return render_template("meal_signup.html", volunteers=volunteers, recipes=recipes, start=cycle.dropoff_start,
+                               end=cycle.dropoff_end, today=today, date=cycle, slots=dropoff_slots(cycle),
+                               full=request.args.get("full"))
 
 @app.route("/teachers/")
 def teachers():
-    today_1 = datetime.today().date()
-    month_year = today_1.strftime("%B %Y")
-    dates_const = query_db("SELECT month_year, teacher_start, teacher_end FROM deadlines WHERE month_year = ?", (month_year,), one=True)
-    dates = dict(dates_const)
-    if dates["teacher_start"]:
-        dates["teacher_start"] = datetime.strptime(dates["teacher_start"], "%Y-%m-%d").date()
-    dates["teacher_end"] = datetime.strptime(dates["teacher_end"], "%Y-%m-%d").date()
     today = datetime.today().date()
-    return render_template("teachers.html", dates=dates, today=today)
+    return render_template("teachers.html", dates=cycles.for_month(today), today=today)
 
 @app.route("/teachers/enter-code", methods=["GET", "POST"])
 def enter_teacher_code():
     if request.method == "POST":
         entered_code = request.form.get("code")
-        valid_code = query_db("SELECT id, code FROM teacher_codes ORDER BY id DESC LIMIT 1", one=True)
-        if entered_code != valid_code["code"]:
+        code_id, valid_code = codes.current("teacher")
+        if entered_code != valid_code:
             return render_template("invalid_teacher_code.html")
         else:
             session["teacher_verified"] = True
-            session["teacher_code_version"] = valid_code["id"]
+            session["teacher_code_version"] = code_id
         return redirect("/teachers")
     else:
         return render_template("teacher_code.html")
 
+#http status for each claim result when the client asks for json
+CLAIM_STATUS = {"claimed": 200, "already_claimed": 409, "not_found": 404, "busy": 503}
+
 @app.route("/teachers/reward-signup", methods=["GET", "POST"])
+@cached_page("meals", "gift_cards", "recipes", "teachers", "deadlines")
 def teachers_reward_signup():
     if request.method == "POST":
         name = request.form.get("name")
@@ -348,49 +603,123 @@ def teachers_reward_signup():
         reward_type = request.form.get("reward_type")
         if not (name and email and id and reward_type):
             return redirect("/teachers/reward-signup")
-        if reward_type not in ["meals", "gift_cards"]:
+        if reward_type not in REWARD_TABLES or not id.isdigit():
             return redirect("/teachers/reward-signup")
-        query_db("INSERT OR IGNORE INTO teachers (name, email) VALUES (?, ?)", (name, email))
-        query_db(f"UPDATE {reward_type} SET teacher_id = (SELECT id FROM teachers WHERE name = ? AND email = ?) WHERE id = ?",
-                 (name, email, id))
-        return redirect("/teachers/reward-signup")
+        result = claim_reward(lambda: get_pool().writer(), reward_type, int(id), name, email)
+        if result == CLAIMED:
+            pages.bump(reward_type, "teachers")
+        if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+            return jsonify(result=result), CLAIM_STATUS[result]
+        return redirect(f"/teachers/reward-signup?result={result}")
     else:
-        today_1 = datetime.today().date()
-        month_year = today_1.strftime("%B %Y")
-        dates_const = query_db("SELECT month_year, teacher_start, teacher_end FROM deadlines WHERE month_year = ?", (month_year,), one=True)
-        dates = dict(dates_const)
-        if dates["teacher_start"]:
-            dates["teacher_start"] = datetime.strptime(dates["teacher_start"], "%Y-%m-%d").date()
-        dates["teacher_end"] = datetime.strptime(dates["teacher_end"], "%Y-%m-%d").date()
         today = datetime.today().date()
-        beg_month = datetime.today().strftime("%Y-%m")
-        start_date = beg_month + "-01"
-        end_date = beg_month + f"-{str(monthrange(today.year, today.month)[1])}"
-        meals_const = query_db("""SELECT meals.id AS meal_id, recipes.name AS meal_name, date, teachers.name AS teacher_name, 
+        dates = cycles.for_month(today)
+        start_date, end_date = reward_month(today)
+        #read before the rewards, so the page's event stream replays anything that lands in between
+        event_id = query_db("SELECT COALESCE(MAX(id), 0) AS id FROM reward_events", one=True)["id"]
+        meals = query_db("""SELECT meals.id AS meal_id, recipes.name AS meal_name, date, teachers.name AS teacher_name, 
                                recipes.id AS recipe_id FROM meals JOIN recipes ON meals.recipe_id = recipes.id LEFT JOIN 
                                teachers ON meals.teacher_id = teachers.id WHERE date >= ? AND date <= ? ORDER BY meal_name""",
                                 (start_date, end_date))
-        meals = []
-        for row in meals_const:
-            meal = dict(row)
-            meal["date"] = datetime.strptime(meal["date"], "%Y-%m-%d").date()
-            meals.append(meal)
-        gcs_const = query_db("""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, date, teachers.name AS teacher_name
+        gcs = query_db("""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, date, teachers.name AS teacher_name
                              FROM gift_cards LEFT JOIN teachers ON gift_cards.teacher_id = teachers.id WHERE date >= ? AND date <= ?
                              AND NOT hidden ORDER BY gift_cards.name""", (start_date, end_date))
-        gcs = []
-        for row in gcs_const:
-            gc = dict(row)
-            gc["date"] = datetime.strptime(gc["date"], "%Y-%m-%d").date()
-            gcs.append(gc)
-        return render_template("teacher_rewards.html", meals=meals, gcs=gcs, dates=dates, today=today)
+        return render_template("teacher_rewards.html", meals=meals, gcs=gcs, dates=dates, today=today,
+                               result=request.args.get("result"), event_id=event_id)
+
+#first and last day of the month the teacher page shows
+def reward_month(today):
+    return today.replace(day=1).isoformat(), today.replace(day=monthrange(today.year, today.month)[1]).isoformat()
+
+#server-sent events for the reward page: one "claim", "unclaim", "hide" or "show" event
+#per change, starting after the id the page was rendered at (or Last-Event-ID when the
+#browser reconnects). the stream ends after EVENT_STREAM_SECONDS (five minutes by default)
+#and the browser reconnects. a sync worker is held by each open page for that whole time,
+#so run threaded or gevent workers when many teachers are on the page
+@app.route("/teachers/reward-signup/events")
+def reward_signup_events():
+    after = request.headers.get("Last-Event-ID", type=int)
+    if after is None:
+        after = request.args.get("after", type=int)
+    if after is None:
+        after = query_db("SELECT COALESCE(MAX(id), 0) AS id FROM reward_events", one=True)["id"]
+    #the stream outlives the request context, so it keeps this school's feed, and the school
+    #itself stays open (not evicted by the registry) until the response is closed
+    tenant = current_tenant()
+    feed = tenant.reward_events
+    def stream(after):
+        yield "retry: 3000\n\n"
+        deadline = time.monotonic() + EVENT_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            events = feed.wait(after, timeout=min(15, max(0, deadline - time.monotonic())))
+            if events is None:
+                #too far behind to replay, the page reloads instead
+                yield "event: reset\ndata: {}\n\n"
+                return
+            if not events:
+                yield ": keepalive\n\n"
+            for event in events:
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                after = event["id"]
+    tenants.acquire(tenant.config.name)
+    response = app.response_class(stream(after), mimetype="text/event-stream",
+                                  headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(lambda: tenants.release(tenant.config.name))
+    return response
+
+#who holds each reward this month, for pages polling instead of streaming. the ETag is
+#built from the shared table generations, so an unchanged poll is a 304 with no query
+@app.route("/teachers/reward-signup/state")
+def reward_signup_state():
+    today = datetime.today().date()
+    etag = "-".join(str(generations.get(table)) for table in ("meals", "gift_cards", "teachers")) + f"-{today}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    start_date, end_date = reward_month(today)
+    event_id = query_db("SELECT COALESCE(MAX(id), 0) AS id FROM reward_events", one=True)["id"]
+    meals = query_db("""SELECT meals.id, teachers.name AS teacher_name FROM meals LEFT JOIN teachers
+                        ON meals.teacher_id = teachers.id WHERE date >= ? AND date <= ? ORDER BY meals.id""",
+                     (start_date, end_date))
+    gcs = query_db("""SELECT gift_cards.id, teachers.name AS teacher_name FROM gift_cards LEFT JOIN teachers
+                      ON gift_cards.teacher_id = teachers.id WHERE date >= ? AND date <= ? AND NOT hidden
+                      ORDER BY gift_cards.id""", (start_date, end_date))
+    response = jsonify(event_id=event_id, meals=[{"id": row.id, "teacher_name": row.teacher_name} for row in meals],
+                       gift_cards=[{"id": row.id, "teacher_name": row.teacher_name} for row in gcs])
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+RECIPE_LIST = """SELECT recipes.id, recipes.name AS recipe_name, volunteers.name AS volunteer_name, image_url,
+               thumb_url FROM recipes JOIN volunteers ON recipes.creator_id = volunteers.id"""
+RECIPE_KEYS = [("recipes.name", "recipe_name"), ("recipes.id", "id")]
 
 @app.route("/recipes/")
+@cached_page("recipes", "volunteers")
 def recipes():
-    recipes = query_db("""SELECT recipes.id, recipes.name AS recipe_name, volunteers.name 
-                       AS volunteer_name, image_url FROM recipes JOIN volunteers 
-                       ON recipes.creator_id = volunteers.id ORDER BY recipe_name""")
-    return render_template("recipes.html", recipes=recipes)
+    recipes = paginate(query_db, RECIPE_LIST, RECIPE_KEYS, cursor=request.args.get("page"), per_page=RECIPES_PER_PAGE)
+    return render_template("recipes.html", recipes=recipes, per_page=RECIPES_PER_PAGE)
+
+#ranked, paginated recipe search. the last word matches as a prefix. an empty search
+#pages through every recipe by name. `next` in the response is passed back as `cursor`
+@app.route("/recipes/search")
+def recipe_search():
+    text = request.args.get("q", "").strip()
+    cursor = request.args.get("cursor")
+    per_page = min(max(request.args.get("per_page", RECIPES_PER_PAGE, type=int), 1), 100)
+    if text:
+        page = int(cursor) if cursor and cursor.isdigit() else 1
+        rows, has_more = search_recipes(query_db, text, max(page, 1), per_page)
+        next_cursor = str(page + 1) if has_more else None
+    else:
+        listing = paginate(query_db, RECIPE_LIST, RECIPE_KEYS, cursor=cursor, per_page=per_page)
+        rows, next_cursor = listing.rows, listing.next
+    results = [{"id": row.id, "name": row.recipe_name, "volunteer_name": row.volunteer_name,
+                "url": f"{request.script_root}/recipes/{row.id}",
+                "image": url_for("static", filename=row.thumb_url or row.image_url or "images/MoG_logo.PNG"),
+                "snippet": highlight(row.snippet) if text else ""} for row in rows]
+    return jsonify(query=text, per_page=per_page, next=next_cursor, results=results)
 
 @app.route("/recipes/upload", methods=["GET", "POST"])
 def upload_recipe():
@@ -403,43 +732,42 @@ def upload_recipe():
             return redirect("/recipes")
         creator_id = query_db("SELECT id FROM volunteers WHERE name = ?", (creator,), one=True)["id"]
         image = request.files.get("image")
+        saved = {"image_url": None, "thumb_url": None, "medium_url": None}
         if image and image.filename != "":
-            filename = secure_filename(image.filename)
-            filename = f"{int(time.time())}_{filename}"
-            save_path = os.path.join(BASE_DIR, "static", "images", "recipes", filename)
-            image.save(save_path)
-            image_url = f"images/recipes/{filename}"
-        else:
-            image_url = None
-        query_db("""INSERT INTO recipes (name, ingredients, instructions, creator_id, image_url)
-                 VALUES (?, ?, ?, ?, ?)""", (recipe_name, ingredients, instructions, creator_id, image_url))
+            try:
+                saved = save_recipe_image(image, STATIC_DIR, MAX_IMAGE_BYTES, IMAGE_FORMAT)
+            except ImageError as e:
+                volunteers = query_db("SELECT name AS creator_name FROM volunteers")
+                return render_template("upload_recipe.html", volunteers=volunteers, error=str(e)), 400
+        try:
+            query_db("""INSERT INTO recipes (name, ingredients, instructions, ingredient_lines, instruction_lines, creator_id,
+                     image_url, thumb_url, medium_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                     (recipe_name, ingredients, instructions, lines_json(ingredients), lines_json(instructions), creator_id,
+                     saved["image_url"], saved["thumb_url"], saved["medium_url"]))
+        except sqlite3.IntegrityError:
+            #recipe names are unique
+            remove_images(STATIC_DIR, *saved.values())
+            volunteers = query_db("SELECT name AS creator_name FROM volunteers")
+            return render_template("upload_recipe.html", volunteers=volunteers,
+                                   error=f"A recipe named {recipe_name} already exists."), 400
         return redirect("/recipes/")
     else:
         volunteers = query_db("SELECT name AS creator_name FROM volunteers")
         return render_template("upload_recipe.html", volunteers=volunteers)
 
 @app.route("/recipes/<int:id>")
+@cached_page("recipes", "volunteers")
 def recipe(id):
-    recipe = query_db("""SELECT recipes.name AS recipe_name, ingredients, instructions, 
-                      image_url, volunteers.name AS volunteer_name FROM recipes JOIN volunteers 
-                      ON recipes.creator_id = volunteers.id WHERE recipes.id = ?""", 
+    recipe = query_db("""SELECT recipes.name AS recipe_name, ingredients, instructions, ingredient_lines,
+                      instruction_lines, image_url, medium_url, volunteers.name AS volunteer_name FROM recipes
+                      JOIN volunteers ON recipes.creator_id = volunteers.id WHERE recipes.id = ?""",
                       (id,), one=True)
     if not recipe:
         return redirect("/recipes/")
-    def clean_text(text):
-        if not text:
-            return ""
-        cleaned_lines = []
-        for line in text.splitlines():
-            line = re.sub(r'^\s*(?:[\-\*\•]|\d+\.)\s*', '', line)
-            line = re.sub(r'[^\w\s.,()-]', '', line)
-            if line.strip():
-                cleaned_lines.append(line)
-        return "\n".join(cleaned_lines)
-    recipe_clean = dict(recipe)
-    recipe_clean["cleaned_ingredients"] = clean_text(recipe_clean["ingredients"])
-    recipe_clean["cleaned_instructions"] = clean_text(recipe_clean["instructions"])
-    return render_template("recipe.html", recipe=recipe_clean)
+    #lines were cleaned when the recipe was saved (see recipe_text.py)
+    return render_template("recipe.html", recipe=recipe,
+                           ingredients=stored_lines(recipe.ingredient_lines, recipe.ingredients),
+                           instructions=stored_lines(recipe.instruction_lines, recipe.instructions))
 
 @app.route("/admin/",)
 def admin():
@@ -453,6 +781,7 @@ def admin_login():
         if not pw:
             return redirect("/admin/login")
         hash = query_db("SELECT hash FROM passwords WHERE username = 'admin'", one=True)["hash"]
+        from werkzeug.security import check_password_hash
         if check_password_hash(hash, pw):
             session["logged_in"] = True
             return redirect("/admin")
@@ -466,12 +795,8 @@ def admin_volunteers():
     if request.method == "POST":
         return redirect("/admin/volunteers")
     else:
-        volunteers_const = query_db("SELECT * FROM volunteers ORDER BY name")
-        volunteers = []
-        for row in volunteers_const:
-            volunteer = dict(row)
-            volunteer["date_added"] = datetime.strptime(volunteer["date_added"], "%Y-%m-%d").date()
-            volunteers.append(volunteer)
+        volunteers = paginate(query_db, "SELECT * FROM volunteers", [("name", "name"), ("id", "id")],
+                              cursor=request.args.get("page"), per_page=PAGE_SIZE)
         return render_template("admin_volunteers.html", volunteers=volunteers)
     
 @app.route("/admin/volunteers/add", methods=["GET", "POST"])
@@ -483,7 +808,12 @@ def add_volunteer():
         if not (name and email and phone):
             return redirect("/admin/volunteers/")
         today = datetime.today().date()
-        query_db("INSERT INTO volunteers (name, email, phone, date_added) VALUES (?, ?, ?, ?)", (name, email, phone, today.isoformat()))
+        try:
+            query_db("INSERT INTO volunteers (name, email, phone, date_added) VALUES (?, ?, ?, ?)",
+                     (name, email, phone, today.isoformat()))
+        except sqlite3.IntegrityError:
+            #volunteer names are unique
+            return render_template("add_volunteer.html", error=f"A volunteer named {name} already exists."), 400
         return redirect("/admin/volunteers/")
     else:
         return render_template("add_volunteer.html")
@@ -514,9 +844,10 @@ def set_volunteer_code():
         if not new_code:
             return redirect("/admin")
         query_db("INSERT INTO volunteer_codes (code) VALUES (?)", (new_code,))
+        codes.refresh()
         return redirect("/admin")
     else:
-        current_code = query_db("SELECT code FROM volunteer_codes ORDER BY id DESC LIMIT 1", one=True)["code"]
+        current_code = codes.current("volunteer")[1]
         return render_template("set_volunteer_code.html", current_code=current_code)
 
 @app.route("/admin/set-teacher-code", methods=["GET", "POST"])
@@ -526,9 +857,10 @@ def set_teacher_code():
         if not new_code:
             return redirect("/admin")
         query_db("INSERT INTO teacher_codes (code) VALUES (?)", (new_code,))
+        codes.refresh()
         return redirect("/admin")
     else:
-        current_code = query_db("SELECT code FROM teacher_codes ORDER BY id DESC LIMIT 1", one=True)["code"]
+        current_code = codes.current("teacher")[1]
         return render_template("set_teacher_code.html", current_code=current_code)
 
 
@@ -536,30 +868,21 @@ def set_teacher_code():
 def push_teachers():
     date = datetime.today().strftime("%Y-%m-%d")
     query_db("UPDATE deadlines SET teacher_start = ? WHERE id = (SELECT MAX(id) FROM deadlines)", (date,))
+    cycles.invalidate()
     return redirect("/admin")
 
 @app.route("/admin/override-signups")
 def override_signup():
     beg_month = datetime.today().strftime("%Y-%m")
     beg_month = beg_month + "-01"
-    meals_const = query_db("""SELECT meals.id AS meal_id, recipes.name AS meal_name, date, volunteers.name 
+    meals = query_db("""SELECT meals.id AS meal_id, recipes.name AS meal_name, date, volunteers.name 
                         AS volunteer_name, recipes.id AS recipe_id, teachers.name AS teacher_name, teachers.email AS teacher_email
                         FROM meals JOIN volunteers ON meals.volunteer_id = volunteers.id JOIN recipes ON meals.recipe_id = recipes.id 
                         LEFT JOIN teachers ON meals.teacher_id = teachers.id WHERE date >= ? ORDER BY volunteer_name, date""", 
                         (beg_month,))
-    gcs_const = query_db("""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, date, volunteers.name AS volunteer_name, 
+    gcs = query_db("""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, date, volunteers.name AS volunteer_name, 
                         teachers.name AS teacher_name, teachers.email AS teacher_email, hidden FROM gift_cards JOIN volunteers 
                         ON gift_cards.volunteer_id = volunteers.id LEFT JOIN teachers ON gift_cards.teacher_id = teachers.id WHERE date >= ? ORDER BY volunteer_name, date""", (beg_month,))
-    meals = []
-    gcs = []
-    for row in meals_const:
-        meal = dict(row)
-        meal["date"] = datetime.strptime(meal["date"], "%Y-%m-%d").date()
-        meals.append(meal)
-    for row in gcs_const:
-        gc = dict(row)
-        gc["date"] = datetime.strptime(gc["date"], "%Y-%m-%d").date()
-        gcs.append(gc)
     return render_template("override_signups.html", meals=meals, gcs=gcs)
 
 @app.route("/admin/edit-meal-<int:mealid>", methods=["GET", "POST"])
@@ -581,18 +904,16 @@ def admin_edit_meal(mealid):
             query_db("UPDATE meals SET date = ?, recipe_id = ? WHERE id = ?", (date, recipe_id, id))
         return redirect("/admin/override-signups")
     else:
-        meal_const = query_db("""SELECT meals.id AS meal_id, meals.date AS date, 
+        meal = query_db("""SELECT meals.id AS meal_id, meals.date AS date, 
                             volunteers.name AS volunteer_name, recipes.name AS recipe_name,
                             recipes.id AS recipe_id, teachers.name AS teacher_name, teachers.email AS teacher_email 
                             FROM meals JOIN recipes ON meals.recipe_id = recipes.id JOIN volunteers ON meals.volunteer_id 
                             = volunteers.id LEFT JOIN teachers ON teachers.id = meals.teacher_id WHERE meals.id = ?""", 
                             (mealid,), one=True)
         
-        if not meal_const:
+        if not meal:
             return redirect("/admin/override-signups")
         else:
-            meal = dict(meal_const)
-            meal["date"] = datetime.strptime(meal["date"], "%Y-%m-%d").date()
             recipes = query_db("SELECT name, id FROM recipes ORDER BY name")
             return render_template("admin_edit_meal.html", meal=meal, recipes=recipes)
 
@@ -615,14 +936,12 @@ def admin_edit_gc(gcid):
             query_db("UPDATE gift_cards SET name = ?, date = ? WHERE id = ?", (gc_name, date, id))
         return redirect("/admin/override-signups")
     else:
-        gc_const = query_db("""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, gift_cards.date AS date, 
+        gc = query_db("""SELECT gift_cards.id AS gc_id, gift_cards.name AS gc_name, gift_cards.date AS date, 
                             volunteers.name AS volunteer_name, teachers.name AS teacher_name, teachers.email AS teacher_email
                             FROM gift_cards JOIN volunteers ON gift_cards.volunteer_id = volunteers.id LEFT JOIN teachers 
                             ON teachers.id = gift_cards.teacher_id WHERE gift_cards.id = ?""", (gcid,), one=True)
-        if not gc_const:
+        if not gc:
             return redirect("/admin/override-signups")
-        gc = dict(gc_const)
-        gc["date"] = datetime.strptime(gc["date"], "%Y-%m-%d").date()
         return render_template("admin_edit_gc.html", gc=gc)
     
 @app.route("/admin/add-meal", methods=["GET", "POST"])
@@ -657,10 +976,8 @@ def admin_add_gc():
 
 @app.route("/admin/recipes")
 def admin_recipes():
-    recipes = query_db("""SELECT recipes.id, recipes.name AS recipe_name, volunteers.name 
-                       AS volunteer_name, image_url FROM recipes JOIN volunteers 
-                       ON recipes.creator_id = volunteers.id ORDER BY recipe_name""")
-    return render_template("admin_recipes.html", recipes=recipes)
+    recipes = paginate(query_db, RECIPE_LIST, RECIPE_KEYS, cursor=request.args.get("page"), per_page=RECIPES_PER_PAGE)
+    return render_template("admin_recipes.html", recipes=recipes, per_page=RECIPES_PER_PAGE)
 
 @app.route("/admin/edit-recipe-<int:recipeid>", methods=["GET", "POST"])
 def admin_edit_recipe(recipeid):
@@ -670,32 +987,44 @@ def admin_edit_recipe(recipeid):
             recipe_name = request.form.get("recipe_name")
             ingredients = request.form.get("ingredients")
             instructions = request.form.get("instructions")
-            query_db("""UPDATE recipes SET name = ?, ingredients = ?, instructions = ? WHERE id = ?""",
-                    (recipe_name, ingredients, instructions, recipeid))
+            #the new image is checked and saved first, so a rejected one leaves the recipe as it was
             image = request.files.get("image")
+            saved = None
+            error = None
             if image and image.filename:
-                filename = secure_filename(image.filename)
-                filename = f"{int(time.time())}_{filename}"
-                save_path = os.path.join("static", "images", "recipes", filename)
-                image.save(save_path)
-                old_url = query_db("SELECT image_url FROM recipes WHERE id = ?", (recipeid,), one=True)["image_url"]
-                if old_url:
-                    old_path = os.path.join("static", old_url)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                image_url = f"images/recipes/{filename}"
-                query_db("UPDATE recipes SET image_url = ? WHERE id = ?", 
-                        (image_url, recipeid))
+                try:
+                    saved = save_recipe_image(image, STATIC_DIR, MAX_IMAGE_BYTES, IMAGE_FORMAT)
+                except ImageError as e:
+                    error = str(e)
+            if error is None:
+                old = query_db("SELECT image_url, thumb_url, medium_url FROM recipes WHERE id = ?", (recipeid,),
+                               one=True) or (None, None, None)
+                new = old if saved is None else (saved["image_url"], saved["thumb_url"], saved["medium_url"])
+                try:
+                    query_db("""UPDATE recipes SET name = ?, ingredients = ?, instructions = ?, ingredient_lines = ?,
+                             instruction_lines = ?, image_url = ?, thumb_url = ?, medium_url = ? WHERE id = ?""",
+                             (recipe_name, ingredients, instructions, lines_json(ingredients), lines_json(instructions),
+                              *new, recipeid))
+                except sqlite3.IntegrityError:
+                    #recipe names are unique
+                    error = f"A recipe named {recipe_name} already exists."
+                    if saved is not None:
+                        remove_images(STATIC_DIR, *saved.values())
+                else:
+                    if saved is not None:
+                        remove_images(STATIC_DIR, *old)
+            if error is not None:
+                recipe = query_db("""SELECT id, name, ingredients, instructions, image_url, thumb_url FROM recipes
+                                  WHERE recipes.id = ?""", (recipeid,), one=True)
+                return render_template("admin_edit_recipe.html", recipe=recipe, error=error), 400
         else:
-            old_url = query_db("SELECT image_url FROM recipes WHERE id = ?", (recipeid,), one=True)["image_url"]
-            if old_url:
-                old_path = os.path.join("static", old_url)
-                if os.path.exists(old_path):
-                    os.remove(old_path)
+            old = query_db("SELECT image_url, thumb_url, medium_url FROM recipes WHERE id = ?", (recipeid,), one=True)
             query_db("DELETE FROM recipes WHERE id = ?", (recipeid,))
+            if old:
+                remove_images(STATIC_DIR, *old)
         return redirect("/admin/recipes")
     else:
-        recipe = query_db("""SELECT id, name, ingredients, instructions, image_url FROM recipes
+        recipe = query_db("""SELECT id, name, ingredients, instructions, image_url, thumb_url FROM recipes
                           WHERE recipes.id = ?""", (recipeid,), one=True)
         if not recipe:
             return redirect("/admin/recipes")
@@ -703,18 +1032,8 @@ def admin_edit_recipe(recipeid):
     
 @app.route("/admin/deadlines/")
 def deadlines():
-    deadlines_const = query_db("SELECT * FROM deadlines ORDER BY id DESC")
-    deadlines = []
-    for row in deadlines_const:
-        deadline = dict(row)
-        deadline["volunteer_start"] = datetime.strptime(deadline["volunteer_start"], "%Y-%m-%d").date()
-        deadline["volunteer_end"] = datetime.strptime(deadline["volunteer_end"], "%Y-%m-%d").date()
-        deadline["dropoff_start"] = datetime.strptime(deadline["dropoff_start"], "%Y-%m-%d").date()
-        deadline["dropoff_end"] = datetime.strptime(deadline["dropoff_end"], "%Y-%m-%d").date()
-        if deadline["teacher_start"]:
-            deadline["teacher_start"] = datetime.strptime(deadline["teacher_start"], "%Y-%m-%d").date()
-        deadline["teacher_end"] = datetime.strptime(deadline["teacher_end"], "%Y-%m-%d").date()
-        deadlines.append(deadline)
+    deadlines = paginate(query_db, "SELECT * FROM deadlines", [("id", "id")], cursor=request.args.get("page"),
+                         per_page=PAGE_SIZE, descending=True)
     return render_template("admin_deadlines.html", deadlines=deadlines)
 
 @app.route("/admin/deadlines/set", methods=["GET", "POST"])
@@ -728,8 +1047,10 @@ def set_volunteer_dates():
         teacher_end_temp = datetime.strptime(range_start, "%Y-%m-%d").date()
         teacher_end = teacher_end_temp - timedelta(days=2)
         deadline = request.form.get("deadline")
-        query_db("""INSERT INTO deadlines (month_year, volunteer_end, dropoff_start, dropoff_end, teacher_end) 
-                 VALUES (?, ?, ?, ?, ?)""", (month_year, deadline, range_start, range_end, teacher_end))
+        max_per_day = request.form.get("max_per_day", type=int)
+        query_db("""INSERT INTO deadlines (month_year, volunteer_end, dropoff_start, dropoff_end, teacher_end, max_per_day) 
+                 VALUES (?, ?, ?, ?, ?, ?)""", (month_year, deadline, range_start, range_end, teacher_end, max_per_day))
+        cycles.invalidate()
         return redirect("/admin/deadlines/")
     else:
         today = datetime.today()
@@ -741,7 +1062,7 @@ def set_volunteer_dates():
         else:
             month += 1
         next_month = f"{year}-{month:02d}"
-        return render_template("set_volunteer_dates.html", next_month=next_month)
+        return render_template("set_volunteer_dates.html", next_month=next_month, default_max=DROPOFF_MAX_PER_DAY)
 
 @app.route("/admin/deadlines/edit-<int:id>", methods=["GET", "POST"])
 def edit_deadline(id):
@@ -749,6 +1070,7 @@ def edit_deadline(id):
         action = request.form.get("action")
         if action == "delete":
             query_db("DELETE FROM deadlines WHERE id = ?", (id,))
+            cycles.invalidate()
             return redirect("/admin/deadlines/")
         month = request.form.get("month")
         month_datetime = datetime.strptime(month + "-01", "%Y-%m-%d")
@@ -758,9 +1080,11 @@ def edit_deadline(id):
         deadline = request.form.get("deadline")
         teacher_start = request.form.get("teacher_start")
         teacher_end = request.form.get("teacher_end")
+        max_per_day = request.form.get("max_per_day", type=int)
         query_db("""UPDATE deadlines SET month_year = ?, volunteer_end = ?, dropoff_start = ?, 
-                 dropoff_end = ?, teacher_start = ?, teacher_end = ? WHERE id = ?""", 
-                 (month_year, deadline, range_start, range_end, teacher_start, teacher_end, id))
+                 dropoff_end = ?, teacher_start = ?, teacher_end = ?, max_per_day = ? WHERE id = ?""", 
+                 (month_year, deadline, range_start, range_end, teacher_start, teacher_end, max_per_day, id))
+        cycles.invalidate()
         return redirect("/admin/deadlines/")
     else:
         deadline_const = query_db("SELECT * FROM deadlines WHERE id = ?", (id,), one=True)
@@ -768,42 +1092,318 @@ def edit_deadline(id):
             return redirect("/admin/deadlines/")
         deadline = dict(deadline_const)
         deadline["month_year"] = datetime.strptime(deadline["month_year"], "%B %Y").strftime("%Y-%m")
-        return render_template("edit_deadline.html", deadline=deadline)
+        return render_template("edit_deadline.html", deadline=deadline, default_max=DROPOFF_MAX_PER_DAY)
     
+#columns the rankings tables can be sorted by, with the direction each one defaults to
+RANKING_SORTS = {
+    "volunteers": {"count": ("reward_count", "DESC"), "name": ("volunteers.name", "ASC")},
+    "recipes": {"count": ("count", "DESC"), "name": ("recipes.name", "ASC")},
+}
+
+def ranking_order(table):
+    column, direction = RANKING_SORTS[table].get(request.args.get("sort"), RANKING_SORTS[table]["count"])
+    if request.args.get("order") in ("asc", "desc"):
+        direction = request.args.get("order").upper()
+    return f"{column} {direction}"
+
+#load a csv or json file of volunteers, recipes, meals or gift cards in one transaction
+def run_import(kind, text, fmt, dry_run=False):
+    rows = parse_rows(text, fmt)
+    with get_pool().writer() as db:
+        result = import_rows(db, kind, rows, dry_run=dry_run)
+    if result.inserted:
+        pages.bump(kind, "teachers")
+    return result
+
+@app.route("/admin/import", methods=["GET", "POST"])
+def admin_import():
+    if request.method == "POST":
+        kind = request.form.get("kind")
+        upload = request.files.get("file")
+        text = upload.read().decode("utf-8-sig", errors="replace") if upload and upload.filename else request.form.get("data", "")
+        filename = upload.filename if upload and upload.filename else ""
+        fmt = "json" if filename.lower().endswith(".json") or (not filename and text.lstrip().startswith(("[", "{"))) else "csv"
+        dry_run = request.form.get("dry_run") == "1"
+        if kind not in IMPORT_KINDS or not text.strip():
+            return render_template("admin_import.html", kinds=IMPORT_KINDS, error="Pick what to import and a file."), 400
+        try:
+            result = run_import(kind, text, fmt, dry_run)
+        except ImportFileError as e:
+            return render_template("admin_import.html", kinds=IMPORT_KINDS, error=str(e)), 400
+        status = 400 if result.errors else 200
+        if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+            return jsonify(kind=result.kind, rows=result.rows, inserted=result.inserted, dry_run=dry_run,
+                           errors=[{"line": line, "error": error} for line, error in result.errors]), status
+        return render_template("admin_import.html", kinds=IMPORT_KINDS, result=result, dry_run=dry_run), status
+    else:
+        return render_template("admin_import.html", kinds=IMPORT_KINDS)
+
+#download meals, gift cards, volunteers or rankings for a season or date range. the rows
+#are streamed from a cursor as they are read, on the request's read connection
+@app.route("/admin/export")
+def admin_export():
+    kind = request.args.get("kind")
+    fmt = request.args.get("format", "csv")
+    if not kind:
+        return render_template("admin_export.html", kinds=EXPORTS, formats=FORMATS, season=current_season())
+    if kind not in EXPORTS or fmt not in FORMATS:
+        abort(404)
+    try:
+        start, end = export_range(request.args)
+    except ValueError:
+        abort(400)
+    if request.args.get("start") or request.args.get("end"):
+        label = f"{start}_{end}"
+    else:
+        label = request.args.get("season") or str(current_season())
+    since = live_since(get_db())
+    archive = since is not None and start < since
+    response = app.response_class(stream_with_context(stream_export(get_db(), kind, fmt, start, end, archive)),
+                                  mimetype=FORMATS[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="{kind}-{label}.{fmt}"'
+    return response
+
+#move finished school years out of meals and gift_cards. everything dated before this
+#season's august 1 goes to the archive in one transaction
+def run_rollover(dry_run=False):
+    with get_pool().writer() as db:
+        result = roll_over(db, season_range(current_season())[0], dry_run=dry_run)
+    if result.seasons and not dry_run:
+        pages.bump("meals", "gift_cards")
+    return result
+
+@app.route("/admin/season-rollover", methods=["GET", "POST"])
+def admin_rollover():
+    if request.method == "POST":
+        result = run_rollover()
+        return redirect(f"/admin/season-rollover?moved={result.meals + result.gift_cards}")
+    else:
+        db = get_db()
+        return render_template("admin_rollover.html", season=current_season(),
+                               pending=pending_seasons(db, season_range(current_season())[0]),
+                               archived=archived_seasons(db), moved=request.args.get("moved", type=int))
+
+#per-route latency, db time and query count histograms in the prometheus text format
+@app.route("/admin/metrics")
+def admin_metrics():
+    stats = pages.stats()
+    lines = [metrics.render()]
+    for name in ("hits", "misses", "evictions"):
+        lines.append(f"# TYPE mog_page_cache_{name}_total counter\nmog_page_cache_{name}_total {stats[name]}\n")
+    lines.append(f"# TYPE mog_page_cache_bytes gauge\nmog_page_cache_bytes {stats['bytes']}\n")
+    for name, cache in (("cycles", cycles), ("codes", codes), ("bookings", bookings)):
+        lines.append(f"# TYPE mog_{name}_cache_hits_total counter\nmog_{name}_cache_hits_total {cache.hits}\n")
+        lines.append(f"# TYPE mog_{name}_cache_misses_total counter\nmog_{name}_cache_misses_total {cache.misses}\n")
+    for name in ("syncs", "reloads"):
+        lines.append(f"# TYPE mog_generation_{name}_total counter\nmog_generation_{name}_total {getattr(generations, name)}\n")
+    open_tenants = tenants.stats()
+    lines.append(f"# TYPE mog_tenants_open gauge\nmog_tenants_open {len(open_tenants['open'])}\n")
+    for name in ("opens", "closes"):
+        lines.append(f"# TYPE mog_tenant_{name}_total counter\nmog_tenant_{name}_total {open_tenants[name]}\n")
+    return app.response_class("".join(lines), mimetype="text/plain; version=0.0.4")
+
+#hit/miss counts and memory use of the page cache
+@app.route("/admin/page-cache")
+def admin_page_cache():
+    return jsonify(pages.stats())
+
 @app.route("/admin/rankings")
 def admin_rankings():
-    volunteers_const = query_db("SELECT id, name FROM volunteers")
-    volunteers = []
-    for row in volunteers_const:
-        volunteer = dict(row)
-        gc_count = query_db("SELECT COUNT(volunteer_id) AS count FROM gift_cards WHERE volunteer_id = ?", 
-                            (volunteer["id"],), one=True)["count"]
-        meal_count = query_db("SELECT COUNT(volunteer_id) AS count FROM meals WHERE volunteer_id = ?", 
-                              (volunteer["id"],), one=True)["count"]
-        volunteer["reward_count"] = gc_count + meal_count
-        volunteers.append(volunteer)
-    recipes_const = query_db("""SELECT recipes.id AS id, recipes.name AS recipe_name, volunteers.name AS volunteer_name 
-                             FROM recipes JOIN volunteers ON recipes.creator_id = volunteers.id""")
-    recipes = []
-    for row in recipes_const:
-        recipe = dict(row)
-        recipe["count"] = query_db("SELECT COUNT(recipe_id) AS count FROM meals WHERE recipe_id = ?",
-                                   (recipe["id"],), one=True)["count"]
-        recipes.append(recipe)
-    return render_template("rankings.html", volunteers=volunteers, recipes=recipes)
+    limit = request.args.get("limit", type=int)
+    if not limit or limit < 1:
+        limit = -1
+    #the live tables only hold this season; all time adds what rollovers archived
+    scope = "all" if request.args.get("scope") == "all" else "season"
+    archived = " + volunteer_rankings.archived_count" if scope == "all" else ""
+    volunteers = query_db(f"""SELECT volunteers.id, volunteers.name, reward_count{archived} AS reward_count
+                          FROM volunteer_rankings JOIN volunteers ON volunteers.id = volunteer_rankings.volunteer_id
+                          ORDER BY {ranking_order("volunteers")}, volunteers.name LIMIT ?""", (limit,))
+    archived = " + recipe_rankings.archived_count" if scope == "all" else ""
+    recipes = query_db(f"""SELECT recipes.id AS id, recipes.name AS recipe_name, volunteers.name AS volunteer_name,
+                       use_count{archived} AS count FROM recipe_rankings JOIN recipes ON recipes.id = recipe_rankings.recipe_id
+                       JOIN volunteers ON recipes.creator_id = volunteers.id
+                       ORDER BY {ranking_order("recipes")}, recipes.name LIMIT ?""", (limit,))
+    return render_template("rankings.html", volunteers=volunteers, recipes=recipes, scope=scope,
+                           sort=request.args.get("sort", "count"), limit=limit if limit > 0 else None)
+
+#queue this month's reminder digests: one per teacher, only for meals they haven't been
+#told about. returns the batch and the digests queued (or that would be, with dry_run)
+def run_reminders(dry_run=False):
+    cycle = cycles.for_month(datetime.today().date())
+    batch = datetime.now().isoformat(timespec="seconds")
+    config = current_tenant().config
+    with get_pool().writer() as db:
+        digests = send_reminders(db, mailer, config.email, config.coordinator, f"Meals of Gratitude {datetime.today().strftime('%B %Y')}",
+                                 cycle.dropoff_start.isoformat(), cycle.dropoff_end.isoformat(), batch, dry_run)
+    return batch, digests
 
 @app.route("/admin/send-emails")
 def admin_send_emails():
-    today = datetime.today().date()
-    month_year = today.strftime("%B %Y")
-    deadlines = query_db("SELECT dropoff_start, dropoff_end FROM deadlines WHERE month_year = ?", (month_year,), one=True)
-    meals = query_db("""SELECT date AS dropoff_date, recipes.name AS meal_name, volunteers.name AS volunteer_name, 
-                     volunteers.email AS volunteer_email, teachers.name AS teacher_name, teachers.email 
-                     AS teacher_email FROM meals JOIN recipes ON recipes.id = meals.recipe_id 
-                     JOIN volunteers ON volunteers.id = meals.volunteer_id JOIN teachers ON 
-                     teachers.id = meals.teacher_id WHERE date >= ? AND date <= ?""", (deadlines["dropoff_start"], deadlines["dropoff_end"]))
-    for meal in meals:
-        send_email(teacher_email=meal["teacher_email"], volunteer_email=meal["volunteer_email"], 
-               teacher_name=meal["teacher_name"], volunteer_name=meal["volunteer_name"], meal_name=meal["meal_name"], 
-               dropoff_date=meal["dropoff_date"])
-    return redirect("/admin")
\ No newline at end of file
+    dry_run = request.args.get("dry_run") == "1"
+    batch, digests = run_reminders(dry_run)
+    if dry_run:
+        return render_template("admin_email_preview.html", digests=digests)
+    if not digests:
+        return redirect("/admin/emails")
+    mailer.start()
+    return redirect(f"/admin/emails?batch={batch}")
+
+@app.route("/admin/emails")
+def admin_emails():
+    batch = request.args.get("batch")
+    if not batch:
+        latest = query_db("SELECT batch FROM outbox ORDER BY id DESC LIMIT 1", one=True)
+        batch = latest["batch"] if latest else None
+    counts = {row["status"]: row["count"] for row in
+              query_db("SELECT status, COUNT(*) AS count FROM outbox WHERE batch = ? GROUP BY status", (batch,))}
+    messages = query_db("""SELECT id, to_addr, cc_addr, status, attempts, last_error, sent_at FROM outbox
+                        WHERE batch = ? ORDER BY id""", (batch,))
+    batches = query_db("SELECT DISTINCT batch FROM outbox ORDER BY batch DESC LIMIT 12")
+    return render_template("admin_emails.html", batch=batch, batches=batches, counts=counts, messages=messages,
+                           pending=counts.get("queued", 0) + counts.get("sending", 0))
+
+@app.route("/admin/emails/retry", methods=["POST"])
+def retry_emails():
+    batch = request.form.get("batch")
+    query_db("""UPDATE outbox SET status = 'queued', attempts = 0, next_attempt_at = 0
+             WHERE batch = ? AND status = 'failed'""", (batch,))
+    mailer.start()
+    return redirect(f"/admin/emails?batch={batch}")
+
+@app.cli.command("migrate")
+@click.option("--target", type=int, default=None, help="Stop after this schema version.")
+@click.option("--all", "every", is_flag=True, help="Migrate every school in TENANTS.")
+def migrate_command(target, every):
+    for name in (tenants.configs if every else [None]):
+        tenant = tenants.acquire(name) if name else current_tenant()
+        try:
+            with tenant.pool.writer() as db:
+                applied = migrate(db, target=target)
+                version = current_version(db)
+        finally:
+            if name:
+                tenants.release(name)
+        where = f"{name}: " if name else ""
+        for number, migration in applied:
+            click.echo(f"{where}applied {number}: {migration}")
+        click.echo(f"{where}database at version {version} (latest {MIGRATIONS[-1][0]})")
+
+@app.cli.command("tenants")
+def tenants_command():
+    for config in tenants.configs.values():
+        where = ", ".join(filter(None, [config.host, config.prefix])) or "every other address"
+        click.echo(f"{config.name}: {where} -> {config.database}")
+
+@app.cli.command("rebuild-rankings")
+def rebuild_rankings_command():
+    with get_pool().writer() as db:
+        db.execute("BEGIN IMMEDIATE")
+        rebuild_rankings(db)
+        db.commit()
+    click.echo("rankings rebuilt")
+
+@app.cli.command("season-rollover")
+@click.option("--dry-run", is_flag=True, help="Show what would be archived without moving it.")
+def season_rollover_command(dry_run):
+    result = run_rollover(dry_run=dry_run)
+    if not result.seasons:
+        click.echo("nothing to archive")
+        return
+    seasons = ", ".join(f"{season}-{season + 1}" for season in result.seasons)
+    verb = "would archive" if dry_run else "archived"
+    click.echo(f"{verb} {result.meals} meals and {result.gift_cards} gift cards from {seasons}")
+
+@app.cli.command("send-reminders")
+@click.option("--dry-run", is_flag=True, help="List the digests without queueing them.")
+def send_reminders_command(dry_run):
+    batch, digests = run_reminders(dry_run)
+    for digest in digests:
+        click.echo(f"{digest.to} ({digest.role}): {len(digest.meals)} meal{'s' if len(digest.meals) != 1 else ''}")
+    verb = "would queue" if dry_run else "queued"
+    click.echo(f"{verb} {len(digests)} digests for {sum(len(digest.meals) for digest in digests)} meals")
+    if digests and not dry_run:
+        click.echo(f"batch {batch}; `flask --app app send-outbox` sends it now")
+
+@app.cli.command("send-outbox")
+def send_outbox_command():
+    mailer.work()
+    with get_pool().writer() as db:
+        counts = db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+    for status, count in counts:
+        click.echo(f"{status}: {count}")
+
+@app.cli.command("backfill-images")
+def backfill_images_command():
+    with get_pool().writer() as db:
+        recipes = db.execute("""SELECT id, image_url FROM recipes WHERE image_url IS NOT NULL
+                             AND (thumb_url IS NULL OR medium_url IS NULL)""").fetchall()
+    for recipe in recipes:
+        try:
+            urls = make_variants(STATIC_DIR, recipe["image_url"], IMAGE_FORMAT)
+        except OSError as e:
+            click.echo(f"recipe {recipe['id']}: skipped {recipe['image_url']} ({e})")
+            continue
+        with get_pool().writer() as db:
+            db.execute("UPDATE recipes SET thumb_url = ?, medium_url = ? WHERE id = ?",
+                       (urls["thumb"], urls["medium"], recipe["id"]))
+            db.commit()
+        click.echo(f"recipe {recipe['id']}: {urls['thumb']}, {urls['medium']}")
+
+@app.cli.command("import")
+@click.argument("kind", type=click.Choice(list(IMPORT_KINDS)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "json"]), default=None,
+              help="File format (default: from the extension).")
+@click.option("--dry-run", is_flag=True, help="Check the file without importing it.")
+def import_command(kind, path, fmt, dry_run):
+    with open(path, encoding="utf-8-sig") as f:
+        text = f.read()
+    fmt = fmt or ("json" if path.lower().endswith(".json") else "csv")
+    started = time.perf_counter()
+    try:
+        result = run_import(kind, text, fmt, dry_run)
+    except ImportFileError as e:
+        raise click.ClickException(str(e))
+    for line, error in result.errors:
+        click.echo(f"line {line}: {error}", err=True)
+    if result.errors:
+        raise click.ClickException(f"{len(result.errors)} of {result.rows} rows have errors, nothing was imported")
+    verb = "would import" if dry_run else "imported"
+    click.echo(f"{verb} {result.rows} {kind} in {time.perf_counter() - started:.2f}s")
+
+@app.cli.command("vendor-assets")
+def vendor_assets_command():
+    assets.download_vendor(echo=click.echo)
+
+#compile every template into TEMPLATE_CACHE_DIR (and this process's template cache).
+#returns how many were compiled
+def compile_templates():
+    names = app.jinja_env.list_templates(extensions=["html"])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+@app.cli.command("precompile-templates")
+def precompile_templates_command():
+    started = time.perf_counter()
+    count = compile_templates()
+    where = TEMPLATE_CACHE_DIR or "memory only, TEMPLATE_CACHE_DIR is off"
+    click.echo(f"compiled {count} templates in {time.perf_counter() - started:.2f}s ({where})")
+
+#load templates, this month's deadlines and the access codes before the first request,
+#so the worker's first visitors don't pay for them. with several schools only the
+#templates are loaded, unless TENANT names one
+def warm_caches():
+    compile_templates()
+    if tenants.default_name is None:
+        return
+    generations.sync()
+    with app.app_context():
+        today = datetime.today().date()
+        cycles.latest()
+        cycles.for_month(today)
+        codes.current("volunteer")
+        codes.current("teacher")
+
+if WARM_CACHES:
+    warm_caches()
@@ -0,0 +1,88 @@
+import base64
+import hashlib
+import os
+import threading
+import urllib.request
+
+#content fingerprints for files under static/. urls carry ?v=<hash>, so a changed file
+#gets a new url and every fingerprinted url can be cached by browsers forever.
+
+#third party files the layout uses, each at a fixed version. `flask vendor-assets` downloads
+#them into static/vendor so they are served (and fingerprinted) locally; until then the
+#layout links the cdn. an entry without an integrity hash is never written: the command
+#stops and prints the hash to pin here once the file has been checked by hand
+VENDOR_ASSETS = {
+    "bootstrap.css": ("https://cdn.jsdelivr.net/npm/bootstrap@5.3.7/dist/css/bootstrap.min.css",
+                      "sha384-LN+7fdVzj6u52u30Kp6M/trliBMCMKTyK833zpbD+pXdCLuTusPj697FH4R/5mcr"),
+    "jquery.js": ("https://code.jquery.com/jquery-3.6.0.min.js", "sha256-/xUj+3OJU5yExlq6GSYGSHk7tPXikynS7ogEvDej/m4="),
+    "typeahead.js": ("https://cdn.jsdelivr.net/npm/typeahead.js@0.11.1/dist/typeahead.bundle.min.js", None),
+    "bootstrap.js": ("https://cdn.jsdelivr.net/npm/bootstrap@5.3.7/dist/js/bootstrap.bundle.min.js",
+                     "sha384-ndDqU0Gzau9qJ1lfW4pNLlhNTkCfHzAVBReH9diLvGRem5+R9g2FzA8ZGN954O5Q"),
+}
+
+VENDOR_DIR = "vendor"
+
+class Assets:
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self._lock = threading.Lock()
+        self._hashes = {}
+
+    def _path(self, filename):
+        path = os.path.normpath(os.path.join(self.static_dir, filename))
+        if not path.startswith(os.path.join(self.static_dir, "")):
+            return None
+        return path
+
+    #short sha256 of the file's contents, or None if it doesn't exist. re-hashed only
+    #when the file's mtime or size changes
+    def version(self, filename):
+        path = self._path(filename)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                digest.update(chunk)
+        version = digest.hexdigest()[:12]
+        with self._lock:
+            self._hashes[path] = (key, version)
+        return version
+
+    #(filename under static/, or cdn url, integrity) for a VENDOR_ASSETS entry
+    def vendor(self, name):
+        url, integrity = VENDOR_ASSETS[name]
+        local = f"{VENDOR_DIR}/{name}"
+        if self.version(local):
+            return local, None, integrity
+        return None, url, integrity
+
+    #download every vendor asset and check it against its integrity hash. nothing is
+    #written unless every file matches, so static/vendor is never left half updated
+    def download_vendor(self, echo=print):
+        bodies = {}
+        for name, (url, integrity) in VENDOR_ASSETS.items():
+            with urllib.request.urlopen(url, timeout=30) as response:
+                body = response.read()
+            if not integrity:
+                digest = base64.b64encode(hashlib.sha384(body).digest()).decode()
+                raise ValueError(f"{url} has no integrity hash; check the file and pin it as sha384-{digest}")
+            algorithm, expected = integrity.split("-", 1)
+            actual = base64.b64encode(hashlib.new(algorithm, body).digest()).decode()
+            if actual != expected:
+                raise ValueError(f"{url} does not match its integrity hash")
+            bodies[name] = (url, body)
+        directory = os.path.join(self.static_dir, VENDOR_DIR)
+        os.makedirs(directory, exist_ok=True)
+        for name, (url, body) in bodies.items():
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(body)
+            echo(f"{name}: {len(body)} bytes from {url}")
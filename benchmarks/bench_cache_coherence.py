@@ -0,0 +1,129 @@
+#in-memory caches under several worker processes sharing one database.
+#first a coherence check: one process renames a recipe or changes the volunteer access
+#code through the admin pages, and another process, which has the old page and code
+#cached, must see the change on its very next request. then a hit-rate run: every
+#process browses the cached pages while a small share of its requests are signups, and
+#the page, deadline and access code cache hit rates are reported with the share of
+#requests that had to re-read the generations table.
+#run from the repo root: python benchmarks/bench_cache_coherence.py [processes] [requests] [write_every]
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+READS = ["/volunteers/", "/volunteers/signups/", "/teachers/reward-signup", "/recipes/", "/recipes/1",
+         "/recipes/2", "/teachers/"]
+
+def client_for(path):
+    os.environ["DATABASE"] = path
+    os.environ.setdefault("SECRET_KEY", "bench")
+    os.environ["MAIL_WORKERS"] = "0"
+    os.environ["TEMPLATE_CACHE_DIR"] = ""
+    import app as appmod
+    client = appmod.app.test_client()
+    appmod.generations.sync()
+    with client.session_transaction() as s:
+        s["logged_in"] = True
+        s["volunteer_verified"] = True
+        s["volunteer_code_version"] = appmod.codes.version("volunteer")
+        s["teacher_verified"] = True
+        s["teacher_code_version"] = appmod.codes.version("teacher")
+    return appmod, client
+
+#renames recipe 1 and, every tenth round, sets a new volunteer code
+def writer(path, rounds, to_reader, from_reader):
+    appmod, client = client_for(path)
+    for i in range(rounds):
+        from_reader.recv()
+        if i % 10 == 9:
+            client.post("/admin/set-volunteer-code", data={"code": f"code {i}"})
+            to_reader.send(("code", i))
+        else:
+            client.post("/admin/edit-recipe-1", data={"action": "edit", "recipe_name": f"Renamed {i}",
+                                                      "ingredients": "- rice", "instructions": "1. cook"})
+            to_reader.send(("recipe", i))
+    from_reader.recv()
+
+def reader(path, rounds, to_writer, from_writer, results):
+    appmod, client = client_for(path)
+    stale = 0
+    for _ in range(rounds):
+        #load the pages into this process's caches before the other process writes
+        client.get("/recipes/1")
+        client.get("/volunteers/")
+        to_writer.send("go")
+        kind, i = from_writer.recv()
+        if kind == "recipe":
+            stale += f"Renamed {i}".encode() not in client.get("/recipes/1").data
+        else:
+            #the session still holds the old code's version, so the gate must send us back
+            stale += client.get("/volunteers/").status_code != 302
+            with client.session_transaction() as s:
+                s["volunteer_code_version"] = appmod.codes.version("volunteer")
+    to_writer.send("done")
+    results.put(stale)
+
+def browse(path, requests, write_every, results):
+    appmod, client = client_for(path)
+    from benchmarks.suite.routes import context
+    ctx = context(path)
+    meal = {"name": ctx["volunteer_name"], "meal": ctx["recipe_name"], "date": ctx["dropoff"]}
+    started = time.perf_counter()
+    for i in range(requests):
+        if write_every and i % write_every == write_every - 1:
+            client.post("/volunteers/meal-signup", data=meal)
+        else:
+            client.get(READS[i % len(READS)])
+    elapsed = time.perf_counter() - started
+    results.put({"elapsed": elapsed, "pages": appmod.pages.stats(),
+                 "cycles": (appmod.cycles.hits, appmod.cycles.misses),
+                 "codes": (appmod.codes.hits, appmod.codes.misses),
+                 "generations": (appmod.generations.syncs, appmod.generations.reloads)})
+
+def rate(hits, misses):
+    return f"{hits / (hits + misses):6.1%}" if hits + misses else "   n/a"
+
+def main():
+    from benchmarks.suite import synth
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    write_every = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    path = os.path.join(tempfile.mkdtemp(), "meals.db")
+    synth.build(path, seasons=1)
+
+    rounds = 40
+    a, b = multiprocessing.Pipe()
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=writer, args=(path, rounds, a, a)),
+             multiprocessing.Process(target=reader, args=(path, rounds, b, b, results))]
+    for proc in procs:
+        proc.start()
+    stale = results.get()
+    for proc in procs:
+        proc.join()
+    print(f"coherence: {rounds} writes in one process, {stale} stale responses in the other")
+
+    procs = [multiprocessing.Process(target=browse, args=(path, requests, write_every, results))
+             for _ in range(processes)]
+    for proc in procs:
+        proc.start()
+    runs = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    total = lambda key, index: sum(run[key][index] for run in runs)
+    pages = sum(run["pages"]["hits"] for run in runs), sum(run["pages"]["misses"] for run in runs)
+    syncs, reloads = total("generations", 0), total("generations", 1)
+    print(f"{processes} processes x {requests} requests, a signup every {write_every}: "
+          f"{processes * requests / max(run['elapsed'] for run in runs):.0f} req/s")
+    print(f"  page cache hit rate   {rate(*pages)}")
+    print(f"  deadline cache        {rate(total('cycles', 0), total('cycles', 1))}")
+    print(f"  access code cache     {rate(total('codes', 0), total('codes', 1))}")
+    print(f"  generations re-read on {reloads / syncs:.1%} of {syncs} requests")
+    sys.exit(1 if stale else 0)
+
+if __name__ == "__main__":
+    main()
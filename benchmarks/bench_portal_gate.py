@@ -0,0 +1,59 @@
+#requests per second on the portal pages with the cached code registry versus the
+#old per-request "SELECT id FROM ..._codes ORDER BY id DESC LIMIT 1" gate.
+#run from the repo root: python benchmarks/bench_portal_gate.py [requests]
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def build_db(path):
+    from migrations import migrate
+    db = sqlite3.connect(path)
+    migrate(db)
+    today = date.today()
+    db.execute("INSERT INTO volunteer_codes (code) VALUES ('v')")
+    db.execute("INSERT INTO teacher_codes (code) VALUES ('t')")
+    db.execute("""INSERT INTO deadlines (month_year, volunteer_start, volunteer_end, dropoff_start, dropoff_end,
+                  teacher_start, teacher_end) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+               (today.strftime("%B %Y"), today.isoformat(), today.isoformat(), today.isoformat(),
+                today.isoformat(), today.isoformat(), (today + timedelta(days=1)).isoformat()))
+    db.commit()
+    db.close()
+
+def run(client, paths, n):
+    start = time.perf_counter()
+    for i in range(n):
+        client.get(paths[i % len(paths)])
+    return n / (time.perf_counter() - start)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    path = os.path.join(tempfile.mkdtemp(), "meals.db")
+    build_db(path)
+    os.environ["DATABASE"] = path
+    os.environ.setdefault("SECRET_KEY", "bench")
+    import app as mog
+    client = mog.app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(volunteer_verified=True, volunteer_code_version=1, teacher_verified=True, teacher_code_version=1)
+    paths = ["/volunteers/", "/teachers/"]
+    run(client, paths, 100)
+    cached = run(client, paths, n)
+
+    registry_version = mog.codes.version
+    def uncached(kind):
+        return mog.query_db(f"SELECT id FROM {kind}_codes ORDER BY id DESC LIMIT 1", one=True)["id"]
+    mog.codes.version = uncached
+    try:
+        queried = run(client, paths, n)
+    finally:
+        mog.codes.version = registry_version
+    print(f"per-request query: {queried:8.1f} req/s")
+    print(f"code registry:     {cached:8.1f} req/s ({(cached / queried - 1) * 100:+.1f}%)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#decoding a season of signup rows: the old sqlite3.Row -> dict -> strptime loop against
+#db.fetch_records. run from the repo root: python benchmarks/bench_records.py [rows]
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import fetch_records
+from migrations import migrate
+
+QUERY = """SELECT meals.id AS meal_id, recipes.name AS meal_name, date, volunteers.name AS volunteer_name,
+           recipes.id AS recipe_id, teachers.name AS teacher_name FROM meals
+           JOIN volunteers ON meals.volunteer_id = volunteers.id JOIN recipes ON meals.recipe_id = recipes.id
+           LEFT JOIN teachers ON meals.teacher_id = teachers.id WHERE date >= ? ORDER BY date, volunteer_name"""
+
+def build_db(rows):
+    db = sqlite3.connect(":memory:")
+    migrate(db)
+    db.executemany("INSERT INTO volunteers (name, date_added) VALUES (?, '2024-08-01')",
+                   [(f"Volunteer {i}",) for i in range(200)])
+    db.executemany("INSERT INTO recipes (name, creator_id) VALUES (?, ?)", [(f"Recipe {i}", i % 200 + 1) for i in range(500)])
+    db.executemany("INSERT INTO teachers (name, email) VALUES (?, ?)", [(f"Teacher {i}", f"t{i}@school.org") for i in range(150)])
+    start = date(2024, 8, 1)
+    db.executemany("INSERT INTO meals (recipe_id, date, volunteer_id, teacher_id) VALUES (?, ?, ?, ?)",
+                   [(i % 500 + 1, (start + timedelta(days=i % 300)).isoformat(), i % 200 + 1, i % 150 + 1 if i % 3 else None)
+                    for i in range(rows)])
+    db.commit()
+    return db
+
+def old_way(db):
+    db.row_factory = sqlite3.Row
+    meals = []
+    for row in db.execute(QUERY, ("2024-08-01",)).fetchall():
+        meal = dict(row)
+        meal["date"] = datetime.strptime(meal["date"], "%Y-%m-%d").date()
+        meals.append(meal)
+    return meals
+
+def new_way(db):
+    db.row_factory = None
+    cur = db.cursor()
+    cur.execute(QUERY, ("2024-08-01",))
+    return fetch_records(cur)
+
+def measure(fn, db, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(db)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn(db)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(result) > 0
+    return best, peak
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    db = build_db(rows)
+    old_time, old_peak = measure(old_way, db)
+    new_time, new_peak = measure(new_way, db)
+    print(f"{rows} rows")
+    print(f"dict + strptime: {old_time * 1000:8.1f} ms  peak {old_peak / 1e6:6.1f} MB")
+    print(f"fetch_records:   {new_time * 1000:8.1f} ms  peak {new_peak / 1e6:6.1f} MB")
+    print(f"speedup {old_time / new_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
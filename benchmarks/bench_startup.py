@@ -0,0 +1,74 @@
+#worker boot: time from `import app` to the first response on each main page, the way the
+#first visitors after a deploy or worker recycle see it. each run is a fresh python process.
+#compares compiling templates on first hit, loading them from a precompiled bytecode cache,
+#and also warming the caches at import (WARM_CACHES=1).
+#run from the repo root: python benchmarks/bench_startup.py [runs]
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGES = ["/volunteers/", "/volunteers/signups/", "/teachers/reward-signup", "/recipes/", "/admin/rankings"]
+
+#runs in the child process: import the app, then request every page once
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app as appmod
+imported = time.perf_counter()
+client = appmod.app.test_client()
+with client.session_transaction() as s:
+    s["logged_in"] = True
+    s["volunteer_verified"] = True
+    s["volunteer_code_version"] = 1
+    s["teacher_verified"] = True
+    s["teacher_code_version"] = 1
+firsts = []
+for page in json.loads(sys.argv[2]):
+    began = time.perf_counter()
+    assert client.get(page).status_code == 200, page
+    firsts.append(time.perf_counter() - began)
+print(json.dumps({"import": imported - started, "first": firsts[0], "pages": sum(firsts),
+                  "total": time.perf_counter() - started}))
+"""
+
+def run(db_path, cache_dir, warm):
+    env = dict(os.environ, DATABASE=db_path, SECRET_KEY="bench", MAIL_WORKERS="0", PAGE_CACHE_MB="0",
+               TEMPLATE_CACHE_DIR=cache_dir, WARM_CACHES="1" if warm else "0")
+    out = subprocess.run([sys.executable, "-c", CHILD, ROOT, json.dumps(PAGES)], env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    from benchmarks.suite import synth
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "meals.db")
+    synth.build(db_path, seasons=1)
+    cache_dir = os.path.join(workdir, "templates")
+    modes = [
+        ("compile on first hit", lambda: "", False),
+        ("precompiled bytecode", lambda: cache_dir, False),
+        ("precompiled + WARM_CACHES", lambda: cache_dir, True),
+    ]
+    #fill the bytecode cache once, like `flask precompile-templates` at deploy
+    run(db_path, cache_dir, True)
+    print(f"{runs} fresh processes per mode, {len(PAGES)} pages each (ms, median)")
+    print(f"{'mode':28} {'import':>8} {'1st resp':>9} {'all pages':>10} {'total':>8}")
+    try:
+        for name, directory, warm in modes:
+            results = [run(db_path, directory(), warm) for _ in range(runs)]
+            med = {key: statistics.median(r[key] for r in results) * 1000 for key in results[0]}
+            print(f"{name:28} {med['import']:8.1f} {med['first']:9.1f} {med['pages']:10.1f} {med['total']:8.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#burst of teachers claiming rewards at once, like the minutes after "push to teachers".
+#every claimer POSTs /teachers/reward-signup at the same moment from several worker
+#processes; a few claimers race for each meal. checks that every meal ends up with exactly
+#one teacher, that the teacher is the one who was told "claimed", and reports latency.
+#run from the repo root: python benchmarks/stress_teacher_claims.py [claimers] [processes] [meals]
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def build_db(path, meals):
+    from migrations import migrate
+    db = sqlite3.connect(path)
+    migrate(db)
+    today = date.today()
+    db.execute("INSERT INTO teacher_codes (code) VALUES ('t')")
+    db.execute("INSERT INTO volunteers (name, email, phone, date_added) VALUES ('Volunteer', 'v@example.org', '555', ?)",
+               (today.isoformat(),))
+    db.execute("INSERT INTO recipes (name, ingredients, instructions, creator_id) VALUES ('Lasagna', 'pasta', 'bake', 1)")
+    db.execute("""INSERT INTO deadlines (month_year, volunteer_start, volunteer_end, dropoff_start, dropoff_end,
+                  teacher_start, teacher_end) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+               (today.strftime("%B %Y"), today.isoformat(), today.isoformat(), today.isoformat(),
+                today.isoformat(), today.isoformat(), (today + timedelta(days=1)).isoformat()))
+    db.executemany("INSERT INTO meals (recipe_id, date, volunteer_id) VALUES (1, ?, 1)", [(today.isoformat(),)] * meals)
+    db.commit()
+    db.close()
+
+#one worker process: `claimers` threads that all fire at `start_at`
+def worker(path, offset, claimers, meals, start_at, results):
+    os.environ["DATABASE"] = path
+    os.environ.setdefault("SECRET_KEY", "stress")
+    os.environ["MAIL_WORKERS"] = "0"
+    import app as appmod
+    out = []
+    def claim(n):
+        client = appmod.app.test_client()
+        with client.session_transaction() as s:
+            s["teacher_verified"] = True
+            s["teacher_code_version"] = 1
+        meal_id = n % meals + 1
+        time.sleep(max(0, start_at - time.time()))
+        began = time.perf_counter()
+        response = client.post("/teachers/reward-signup", headers={"Accept": "application/json"},
+                               data={"name": f"Teacher {n}", "email": f"t{n}@example.org", "id": meal_id,
+                                     "reward_type": "meals"})
+        out.append((n, meal_id, response.get_json()["result"], time.perf_counter() - began))
+    threads = [threading.Thread(target=claim, args=(offset + i,)) for i in range(claimers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(out)
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def main():
+    claimers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    meals = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    path = os.path.join(tempfile.mkdtemp(), "meals.db")
+    build_db(path, meals)
+    results = multiprocessing.Queue()
+    start_at = time.time() + 3
+    per_process = [claimers // processes + (1 if i < claimers % processes else 0) for i in range(processes)]
+    procs, offset = [], 0
+    for count in per_process:
+        proc = multiprocessing.Process(target=worker, args=(path, offset, count, meals, start_at, results))
+        proc.start()
+        procs.append(proc)
+        offset += count
+    rows = [row for _ in procs for row in results.get()]
+    for proc in procs:
+        proc.join()
+
+    db = sqlite3.connect(path)
+    holders = dict(db.execute("""SELECT meals.id, teachers.name FROM meals LEFT JOIN teachers
+                                 ON meals.teacher_id = teachers.id"""))
+    winners = {}
+    problems = []
+    for n, meal_id, result, _ in rows:
+        if result == "claimed":
+            if meal_id in winners:
+                problems.append(f"meal {meal_id} claimed by both Teacher {winners[meal_id]} and Teacher {n}")
+            winners[meal_id] = n
+        elif result != "already_claimed":
+            problems.append(f"Teacher {n} got {result} for meal {meal_id}")
+    for meal_id, holder in holders.items():
+        expected = f"Teacher {winners[meal_id]}" if meal_id in winners else None
+        if holder != expected:
+            problems.append(f"meal {meal_id} is held by {holder}, but {expected} was told it was theirs")
+
+    latencies = [row[3] * 1000 for row in rows]
+    counts = {}
+    for row in rows:
+        counts[row[2]] = counts.get(row[2], 0) + 1
+    print(f"{len(rows)} claimers in {processes} processes racing for {meals} meals: {counts}")
+    print(f"latency ms  p50 {percentile(latencies, 50):.1f}  p95 {percentile(latencies, 95):.1f}  "
+          f"p99 {percentile(latencies, 99):.1f}  max {max(latencies):.1f}")
+    print("lost or conflicting claims:", len(problems))
+    for problem in problems[:20]:
+        print("  " + problem)
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
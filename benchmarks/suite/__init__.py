@@ -0,0 +1,4 @@
+#per-route benchmark suite: builds a synthetic multi-season meals.db, drives every route
+#through the flask test client or over http against a local server, and reports latency
+#percentiles, throughput and sql statements per request as a table and as json.
+#run from the repo root: python -m benchmarks.suite --help
@@ -0,0 +1,215 @@
+import argparse
+import fnmatch
+import http.client
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+
+from benchmarks.suite import routes, synth
+
+#a logged in visitor driving the app through flask's test client
+class ClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, headers=None):
+        response = self.client.open(path, method=method, data=data, headers=headers)
+        response.get_data()
+        return response.status_code, int(response.headers.get("X-Query-Count", 0))
+
+#the same over a keep-alive http connection to benchmarks.suite.server
+class HttpSession:
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, data=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        response.read()
+        cookie = response.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return response.status, int(response.getheader("X-Query-Count", 0))
+
+def login(session):
+    session.request("POST", "/volunteers/enter-code", {"code": synth.VOLUNTEER_CODE})
+    session.request("POST", "/teachers/enter-code", {"code": synth.TEACHER_CODE})
+    session.request("POST", "/admin/login", {"pw": synth.ADMIN_PASSWORD})
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+#run one scenario `requests` times split over `concurrency` sessions
+def drive(scenario, sessions, requests, warmup):
+    counter = itertools.count()
+    samples = []
+    lock = threading.Lock()
+
+    def one(session, i):
+        path = scenario.path(i) if callable(scenario.path) else scenario.path
+        data = scenario.data(i) if callable(scenario.data) else scenario.data
+        began = time.perf_counter()
+        try:
+            status, queries = session.request(scenario.method, path, data, scenario.headers)
+        except Exception:
+            status, queries = None, 0
+        return time.perf_counter() - began, status, queries
+
+    for i in range(warmup):
+        one(sessions[0], next(counter))
+
+    def loop(session):
+        local = []
+        while True:
+            i = next(counter)
+            if i >= requests + warmup:
+                break
+            local.append(one(session, i))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=loop, args=(session,)) for session in sessions]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    latencies = [sample[0] * 1000 for sample in samples]
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "method": scenario.method,
+        "path": scenario.path if isinstance(scenario.path, str) else scenario.path(0),
+        "requests": len(samples),
+        "errors": sum(1 for _, status, _ in samples if status is None or status >= 500),
+        "statuses": statuses,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "sql_per_request": round(sum(sample[2] for sample in samples) / len(samples), 2),
+    }
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_table(results, baseline=None):
+    header = f"{'route':<26} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>9} {'sql':>6}"
+    if baseline:
+        header += f" {'p50 vs base':>12}"
+    print(header)
+    for name, row in results.items():
+        line = (f"{name:<26} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+                f"{row['throughput_rps']:>9.1f} {row['sql_per_request']:>6.1f}")
+        old = (baseline or {}).get(name)
+        if old:
+            line += f" {(row['p50_ms'] / old['p50_ms'] - 1) * 100 if old['p50_ms'] else 0:>+11.0f}%"
+        if row["errors"]:
+            line += f"  {row['errors']} errors {row['statuses']}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite",
+                                     description="Per-route latency, throughput and sql counts on synthetic data.")
+    parser.add_argument("--db", help="use this database instead of building one (it is written to)")
+    parser.add_argument("--seasons", type=int, default=3, help="school years of synthetic history (default 3)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply rows per season (default 1)")
+    parser.add_argument("--mode", choices=["client", "http"], default="client")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per route (default 200)")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1, help="simultaneous sessions per route")
+    parser.add_argument("--only", action="append", help="glob of route names to run, may repeat")
+    parser.add_argument("--no-page-cache", action="store_true", help="run with PAGE_CACHE_MB=0")
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--compare", help="an earlier --json file to compare p50 against")
+    args = parser.parse_args()
+
+    path = args.db
+    counts = None
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), "meals.db")
+        began = time.perf_counter()
+        counts = synth.build(path, seasons=args.seasons, scale=args.scale)
+        print(f"built {path} in {time.perf_counter() - began:.1f}s: {counts}", file=sys.stderr)
+    os.environ["DATABASE"] = path
+    os.environ.setdefault("SECRET_KEY", "bench")
+    if args.no_page_cache:
+        os.environ["PAGE_CACHE_MB"] = "0"
+
+    server = None
+    if args.mode == "client":
+        import app as appmod
+        from benchmarks.suite.instrument import install
+        install(appmod)
+        make_session = lambda: ClientSession(appmod.app)
+    else:
+        port = free_port()
+        server = subprocess.Popen([sys.executable, "-m", "benchmarks.suite.server", path, str(port)], cwd=ROOT,
+                                  stdout=subprocess.PIPE, env=os.environ.copy(), text=True)
+        server.stdout.readline()
+        make_session = lambda: HttpSession(port)
+
+    try:
+        sessions = [make_session() for _ in range(args.concurrency)]
+        for session in sessions:
+            login(session)
+        results = {}
+        for scenario in routes.scenarios(routes.context(path)):
+            if args.only and not any(fnmatch.fnmatch(scenario.name, pattern) for pattern in args.only):
+                continue
+            results[scenario.name] = drive(scenario, sessions, args.requests, args.warmup)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["routes"]
+    print_table(results, baseline)
+    if args.json:
+        report = {
+            "meta": {"revision": git_revision(), "date": datetime.now().isoformat(timespec="seconds"),
+                     "python": platform.python_version(), "mode": args.mode, "concurrency": args.concurrency,
+                     "requests": args.requests, "seasons": args.seasons, "scale": args.scale, "rows": counts,
+                     "page_cache": not args.no_page_cache},
+            "routes": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import threading
+
+#count the sql statements each request runs. every pooled connection gets a trace
+#callback, and the count comes back on the response as X-Query-Count so the runner
+#sees it the same way through the test client and over http
+
+STATEMENTS = ("select", "insert", "update", "delete", "replace", "with")
+
+def install(appmod):
+    local = threading.local()
+
+    def trace(sql):
+        #statements run by triggers come through as "-- TRIGGER ..." and aren't counted
+        if sql.lstrip()[:7].lower().startswith(STATEMENTS):
+            local.count = getattr(local, "count", 0) + 1
+
+    pool = appmod.get_pool()
+    connect = pool._connect
+    def traced_connect(reader):
+        conn = connect(reader)
+        conn.set_trace_callback(trace)
+        return conn
+    pool._connect = traced_connect
+    #drop connections opened before the callback was installed
+    pool.close()
+
+    app = appmod.app
+    def reset():
+        local.count = 0
+    app.before_request_funcs.setdefault(None, []).insert(0, reset)
+
+    @app.after_request
+    def report(response):
+        response.headers["X-Query-Count"] = str(getattr(local, "count", 0))
+        return response
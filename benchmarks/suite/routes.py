@@ -0,0 +1,87 @@
+import sqlite3
+from datetime import date
+from typing import Callable, NamedTuple, Optional, Union
+
+#what the suite requests. `path` and `data` may be functions of the iteration number so
+#writes don't collide (unique recipe names, a different meal per claim).
+#
+#not driven, because they change what every later request sees or reach outside the
+#app: deleting volunteers, setting access codes, pushing to teachers, creating or editing
+#deadlines, sending or retrying emails, and logging out.
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    path: Union[str, Callable]
+    data: Optional[Union[dict, Callable]] = None
+    headers: Optional[dict] = None
+
+#ids and names from the synthetic database the scenarios point at
+def context(path):
+    db = sqlite3.connect(path)
+    month = date.today().replace(day=1).isoformat()
+    one = lambda sql, *args: db.execute(sql, args).fetchone()[0]
+    ctx = {
+        "open_meals": [row[0] for row in db.execute(
+            "SELECT id FROM meals WHERE date >= ? AND teacher_id IS NULL ORDER BY id", (month,))],
+        "meal_id": one("SELECT MIN(id) FROM meals WHERE date >= ?", month),
+        "gc_id": one("SELECT MIN(id) FROM gift_cards WHERE date >= ?", month),
+        "recipe_id": one("SELECT MIN(id) FROM recipes"),
+        "recipe_name": one("SELECT name FROM recipes ORDER BY id LIMIT 1"),
+        "volunteer_name": one("SELECT name FROM volunteers ORDER BY id LIMIT 1"),
+        "deadline_id": one("SELECT MAX(id) FROM deadlines"),
+        "dropoff": one("SELECT dropoff_start FROM deadlines ORDER BY id DESC LIMIT 1"),
+    }
+    db.close()
+    return ctx
+
+def scenarios(ctx):
+    open_meals = ctx["open_meals"]
+    claim = lambda i: {"name": f"Bench Teacher {i}", "email": f"bench{i}@school.example.org",
+                       "id": open_meals[i % len(open_meals)], "reward_type": "meals"}
+    meal = {"name": ctx["volunteer_name"], "meal": ctx["recipe_name"], "date": ctx["dropoff"]}
+    gift_card = {"name": ctx["volunteer_name"], "gc_name": "Target", "date": ctx["dropoff"]}
+    recipe = lambda i: {"recipe_name": f"Bench Recipe {i}", "ingredients": "- 1 cup rice\n- 2 cups water",
+                        "instructions": "1. boil\n2. simmer", "creator_name": ctx["volunteer_name"]}
+    return [
+        Scenario("index", "GET", "/"),
+        Scenario("static", "GET", "/static/styles.css"),
+        Scenario("volunteers", "GET", "/volunteers/"),
+        Scenario("volunteer_signups", "GET", "/volunteers/signups/"),
+        Scenario("volunteer_signups_all", "GET", "/volunteers/signups/all-time"),
+        Scenario("edit_meal_form", "GET", f"/volunteers/signups/edit-meal-{ctx['meal_id']}"),
+        Scenario("edit_gc_form", "GET", f"/volunteers/signups/edit-gc-{ctx['gc_id']}"),
+        Scenario("gc_signup_form", "GET", "/volunteers/gc-signup"),
+        Scenario("gc_signup", "POST", "/volunteers/gc-signup", gift_card),
+        Scenario("meal_signup_form", "GET", "/volunteers/meal-signup"),
+        Scenario("meal_signup", "POST", "/volunteers/meal-signup", meal),
+        Scenario("teachers", "GET", "/teachers/"),
+        Scenario("reward_signup", "GET", "/teachers/reward-signup"),
+        Scenario("reward_claim", "POST", "/teachers/reward-signup", claim, {"Accept": "application/json"}),
+        Scenario("recipes", "GET", "/recipes/"),
+        Scenario("recipe_search", "GET", "/recipes/search?q=chick"),
+        Scenario("recipe", "GET", f"/recipes/{ctx['recipe_id']}"),
+        Scenario("upload_recipe_form", "GET", "/recipes/upload"),
+        Scenario("upload_recipe", "POST", "/recipes/upload", recipe),
+        Scenario("admin", "GET", "/admin/"),
+        Scenario("admin_volunteers", "GET", "/admin/volunteers/"),
+        Scenario("add_volunteer_form", "GET", "/admin/volunteers/add"),
+        Scenario("set_volunteer_code_form", "GET", "/admin/set-volunteer-code"),
+        Scenario("set_teacher_code_form", "GET", "/admin/set-teacher-code"),
+        Scenario("override_signups", "GET", "/admin/override-signups"),
+        Scenario("admin_edit_meal_form", "GET", f"/admin/edit-meal-{ctx['meal_id']}"),
+        Scenario("admin_edit_gc_form", "GET", f"/admin/edit-gc-{ctx['gc_id']}"),
+        Scenario("admin_add_meal_form", "GET", "/admin/add-meal"),
+        Scenario("admin_add_meal", "POST", "/admin/add-meal", meal),
+        Scenario("admin_add_gc_form", "GET", "/admin/add-gc"),
+        Scenario("admin_add_gc", "POST", "/admin/add-gc", gift_card),
+        Scenario("admin_recipes", "GET", "/admin/recipes"),
+        Scenario("admin_edit_recipe_form", "GET", f"/admin/edit-recipe-{ctx['recipe_id']}"),
+        Scenario("deadlines", "GET", "/admin/deadlines/"),
+        Scenario("set_deadlines_form", "GET", "/admin/deadlines/set"),
+        Scenario("edit_deadline_form", "GET", f"/admin/deadlines/edit-{ctx['deadline_id']}"),
+        Scenario("rankings", "GET", "/admin/rankings"),
+        Scenario("rankings_top10", "GET", "/admin/rankings?limit=10"),
+        Scenario("email_progress", "GET", "/admin/emails"),
+        Scenario("page_cache_stats", "GET", "/admin/page-cache"),
+    ]
@@ -0,0 +1,25 @@
+import argparse
+import logging
+import os
+
+from werkzeug.serving import make_server
+
+#the app behind a threaded local http server, for --mode http.
+#python -m benchmarks.suite.server DATABASE PORT
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("database")
+    parser.add_argument("port", type=int)
+    args = parser.parse_args()
+    os.environ["DATABASE"] = args.database
+    os.environ.setdefault("SECRET_KEY", "bench")
+    import app as appmod
+    from benchmarks.suite.instrument import install
+    install(appmod)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", args.port, appmod.app, threaded=True)
+    print("ready", flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import random
+import sqlite3
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from migrations import migrate
+
+#rows per season at the default size. --scale multiplies them
+SIZES = {"volunteers": 300, "recipes": 600, "teachers": 200, "meals_per_month": 120, "gift_cards_per_month": 40}
+
+ADMIN_PASSWORD = "bench"
+VOLUNTEER_CODE = "v"
+TEACHER_CODE = "t"
+
+WORDS = ["chicken", "pot", "pie", "lasagna", "vegetable", "curry", "lentil", "soup", "taco", "bake", "rice",
+         "noodle", "salad", "chili", "enchilada", "pasta", "tikka", "masala", "stew", "quiche", "burrito"]
+
+#school months a season runs through, august to may
+def season_months(first_year):
+    return [date(first_year + (month < 8), month, 1) for month in list(range(8, 13)) + list(range(1, 6))]
+
+#build a synthetic database at `path` with `seasons` school years ending with the current
+#one. the current month's teacher window is open today, so every signup form renders
+def build(path, seasons=3, scale=1.0, seed=1):
+    rng = random.Random(seed)
+    today = date.today()
+    sizes = {name: max(1, int(count * scale)) for name, count in SIZES.items()}
+    db = sqlite3.connect(path)
+    migrate(db)
+    db.execute("INSERT INTO passwords (username, hash) VALUES ('admin', ?)", (generate_password_hash(ADMIN_PASSWORD),))
+    db.execute("INSERT INTO volunteer_codes (code) VALUES (?)", (VOLUNTEER_CODE,))
+    db.execute("INSERT INTO teacher_codes (code) VALUES (?)", (TEACHER_CODE,))
+    current_season = today.year if today.month >= 8 else today.year - 1
+    months = [month for year in range(current_season - seasons + 1, current_season + 1) for month in season_months(year)
+              if month <= today.replace(day=1)]
+    if today.replace(day=1) not in months:
+        months.append(today.replace(day=1))
+    first = months[0]
+    volunteers = sizes["volunteers"] * seasons
+    db.executemany("INSERT INTO volunteers (name, email, phone, date_added) VALUES (?, ?, ?, ?)",
+                   [(f"Volunteer {i}", f"volunteer{i}@example.org", f"555-{i:04d}",
+                     (first + timedelta(days=rng.randrange((today - first).days + 1))).isoformat())
+                    for i in range(volunteers)])
+    recipes = sizes["recipes"] * seasons
+    db.executemany("INSERT INTO recipes (name, ingredients, instructions, creator_id) VALUES (?, ?, ?, ?)",
+                   [(f"{' '.join(rng.sample(WORDS, 2)).title()} {i}",
+                     "\n".join(f"- {rng.randint(1, 4)} cups {rng.choice(WORDS)}" for _ in range(8)),
+                     "\n".join(f"{step}. {' '.join(rng.sample(WORDS, 5))}" for step in range(1, 7)),
+                     rng.randint(1, volunteers)) for i in range(recipes)])
+    teachers = sizes["teachers"] * seasons
+    db.executemany("INSERT INTO teachers (name, email) VALUES (?, ?)",
+                   [(f"Teacher {i}", f"teacher{i}@school.example.org") for i in range(teachers)])
+    meals, gift_cards = [], []
+    for month in months:
+        current = month == today.replace(day=1)
+        dropoff_start = month.replace(day=10)
+        days = 10
+        db.execute("""INSERT INTO deadlines (month_year, volunteer_start, volunteer_end, dropoff_start, dropoff_end,
+                      teacher_start, teacher_end) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                   (month.strftime("%B %Y"), (month - timedelta(days=20)).isoformat(), (month + timedelta(days=3)).isoformat(),
+                    dropoff_start.isoformat(), (dropoff_start + timedelta(days=days)).isoformat(),
+                    (today if current else month + timedelta(days=4)).isoformat(),
+                    (today + timedelta(days=7) if current else month + timedelta(days=8)).isoformat()))
+        for _ in range(sizes["meals_per_month"]):
+            #the current month's rewards are still open for teachers to claim
+            teacher = None if current or rng.random() < 0.1 else rng.randint(1, teachers)
+            meals.append((rng.randint(1, recipes), (dropoff_start + timedelta(days=rng.randrange(days))).isoformat(),
+                          rng.randint(1, volunteers), teacher))
+        for _ in range(sizes["gift_cards_per_month"]):
+            teacher = None if current or rng.random() < 0.1 else rng.randint(1, teachers)
+            gift_cards.append((rng.choice(["Target", "Panera", "Starbucks", "Chipotle"]),
+                               (dropoff_start + timedelta(days=rng.randrange(days))).isoformat(),
+                               rng.randint(1, volunteers), teacher))
+    db.executemany("INSERT INTO meals (recipe_id, date, volunteer_id, teacher_id) VALUES (?, ?, ?, ?)", meals)
+    db.executemany("INSERT INTO gift_cards (name, date, volunteer_id, teacher_id) VALUES (?, ?, ?, ?)", gift_cards)
+    db.commit()
+    db.execute("ANALYZE")
+    counts = {table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ("volunteers", "recipes", "teachers", "meals", "gift_cards", "deadlines")}
+    db.close()
+    return counts
@@ -0,0 +1,104 @@
+import os
+import threading
+
+#in-memory caches that stay correct across gunicorn workers. triggers bump a row in
+#table_generations on every insert, update or delete of the tables the caches read
+#(migration 10 lists them), in whichever process made the write. each worker keeps a
+#copy of those counters: PRAGMA data_version on a private connection changes whenever
+#any other connection commits, so the copy is only re-read after a write somewhere,
+#and sync() runs once per request. a cache keyed by a table's generation then never serves data older than
+#the request it answers.
+
+class Generations:
+    def __init__(self, connect):
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._stamp = None
+        self._generations = {}
+        self.syncs = 0
+        self.reloads = 0
+
+    #re-read the counters if anything was committed since the last sync
+    def sync(self):
+        with self._lock:
+            if self._conn is None or self._pid != os.getpid():
+                self._conn = self._connect()
+                self._pid = os.getpid()
+                self._stamp = None
+            self.syncs += 1
+            stamp = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if stamp != self._stamp:
+                self._generations = dict(self._conn.execute("SELECT name, generation FROM table_generations").fetchall())
+                self._stamp = stamp
+                self.reloads += 1
+
+    #the generation of `table` as of the last sync
+    def get(self, table):
+        return self._generations.get(table, 0)
+
+    #close the private connection, for a tenant being shut down
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def stats(self):
+        with self._lock:
+            return {"syncs": self.syncs, "reloads": self.reloads, "generations": dict(self._generations)}
+
+#latest volunteer and teacher access codes, kept in memory for the before_request gates
+#and re-read only when a code table's generation moves
+class CodeRegistry:
+    def __init__(self, connect, generations):
+        self._connect = connect
+        self._generations = generations
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._stamp = None
+        self._codes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _check(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = self._connect()
+            self._pid = os.getpid()
+            self._stamp = None
+        stamp = (self._generations.get("volunteer_codes"), self._generations.get("teacher_codes"))
+        if stamp == self._stamp:
+            self.hits += 1
+            return
+        self.misses += 1
+        self._codes = {
+            kind: self._conn.execute(f"SELECT id, code FROM {kind}_codes ORDER BY id DESC LIMIT 1").fetchone()
+            for kind in ("volunteer", "teacher")
+        }
+        self._stamp = stamp
+
+    #(id, code) of the newest code for "volunteer" or "teacher", or None if none is set
+    def current(self, kind):
+        with self._lock:
+            self._check()
+            row = self._codes[kind]
+        return (row["id"], row["code"]) if row else None
+
+    def version(self, kind):
+        current = self.current(kind)
+        return current[0] if current else None
+
+    #forget what is cached so the next lookup reads the tables again. for a code changed
+    #by this request, which the generations won't show until the next sync
+    def refresh(self):
+        with self._lock:
+            self._stamp = None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._stamp = None
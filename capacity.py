@@ -0,0 +1,96 @@
+import threading
+from datetime import timedelta
+from typing import NamedTuple, Optional
+
+#how many meals and gift cards are dropped off at the front office on each day of a
+#month's dropoff window. the month's deadlines row may cap a day (max_per_day, else the
+#DROPOFF_MAX_PER_DAY default, 0 meaning no cap). the booked counts for the whole window
+#come from one grouped query, kept until a meal or gift card is written somewhere, and a
+#signup only lands on a day after counting it again inside its own write transaction.
+
+#dropoffs per day in [start, end], meals and gift cards together
+BOOKED = """SELECT date, COUNT(*) AS booked FROM (SELECT date FROM meals WHERE date BETWEEN :start AND :end
+            UNION ALL SELECT date FROM gift_cards WHERE date BETWEEN :start AND :end) GROUP BY date"""
+
+#dropoffs on one day leaving out the signup being edited, and whether that signup is
+#already on the day
+BOOKED_ON = """SELECT (SELECT COUNT(*) FROM meals WHERE date = :day AND id IS NOT :meal)
+               + (SELECT COUNT(*) FROM gift_cards WHERE date = :day AND id IS NOT :gift_card),
+               EXISTS (SELECT 1 FROM meals WHERE id = :meal AND date = :day)
+               OR EXISTS (SELECT 1 FROM gift_cards WHERE id = :gift_card AND date = :day)"""
+
+class Slot(NamedTuple):
+    day: object
+    booked: int
+    remaining: Optional[int]
+
+    @property
+    def full(self):
+        return self.remaining == 0
+
+#the day cap for a cycle: its own max_per_day, else `default`. 0 or None means no cap
+def day_limit(cycle, default):
+    limit = cycle.max_per_day if cycle is not None and cycle.max_per_day is not None else default
+    return limit if limit and limit > 0 else None
+
+#one Slot per day of the cycle's dropoff window
+def calendar(cycle, booked, limit):
+    if cycle is None or not cycle.dropoff_start or not cycle.dropoff_end:
+        return []
+    slots = []
+    day = cycle.dropoff_start
+    while day <= cycle.dropoff_end:
+        count = booked.get(day, 0)
+        slots.append(Slot(day, count, None if limit is None else max(limit - count, 0)))
+        day += timedelta(days=1)
+    return slots
+
+#booked counts per dropoff window, dropped when `generation()` (the meals and gift_cards
+#generations) moves. `query` is query_db from app.py
+class BookingCache:
+    def __init__(self, query, generation):
+        self._query = query
+        self._generation = generation
+        self._lock = threading.Lock()
+        self._seen = None
+        self._windows = {}
+        self.hits = 0
+        self.misses = 0
+
+    #{date: dropoffs} for the window [start, end]
+    def booked(self, start, end):
+        with self._lock:
+            seen = self._generation()
+            if seen != self._seen:
+                self._windows = {}
+                self._seen = seen
+            counts = self._windows.get((start, end))
+            if counts is not None:
+                self.hits += 1
+                return counts
+            self.misses += 1
+        counts = {row.date: row.booked for row in self._query(BOOKED, {"start": start, "end": end})}
+        with self._lock:
+            if self._seen == seen:
+                self._windows[(start, end)] = counts
+        return counts
+
+#run `sql` (the insert or update putting a signup on `day`) on the writer connection `db`
+#unless the day already has `limit` dropoffs. `meal` or `gift_card` is the id of a signup
+#being edited, which doesn't count against itself and may stay on its day even if the
+#cap was lowered since. the count and the write share one BEGIN IMMEDIATE transaction,
+#so two volunteers can never both take a day's last slot. returns whether it was written
+def reserve(db, day, limit, sql, args, meal=None, gift_card=None):
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        if limit is not None:
+            booked, staying = db.execute(BOOKED_ON, {"day": day, "meal": meal, "gift_card": gift_card}).fetchone()
+            if booked >= limit and not staying:
+                db.rollback()
+                return False
+        db.execute(sql, args)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return True
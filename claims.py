@@ -0,0 +1,58 @@
+import sqlite3
+import time
+
+#teachers claiming meals and gift cards. when the admin pushes rewards to teachers many of
+#them sign up within seconds, so a claim is one BEGIN IMMEDIATE transaction that only
+#takes a reward nobody holds yet. two teachers racing for the same meal get one CLAIMED
+#and one ALREADY_CLAIMED, never a silent overwrite.
+#
+#claims in this process queue on the pool's writer lock. claims from other worker
+#processes wait on sqlite's busy timeout, and if that runs out the claim is retried with
+#a short backoff until `patience` seconds have passed.
+
+CLAIMED = "claimed"
+ALREADY_CLAIMED = "already_claimed"
+NOT_FOUND = "not_found"
+BUSY = "busy"
+
+#reward_type from the form: (table, extra condition for a claimable row)
+REWARD_TABLES = {"meals": ("meals", ""), "gift_cards": ("gift_cards", " AND NOT hidden")}
+
+def _claim_once(db, table, condition, reward_id, name, email):
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute("INSERT OR IGNORE INTO teachers (name, email) VALUES (?, ?)", (name, email))
+        teacher_id = db.execute("SELECT id FROM teachers WHERE name = ? AND email = ?", (name, email)).fetchone()[0]
+        cur = db.execute(f"UPDATE {table} SET teacher_id = ? WHERE id = ? AND teacher_id IS NULL{condition}",
+                         (teacher_id, reward_id))
+        if cur.rowcount == 1:
+            db.commit()
+            return CLAIMED
+        row = db.execute(f"SELECT teacher_id FROM {table} WHERE id = ?{condition}", (reward_id,)).fetchone()
+        db.rollback()
+    except BaseException:
+        db.rollback()
+        raise
+    if row is None:
+        return NOT_FOUND
+    #the same teacher submitting twice still holds it
+    return CLAIMED if row[0] == teacher_id else ALREADY_CLAIMED
+
+#claim reward `reward_id` of `reward_type` for the teacher, creating the teacher if needed.
+#`writer` is the pool's writer context manager. returns CLAIMED, ALREADY_CLAIMED,
+#NOT_FOUND or BUSY (the database stayed locked for `patience` seconds)
+def claim_reward(writer, reward_type, reward_id, name, email, patience=10.0, backoff=0.05):
+    table, condition = REWARD_TABLES[reward_type]
+    deadline = time.monotonic() + patience
+    delay = backoff
+    while True:
+        try:
+            with writer() as db:
+                return _claim_once(db, table, condition, reward_id, name, email)
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            if time.monotonic() + delay > deadline:
+                return BUSY
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
@@ -0,0 +1,102 @@
+import threading
+from datetime import date, datetime
+from typing import NamedTuple, Optional
+
+#one month's row from the deadlines table with every date already parsed
+class Cycle(NamedTuple):
+    id: int
+    month_year: date
+    volunteer_start: Optional[date]
+    volunteer_end: Optional[date]
+    dropoff_start: Optional[date]
+    dropoff_end: Optional[date]
+    teacher_start: Optional[date]
+    teacher_end: Optional[date]
+    max_per_day: Optional[int]
+
+    #`row` is a record from query_db, so only month_year is still text
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            id=row.id,
+            month_year=datetime.strptime(row.month_year, "%B %Y").date(),
+            volunteer_start=row.volunteer_start or None,
+            volunteer_end=row.volunteer_end or None,
+            dropoff_start=row.dropoff_start or None,
+            dropoff_end=row.dropoff_end or None,
+            teacher_start=row.teacher_start or None,
+            teacher_end=row.teacher_end or None,
+            max_per_day=row.max_per_day,
+        )
+
+CYCLE_COLUMNS = "id, month_year, volunteer_start, volunteer_end, dropoff_start, dropoff_end, teacher_start, teacher_end, max_per_day"
+
+#keeps the newest cycle and the cycle for each month looked up in memory until
+#a route that writes deadlines calls invalidate(), or `generation()` (the deadlines
+#table's shared generation) moves because another worker wrote them. `query` is
+#query_db from app.py. a load that raced with invalidate() is returned but not kept
+class CycleCache:
+    def __init__(self, query, generation=None):
+        self._query = query
+        self._shared = generation
+        self._seen = None
+        self._lock = threading.Lock()
+        self._latest = None
+        self._latest_loaded = False
+        self._by_month = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    #drop everything if the deadlines changed in another process. called with the lock held
+    def _check_shared(self):
+        if self._shared is None:
+            return
+        seen = self._shared()
+        if seen != self._seen:
+            self._clear()
+            self._seen = seen
+
+    def _clear(self):
+        self._latest = None
+        self._latest_loaded = False
+        self._by_month = {}
+        self._generation += 1
+
+    #the most recently created deadlines row, which is the one volunteers sign up against
+    def latest(self):
+        with self._lock:
+            self._check_shared()
+            if self._latest_loaded:
+                self.hits += 1
+                return self._latest
+            self.misses += 1
+            generation = self._generation
+        row = self._query(f"SELECT {CYCLE_COLUMNS} FROM deadlines ORDER BY id DESC LIMIT 1", one=True)
+        cycle = Cycle.from_row(row) if row else None
+        with self._lock:
+            if generation == self._generation:
+                self._latest, self._latest_loaded = cycle, True
+        return cycle
+
+    #the deadlines row for a calendar month, which is what the teacher pages go by
+    def for_month(self, day):
+        key = day.strftime("%B %Y")
+        with self._lock:
+            self._check_shared()
+            if key in self._by_month:
+                self.hits += 1
+                return self._by_month[key]
+            self.misses += 1
+            generation = self._generation
+        row = self._query(f"SELECT {CYCLE_COLUMNS} FROM deadlines WHERE month_year = ? ORDER BY id DESC LIMIT 1",
+                          (key,), one=True)
+        cycle = Cycle.from_row(row) if row else None
+        with self._lock:
+            if generation == self._generation:
+                self._by_month[key] = cycle
+        return cycle
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
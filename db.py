@@ -0,0 +1,169 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date
+from operator import itemgetter
+from pathlib import Path
+
+#columns stored as YYYY-MM-DD text that come back from fetch_records as datetime.date
+DATE_COLUMNS = frozenset({"date", "dropoff_date", "date_added", "volunteer_start", "volunteer_end", "dropoff_start", "dropoff_end",
+                          "teacher_start", "teacher_end"})
+
+#a result row: a plain tuple with its column names as attributes, plus record["name"] and
+#keys() so code and templates written against sqlite3.Row keep working
+class Record(tuple):
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise IndexError(f"No item with that key: {key}") from None
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return list(self._fields)
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        return f"Record({', '.join(f'{k}={v!r}' for k, v in zip(self._fields, self))})"
+
+_record_types = {}
+_record_types_lock = threading.Lock()
+
+#one Record subclass per distinct list of column names, built the first time it's seen
+def record_type(description):
+    fields = tuple(column[0] for column in description)
+    cls = _record_types.get(fields)
+    if cls is None:
+        attrs = {"__slots__": (), "_fields": fields, "_index": {name: i for i, name in enumerate(fields)},
+                 "_dates": tuple(i for i, name in enumerate(fields) if name in DATE_COLUMNS)}
+        for i, name in enumerate(fields):
+            if name.isidentifier() and not name.startswith("_") and name not in ("keys",):
+                attrs[name] = property(itemgetter(i))
+        cls = type("Record", (Record,), attrs)
+        with _record_types_lock:
+            cls = _record_types.setdefault(fields, cls)
+    return cls
+
+def _to_date(value):
+    return date.fromisoformat(value) if value else value
+
+#fetch every row of a cursor executed with row_factory None as records. date columns are
+#decoded a whole column at a time rather than row by row
+def fetch_records(cur):
+    rows = cur.fetchall()
+    if not rows:
+        return rows
+    cls = record_type(cur.description)
+    if cls._dates:
+        columns = list(zip(*rows))
+        for i in cls._dates:
+            columns[i] = map(_to_date, columns[i])
+        rows = zip(*columns)
+    new = tuple.__new__
+    return [new(cls, row) for row in rows]
+
+#pool of sqlite connections shared by every request in a worker process.
+#reads check out one of `size` reader connections, writes go through a single
+#writer connection guarded by a lock so only one thread writes at a time.
+class ConnectionPool:
+    def __init__(self, path, size=4, busy_timeout=5000, shared_cache=True):
+        self.path = path
+        self.size = max(1, int(size))
+        self.busy_timeout = int(busy_timeout)
+        self.shared_cache = shared_cache
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._readers = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._writer = None
+        self._write_lock = threading.RLock()
+
+    #connections inherited through fork() must never be used (or closed) by the child,
+    #so a pool that notices a new pid just forgets them and starts over
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def _connect(self, reader):
+        #readers share one page cache, the writer keeps a private one so shared-cache
+        #table locks never come between a write and the reads running beside it
+        if reader and self.shared_cache:
+            uri = Path(os.path.abspath(self.path)).as_uri() + "?cache=shared"
+            conn = sqlite3.connect(uri, uri=True, timeout=self.busy_timeout / 1000, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    #a standalone connection outside the pool, for callers that keep their own
+    def connect(self):
+        return self._connect(reader=False)
+
+    def acquire(self):
+        self._check_pid()
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect(reader=True)
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._readers.get(timeout=self.busy_timeout / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError("database connection pool exhausted")
+
+    def release(self, conn):
+        if self._pid != os.getpid():
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        self._check_pid()
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect(reader=False)
+            try:
+                yield self._writer
+            except Exception:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+                raise
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._created -= 1
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
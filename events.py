@@ -0,0 +1,75 @@
+import collections
+import os
+import threading
+
+#claim, unclaim and hide events for the teacher reward page. triggers on meals and
+#gift_cards write a row to reward_events whenever a teacher is set or cleared or a gift
+#card is hidden or shown, whichever route or worker made the change. each worker runs
+#one poller thread that reads new rows (only after PRAGMA data_version says something
+#was committed) into a small in-memory buffer, and every open event stream in the
+#worker waits on that buffer instead of querying the database itself.
+
+COLUMNS = ("id", "type", "reward_type", "reward_id", "teacher_name")
+
+class EventFeed:
+    def __init__(self, connect, interval=0.5, keep=1000):
+        self._connect = connect
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._events = collections.deque(maxlen=keep)
+        self._last = 0
+        self._pid = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    #start the poller in this process if it isn't running. the buffer starts with the
+    #newest `keep` events so a page rendered a moment ago can catch up
+    def _start(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        conn = self._connect()
+        rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM reward_events ORDER BY id DESC LIMIT ?",
+                            (self._events.maxlen,)).fetchall()
+        self._events.clear()
+        self._events.extend(dict(zip(COLUMNS, row)) for row in reversed(rows))
+        self._last = rows[0][0] if rows else conn.execute("SELECT COALESCE(MAX(id), 0) FROM reward_events").fetchone()[0]
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._poll, args=(conn,), daemon=True, name="reward-events")
+        self._thread.start()
+
+    def _poll(self, conn):
+        stamp = None
+        while not self._stop.is_set():
+            try:
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if version != stamp:
+                    stamp = version
+                    rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM reward_events WHERE id > ? ORDER BY id",
+                                        (self._last,)).fetchall()
+                    if rows:
+                        with self._changed:
+                            self._events.extend(dict(zip(COLUMNS, row)) for row in rows)
+                            self._last = rows[-1][0]
+                            self._changed.notify_all()
+            except Exception:
+                #a locked or busy database; try again next time round
+                stamp = None
+            self._stop.wait(self.interval)
+        conn.close()
+
+    #stop this process's poller, for a tenant being shut down
+    def close(self):
+        self._stop.set()
+
+    #events after id `after`, waiting up to `timeout` seconds for one. returns [] on
+    #timeout, or None if events after `after` have already left the buffer
+    def wait(self, after, timeout):
+        with self._changed:
+            self._start()
+            self._changed.wait_for(lambda: self._last > after, timeout)
+            if self._last <= after:
+                return []
+            if not self._events or self._events[0]["id"] > after + 1:
+                return None
+            return [event for event in self._events if event["id"] > after]
@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+from datetime import date
+
+#streaming exports of signups, volunteers and rankings. rows are stepped out of sqlite
+#`CHUNK_ROWS` at a time and written out as they come, so an export never holds more
+#than one chunk in memory however many seasons it covers.
+
+CHUNK_ROWS = 500
+
+#kind: (columns, query). queries take the range as :start and :end, both inclusive.
+#{meals} and {gift_cards} are the live tables, or the views that add the archive
+EXPORTS = {
+    "meals": (("id", "date", "volunteer", "volunteer_email", "recipe", "teacher", "teacher_email"),
+              """SELECT meals.id, meals.date, volunteers.name, volunteers.email, recipes.name, teachers.name, teachers.email
+                 FROM {meals} JOIN volunteers ON meals.volunteer_id = volunteers.id
+                 JOIN recipes ON meals.recipe_id = recipes.id LEFT JOIN teachers ON meals.teacher_id = teachers.id
+                 WHERE meals.date BETWEEN :start AND :end ORDER BY meals.date, volunteers.name, meals.id"""),
+    "gift_cards": (("id", "date", "name", "volunteer", "volunteer_email", "teacher", "teacher_email", "hidden"),
+                   """SELECT gift_cards.id, gift_cards.date, gift_cards.name, volunteers.name, volunteers.email,
+                      teachers.name, teachers.email, gift_cards.hidden FROM {gift_cards}
+                      JOIN volunteers ON gift_cards.volunteer_id = volunteers.id
+                      LEFT JOIN teachers ON gift_cards.teacher_id = teachers.id
+                      WHERE gift_cards.date BETWEEN :start AND :end ORDER BY gift_cards.date, volunteers.name, gift_cards.id"""),
+    #everyone on the list, with what they signed up for in the range
+    "volunteers": (("id", "name", "email", "phone", "date_added", "meals", "gift_cards"),
+                   """SELECT volunteers.id, volunteers.name, volunteers.email, volunteers.phone, volunteers.date_added,
+                      (SELECT COUNT(*) FROM {meals} WHERE meals.volunteer_id = volunteers.id
+                       AND meals.date BETWEEN :start AND :end),
+                      (SELECT COUNT(*) FROM {gift_cards} WHERE gift_cards.volunteer_id = volunteers.id
+                       AND gift_cards.date BETWEEN :start AND :end)
+                      FROM volunteers ORDER BY volunteers.name"""),
+    "volunteer_rankings": (("rank", "volunteer", "rewards"),
+                           """SELECT RANK() OVER (ORDER BY COUNT(*) DESC), volunteers.name, COUNT(*) FROM
+                              (SELECT volunteer_id FROM {meals} WHERE date BETWEEN :start AND :end
+                               UNION ALL SELECT volunteer_id FROM {gift_cards} WHERE date BETWEEN :start AND :end) AS rewards
+                              JOIN volunteers ON volunteers.id = rewards.volunteer_id
+                              GROUP BY volunteers.id ORDER BY 1, volunteers.name"""),
+    "recipe_rankings": (("rank", "recipe", "creator", "uses"),
+                        """SELECT RANK() OVER (ORDER BY COUNT(*) DESC), recipes.name, volunteers.name, COUNT(*) FROM {meals}
+                           JOIN recipes ON recipes.id = meals.recipe_id JOIN volunteers ON volunteers.id = recipes.creator_id
+                           WHERE meals.date BETWEEN :start AND :end GROUP BY recipes.id ORDER BY 1, recipes.name"""),
+}
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+#(start, end) iso dates for a school year that begins in august of `year`
+def season_range(year):
+    return date(year, 8, 1).isoformat(), date(year + 1, 7, 31).isoformat()
+
+def current_season(today=None):
+    today = today or date.today()
+    return today.year if today.month >= 8 else today.year - 1
+
+#iso (start, end) from request arguments: start/end, season=YYYY, season=all, or the
+#current season. raises ValueError for a bad date
+def export_range(args):
+    start, end = args.get("start"), args.get("end")
+    if start or end:
+        return (date.fromisoformat(start).isoformat() if start else "0000-01-01",
+                date.fromisoformat(end).isoformat() if end else "9999-12-31")
+    season = args.get("season")
+    if season == "all":
+        return "0000-01-01", "9999-12-31"
+    return season_range(int(season) if season else current_season())
+
+#the export as chunks of text. `db` is a read connection kept open until the generator
+#finishes. `archive` reads seasons moved out by a rollover as well
+def stream_export(db, kind, fmt, start, end, archive=False):
+    columns, query = EXPORTS[kind]
+    if archive:
+        query = query.format(meals="all_meals AS meals", gift_cards="all_gift_cards AS gift_cards")
+    else:
+        query = query.format(meals="meals", gift_cards="gift_cards")
+    cursor = db.cursor()
+    cursor.row_factory = None
+    cursor.execute(query, {"start": start, "end": end})
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(columns)
+    try:
+        while True:
+            rows = cursor.fetchmany(CHUNK_ROWS)
+            if not rows:
+                break
+            if fmt == "csv":
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        cursor.close()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import time
+
+from werkzeug.utils import secure_filename
+
+#recipe photos are stored once as uploaded plus two resized variants: a 16:9 thumbnail
+#for the recipe cards and a medium size for the recipe page. paths are relative to static/
+#pillow is imported by the functions that use it, so booting a worker doesn't load it
+
+RECIPE_IMAGE_DIR = os.path.join("images", "recipes")
+
+#formats pillow may identify an upload as, and the extension the original is saved with
+ALLOWED_FORMATS = {"JPEG": ".jpg", "MPO": ".jpg", "PNG": ".png", "WEBP": ".webp", "GIF": ".gif"}
+
+#name: (size, crop). cropped variants fill the box exactly, the others fit inside it
+VARIANTS = {
+    "thumb": ((640, 360), True),
+    "medium": ((1200, 1200), False),
+}
+
+VARIANT_FORMATS = {"jpeg": ("JPEG", ".jpg", {"quality": 82, "optimize": True, "progressive": True}),
+                   "webp": ("WEBP", ".webp", {"quality": 80, "method": 4})}
+
+CHUNK_SIZE = 64 * 1024
+
+class ImageError(ValueError):
+    pass
+
+#copy an uploaded FileStorage to a temp file in `directory` chunk by chunk, giving up as
+#soon as it passes max_bytes so an oversized upload is never held in memory
+def _stream_to_temp(upload, directory, max_bytes):
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".upload")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = upload.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageError(f"Images must be smaller than {max_bytes // (1024 * 1024)} MB.")
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    if size == 0:
+        os.remove(path)
+        raise ImageError("The uploaded image is empty.")
+    return path
+
+def _identify(path):
+    from PIL import Image, UnidentifiedImageError
+    try:
+        with Image.open(path) as img:
+            fmt = img.format
+            img.verify()
+    except Image.DecompressionBombError:
+        raise ImageError("The uploaded image has too many pixels.")
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise ImageError("The uploaded file is not an image we can read (use JPEG, PNG, WEBP or GIF).")
+    if fmt not in ALLOWED_FORMATS:
+        raise ImageError("The uploaded file is not an image we can read (use JPEG, PNG, WEBP or GIF).")
+    return fmt
+
+#write every variant of the image at static/<original_url> and return {name: url}
+def make_variants(static_dir, original_url, output="jpeg"):
+    from PIL import Image, ImageOps
+    fmt, ext, options = VARIANT_FORMATS[output]
+    stem = os.path.splitext(original_url)[0]
+    urls = {}
+    with Image.open(os.path.join(static_dir, original_url)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA") or fmt == "JPEG":
+            img = img.convert("RGB")
+        for name, (size, crop) in VARIANTS.items():
+            variant = ImageOps.fit(img, size, Image.LANCZOS) if crop else ImageOps.contain(img, size, Image.LANCZOS)
+            url = f"{stem}_{name}{ext}"
+            variant.save(os.path.join(static_dir, url), fmt, **options)
+            urls[name] = url.replace(os.sep, "/")
+    return urls
+
+#validate and store an uploaded recipe photo. returns the image_url, thumb_url and
+#medium_url to record on the recipe, or raises ImageError with a message for the user
+def save_recipe_image(upload, static_dir, max_bytes, output="jpeg"):
+    directory = os.path.join(static_dir, RECIPE_IMAGE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = _stream_to_temp(upload, directory, max_bytes)
+    try:
+        fmt = _identify(temp_path)
+        stem = os.path.splitext(secure_filename(upload.filename or ""))[0] or "recipe"
+        original_url = os.path.join(RECIPE_IMAGE_DIR, f"{int(time.time())}_{stem}{ALLOWED_FORMATS[fmt]}")
+        shutil.move(temp_path, os.path.join(static_dir, original_url))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    from PIL import Image
+    try:
+        urls = make_variants(static_dir, original_url, output)
+    except (OSError, Image.DecompressionBombError) as e:
+        remove_images(static_dir, original_url)
+        raise ImageError("The uploaded image could not be processed.") from e
+    return {"image_url": original_url.replace(os.sep, "/"), "thumb_url": urls["thumb"], "medium_url": urls["medium"]}
+
+def remove_images(static_dir, *urls):
+    for url in urls:
+        if url:
+            path = os.path.join(static_dir, url)
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+from datetime import date
+from typing import NamedTuple
+
+from recipe_text import lines_json
+
+#bulk loading volunteers, recipes, meals and gift cards from csv or json. every row is
+#checked and every volunteer, recipe and teacher name resolved before anything is
+#written, then the whole file goes in with executemany in one transaction. one bad row
+#means nothing is imported, and every bad row is reported with its line number.
+
+#columns each kind accepts; the required ones must be filled in on every row
+KINDS = {
+    "volunteers": {"required": ("name", "email", "phone"), "optional": ("date_added",)},
+    "recipes": {"required": ("name", "ingredients", "instructions", "creator"), "optional": ()},
+    "meals": {"required": ("date", "volunteer", "recipe"), "optional": ("teacher_name", "teacher_email")},
+    "gift_cards": {"required": ("name", "date", "volunteer"), "optional": ("teacher_name", "teacher_email", "hidden")},
+}
+
+class ImportFileError(ValueError):
+    pass
+
+class ImportResult(NamedTuple):
+    kind: str
+    rows: int
+    inserted: int
+    errors: list
+
+#rows from an uploaded file as dicts with lowercase keys, numbered as the user sees them
+#(csv counts the header as line 1, json counts objects from 1)
+def parse_rows(text, fmt):
+    if fmt == "json":
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise ImportFileError(f"not valid JSON: {e}")
+        if isinstance(data, dict):
+            data = data.get("rows")
+        if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+            raise ImportFileError("JSON must be a list of objects (or {\"rows\": [...]})")
+        return [(number, {str(k).strip().lower(): v for k, v in row.items()}) for number, row in enumerate(data, 1)]
+    reader = csv.DictReader(io.StringIO(text.lstrip("\ufeff")))
+    if not reader.fieldnames:
+        raise ImportFileError("the CSV file is empty")
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    return [(reader.line_num, row) for row in reader]
+
+def _text(row, column):
+    value = row.get(column)
+    if value is None:
+        return ""
+    return str(value).strip()
+
+def _date(value):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"date {value!r} is not YYYY-MM-DD")
+
+#(teacher_name, teacher_email) or None. both or neither, like the edit forms
+def _teacher(row):
+    name, email = _text(row, "teacher_name"), _text(row, "teacher_email")
+    if bool(name) != bool(email):
+        raise ValueError("give both teacher_name and teacher_email, or neither")
+    return (name, email) if name else None
+
+#check every row and build its insert parameters. `names` maps table -> {name: id}
+#for what's already in the database
+def _prepare(kind, rows, names):
+    spec = KINDS[kind]
+    params, errors = [], []
+    seen = set()
+    for number, row in rows:
+        try:
+            missing = [column for column in spec["required"] if not _text(row, column)]
+            if missing:
+                raise ValueError("missing " + ", ".join(missing))
+            if kind == "volunteers":
+                name = _text(row, "name")
+                if name in names["volunteers"] or name in seen:
+                    raise ValueError(f"volunteer {name!r} already exists")
+                seen.add(name)
+                added = _date(_text(row, "date_added")) if _text(row, "date_added") else date.today().isoformat()
+                params.append((name, _text(row, "email"), _text(row, "phone"), added))
+            elif kind == "recipes":
+                name = _text(row, "name")
+                if name in names["recipes"] or name in seen:
+                    raise ValueError(f"recipe {name!r} already exists")
+                seen.add(name)
+                creator = names["volunteers"].get(_text(row, "creator"))
+                if creator is None:
+                    raise ValueError(f"no volunteer named {_text(row, 'creator')!r}")
+                ingredients, instructions = _text(row, "ingredients"), _text(row, "instructions")
+                params.append((name, ingredients, instructions, lines_json(ingredients), lines_json(instructions), creator))
+            else:
+                volunteer = names["volunteers"].get(_text(row, "volunteer"))
+                if volunteer is None:
+                    raise ValueError(f"no volunteer named {_text(row, 'volunteer')!r}")
+                day = _date(_text(row, "date"))
+                teacher = _teacher(row)
+                if kind == "meals":
+                    recipe = names["recipes"].get(_text(row, "recipe"))
+                    if recipe is None:
+                        raise ValueError(f"no recipe named {_text(row, 'recipe')!r}")
+                    params.append((recipe, day, volunteer, teacher))
+                else:
+                    hidden = _text(row, "hidden").lower() in ("1", "true", "yes", "y")
+                    params.append((_text(row, "name"), day, volunteer, teacher, int(hidden)))
+        except ValueError as e:
+            errors.append((number, str(e)))
+    return params, errors
+
+#validate and load `rows` (from parse_rows) of `kind` on the writer connection `db`.
+#nothing is written if any row has an error or dry_run is set
+def import_rows(db, kind, rows, dry_run=False):
+    if kind not in KINDS:
+        raise ImportFileError(f"unknown kind {kind!r}, expected one of {', '.join(KINDS)}")
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        names = {table: dict(db.execute(f"SELECT name, id FROM {table}").fetchall())
+                 for table in ("volunteers", "recipes")}
+        params, errors = _prepare(kind, rows, names)
+        if errors or dry_run:
+            db.rollback()
+            return ImportResult(kind, len(rows), 0, errors)
+        if kind == "volunteers":
+            db.executemany("INSERT INTO volunteers (name, email, phone, date_added) VALUES (?, ?, ?, ?)", params)
+        elif kind == "recipes":
+            db.executemany("""INSERT INTO recipes (name, ingredients, instructions, ingredient_lines, instruction_lines,
+                              creator_id) VALUES (?, ?, ?, ?, ?, ?)""", params)
+        else:
+            teachers = {row[-2] if kind == "gift_cards" else row[-1] for row in params} - {None}
+            db.executemany("INSERT OR IGNORE INTO teachers (name, email) VALUES (?, ?)", teachers)
+            teacher_ids = {}
+            if teachers:
+                teacher_ids = {(name, email): id for id, name, email in db.execute("SELECT id, name, email FROM teachers")}
+            if kind == "meals":
+                db.executemany("INSERT INTO meals (recipe_id, date, volunteer_id, teacher_id) VALUES (?, ?, ?, ?)",
+                               [(recipe, day, volunteer, teacher_ids.get(teacher))
+                                for recipe, day, volunteer, teacher in params])
+            else:
+                db.executemany("INSERT INTO gift_cards (name, date, volunteer_id, teacher_id, hidden) VALUES (?, ?, ?, ?, ?)",
+                               [(name, day, volunteer, teacher_ids.get(teacher), hidden)
+                                for name, day, volunteer, teacher, hidden in params])
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return ImportResult(kind, len(rows), len(params), [])
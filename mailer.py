@@ -0,0 +1,153 @@
+import threading
+import time
+from datetime import datetime
+
+#reminder emails go through the outbox table: admin_send_emails only inserts rows, and a
+#small pool of background threads sends them. each thread logs in once and reuses that
+#smtp session for every message it claims, retrying failures with exponential backoff.
+#smtplib and email are only imported once a message is sent, not by every worker at boot.
+
+#a message that stays "sending" this long belongs to a worker that died and is claimed again
+STALE_CLAIM_SECONDS = 300
+
+class Mailer:
+    def __init__(self, writer, host, port, username=None, password=None, use_ssl=True, workers=2,
+                 max_attempts=5, backoff=30, timeout=30):
+        self._writer = writer
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._threads = []
+
+    #queue messages (dicts with sender, to, cc, subject, text, html) as one batch on the
+    #writer connection `db` and return their outbox ids. the caller commits
+    def enqueue(self, db, messages, batch):
+        created_at = datetime.now().isoformat(timespec="seconds")
+        return [db.execute("""INSERT INTO outbox (batch, sender, to_addr, cc_addr, subject, body_text, body_html, created_at)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                           (batch, m["sender"], m["to"], m.get("cc"), m["subject"], m["text"], m.get("html"),
+                            created_at)).lastrowid
+                for m in messages]
+
+    #start worker threads in this process unless enough are already running
+    def start(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for _ in range(self.workers - len(self._threads)):
+                thread = threading.Thread(target=self.work, daemon=True, name="outbox-worker")
+                thread.start()
+                self._threads.append(thread)
+
+    #whether any worker thread in this process is still sending
+    def busy(self):
+        with self._lock:
+            return any(t.is_alive() for t in self._threads)
+
+    def _connect(self):
+        import smtplib
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def _claim(self):
+        now = time.time()
+        with self._writer() as db:
+            row = db.execute("""UPDATE outbox SET status = 'sending', attempts = attempts + 1, claimed_at = ?
+                                WHERE id = (SELECT id FROM outbox WHERE (status = 'queued' AND next_attempt_at <= ?)
+                                OR (status = 'sending' AND claimed_at < ?) ORDER BY id LIMIT 1)
+                                RETURNING id, sender, to_addr, cc_addr, subject, body_text, body_html, attempts""",
+                             (now, now, now - STALE_CLAIM_SECONDS)).fetchall()
+            db.commit()
+        return row[0] if row else None
+
+    #seconds until the next message waiting on a retry is due, or None if nothing is left
+    def _next_due(self):
+        with self._writer() as db:
+            row = db.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'queued'").fetchone()
+        return None if row[0] is None else max(0, row[0] - time.time())
+
+    def _finish(self, row, error=None, permanent=False):
+        with self._writer() as db:
+            if error is None:
+                db.execute("UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                           (datetime.now().isoformat(timespec="seconds"), row["id"]))
+            elif permanent or row["attempts"] >= self.max_attempts:
+                db.execute("UPDATE outbox SET status = 'failed', last_error = ? WHERE id = ?", (str(error), row["id"]))
+            else:
+                delay = self.backoff * 2 ** (row["attempts"] - 1)
+                db.execute("UPDATE outbox SET status = 'queued', last_error = ?, next_attempt_at = ? WHERE id = ?",
+                           (str(error), time.time() + delay, row["id"]))
+            db.commit()
+
+    @staticmethod
+    def build(row):
+        from email.message import EmailMessage
+        msg = EmailMessage()
+        msg["Subject"] = row["subject"]
+        msg["From"] = row["sender"]
+        msg["To"] = row["to_addr"]
+        if row["cc_addr"]:
+            msg["Cc"] = row["cc_addr"]
+        msg.set_content(row["body_text"])
+        if row["body_html"]:
+            msg.add_alternative(row["body_html"], subtype="html")
+        return msg
+
+    #send until the outbox is empty. runs in the worker threads, or in the foreground
+    #from `flask send-outbox`
+    def work(self):
+        import smtplib
+        smtp = None
+        try:
+            while True:
+                row = self._claim()
+                if row is None:
+                    wait = self._next_due()
+                    if wait is None:
+                        break
+                    #don't hold an idle session open through the backoff
+                    if smtp is not None:
+                        try:
+                            smtp.quit()
+                        except Exception:
+                            pass
+                        smtp = None
+                    time.sleep(min(wait, self.backoff) + 0.1)
+                    continue
+                msg = self.build(row)
+                #cc_addr may list several addresses, comma separated
+                recipients = [row["to_addr"]] + [addr.strip() for addr in (row["cc_addr"] or "").split(",") if addr.strip()]
+                try:
+                    if smtp is None:
+                        smtp = self._connect()
+                    smtp.send_message(msg, to_addrs=recipients)
+                except smtplib.SMTPRecipientsRefused as e:
+                    self._finish(row, e, permanent=True)
+                except (smtplib.SMTPException, OSError) as e:
+                    #drop the session, the next message opens a fresh one
+                    if smtp is not None:
+                        try:
+                            smtp.close()
+                        except Exception:
+                            pass
+                        smtp = None
+                    self._finish(row, e)
+                else:
+                    self._finish(row)
+        finally:
+            if smtp is not None:
+                try:
+                    smtp.quit()
+                except Exception:
+                    pass
@@ -0,0 +1,85 @@
+import re
+import threading
+
+#per-route request metrics for /admin/metrics, in the prometheus text format. query_db
+#adds every statement's time to the request, and the request is recorded once its
+#response is ready.
+
+#seconds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+WHITESPACE = re.compile(r"\s+")
+
+#the statement with literals replaced by ? and whitespace collapsed, so the slow log
+#groups the same query together however it was written
+def normalize_sql(sql):
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = NUMBER_LITERAL.sub("?", sql)
+    return WHITESPACE.sub(" ", sql).strip()
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket{{{labels},le="{bound:g}"}} {count}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.total}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {self.total}"
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self.slow_queries = 0
+
+    #one finished request: total and db seconds, statement count
+    def record(self, route, method, status, duration, db_time, queries):
+        key = (route, method, status // 100)
+        with self._lock:
+            histograms = self._routes.get(key)
+            if histograms is None:
+                histograms = self._routes[key] = (Histogram(DURATION_BUCKETS), Histogram(DURATION_BUCKETS),
+                                                  Histogram(QUERY_BUCKETS))
+            histograms[0].observe(duration)
+            histograms[1].observe(db_time)
+            histograms[2].observe(queries)
+
+    def slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def render(self):
+        with self._lock:
+            routes = sorted(self._routes.items())
+            out = []
+            for index, (name, help_text) in enumerate([
+                    ("mog_request_duration_seconds", "Time to build the response."),
+                    ("mog_request_db_seconds", "Time spent in query_db per request."),
+                    ("mog_request_queries", "Statements run through query_db per request.")]):
+                out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} histogram")
+                for (route, method, status), histograms in routes:
+                    labels = f'route="{_label(route)}",method="{method}",status="{status}xx"'
+                    out.extend(histograms[index].lines(name, labels))
+            out.append("# HELP mog_slow_queries_total Statements slower than SLOW_QUERY_MS.")
+            out.append("# TYPE mog_slow_queries_total counter")
+            out.append(f"mog_slow_queries_total {self.slow_queries}")
+        return "\n".join(out) + "\n"
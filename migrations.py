@@ -0,0 +1,296 @@
+from recipe_text import lines_json
+
+#ordered schema migrations. the version a database is at lives in PRAGMA user_version,
+#so each migration and its version bump commit (or roll back) together.
+#a step is either a sql statement or a function taking the connection.
+
+class MigrationError(Exception):
+    pass
+
+def _reject_duplicates(table):
+    def check(db):
+        dupes = db.execute(f"SELECT name FROM {table} GROUP BY name HAVING COUNT(*) > 1 ORDER BY name").fetchall()
+        if dupes:
+            names = ", ".join(row[0] for row in dupes)
+            raise MigrationError(f"duplicate names in {table}: {names}. Rename or merge them, then migrate again.")
+    return check
+
+#ALTER TABLE ADD COLUMN has no IF NOT EXISTS, so check the table first
+def _add_column(table, column, declaration):
+    def add(db):
+        columns = [row[1] for row in db.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    return add
+
+#recompute the ranking tables from scratch. used by the migration that creates them
+#and by `flask rebuild-rankings` if the counts ever drift. reward_count and use_count
+#count the live tables, archived_count the seasons moved out by a rollover
+def rebuild_rankings(db):
+    db.execute("DELETE FROM volunteer_rankings")
+    db.execute("""INSERT INTO volunteer_rankings (volunteer_id, reward_count, archived_count)
+                  SELECT volunteers.id, (SELECT COUNT(*) FROM meals WHERE meals.volunteer_id = volunteers.id)
+                  + (SELECT COUNT(*) FROM gift_cards WHERE gift_cards.volunteer_id = volunteers.id),
+                  (SELECT COUNT(*) FROM meals_archive WHERE meals_archive.volunteer_id = volunteers.id)
+                  + (SELECT COUNT(*) FROM gift_cards_archive WHERE gift_cards_archive.volunteer_id = volunteers.id)
+                  FROM volunteers""")
+    db.execute("DELETE FROM recipe_rankings")
+    db.execute("""INSERT INTO recipe_rankings (recipe_id, use_count, archived_count)
+                  SELECT recipes.id, (SELECT COUNT(*) FROM meals WHERE meals.recipe_id = recipes.id),
+                  (SELECT COUNT(*) FROM meals_archive WHERE meals_archive.recipe_id = recipes.id) FROM recipes""")
+
+#the ranking tables as migration 4 created them, before there was an archive to count
+def _rebuild_live_rankings(db):
+    db.execute("DELETE FROM volunteer_rankings")
+    db.execute("""INSERT INTO volunteer_rankings (volunteer_id, reward_count)
+                  SELECT volunteers.id, (SELECT COUNT(*) FROM meals WHERE meals.volunteer_id = volunteers.id)
+                  + (SELECT COUNT(*) FROM gift_cards WHERE gift_cards.volunteer_id = volunteers.id) FROM volunteers""")
+    db.execute("DELETE FROM recipe_rankings")
+    db.execute("""INSERT INTO recipe_rankings (recipe_id, use_count)
+                  SELECT recipes.id, (SELECT COUNT(*) FROM meals WHERE meals.recipe_id = recipes.id) FROM recipes""")
+
+#a row in table_generations for each table, bumped by triggers on every write to it
+def _track_generations(*tables):
+    def track(db):
+        for table in tables:
+            db.execute("INSERT OR IGNORE INTO table_generations (name) VALUES (?)", (table,))
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                db.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_generation_{event.lower()} AFTER {event} ON {table}
+                               BEGIN UPDATE table_generations SET generation = generation + 1 WHERE name = '{table}'; END""")
+    return track
+
+#store the cleaned ingredient and instruction lines for recipes saved before they were kept
+def _backfill_recipe_lines(db):
+    rows = db.execute("SELECT id, ingredients, instructions FROM recipes").fetchall()
+    db.executemany("UPDATE recipes SET ingredient_lines = ?, instruction_lines = ? WHERE id = ?",
+                   [(lines_json(ingredients), lines_json(instructions), id) for id, ingredients, instructions in rows])
+
+MIGRATIONS = [
+    (1, "baseline schema", [
+        """CREATE TABLE IF NOT EXISTS passwords (id INTEGER PRIMARY KEY, username TEXT NOT NULL UNIQUE,
+           hash TEXT NOT NULL)""",
+        "CREATE TABLE IF NOT EXISTS volunteer_codes (id INTEGER PRIMARY KEY, code TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS teacher_codes (id INTEGER PRIMARY KEY, code TEXT NOT NULL)",
+        """CREATE TABLE IF NOT EXISTS volunteers (id INTEGER PRIMARY KEY, name TEXT NOT NULL, email TEXT,
+           phone TEXT, date_added TEXT)""",
+        """CREATE TABLE IF NOT EXISTS teachers (id INTEGER PRIMARY KEY, name TEXT NOT NULL, email TEXT NOT NULL,
+           UNIQUE (name, email))""",
+        """CREATE TABLE IF NOT EXISTS recipes (id INTEGER PRIMARY KEY, name TEXT NOT NULL, ingredients TEXT,
+           instructions TEXT, creator_id INTEGER REFERENCES volunteers(id), image_url TEXT)""",
+        """CREATE TABLE IF NOT EXISTS meals (id INTEGER PRIMARY KEY, recipe_id INTEGER REFERENCES recipes(id),
+           date TEXT NOT NULL, volunteer_id INTEGER REFERENCES volunteers(id),
+           teacher_id INTEGER REFERENCES teachers(id))""",
+        """CREATE TABLE IF NOT EXISTS gift_cards (id INTEGER PRIMARY KEY, name TEXT NOT NULL, date TEXT NOT NULL,
+           volunteer_id INTEGER REFERENCES volunteers(id), teacher_id INTEGER REFERENCES teachers(id),
+           hidden BOOLEAN NOT NULL DEFAULT 0)""",
+        """CREATE TABLE IF NOT EXISTS deadlines (id INTEGER PRIMARY KEY, month_year TEXT NOT NULL,
+           volunteer_start TEXT DEFAULT (date('now', 'localtime')), volunteer_end TEXT, dropoff_start TEXT,
+           dropoff_end TEXT, teacher_start TEXT, teacher_end TEXT)""",
+    ]),
+    (2, "indexes on hot query columns", [
+        #signup listings filter on date and join out on the id columns, so the date
+        #indexes carry those columns and never have to touch the table itself
+        "CREATE INDEX IF NOT EXISTS idx_meals_date ON meals (date, volunteer_id, recipe_id, teacher_id)",
+        "CREATE INDEX IF NOT EXISTS idx_meals_volunteer ON meals (volunteer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_meals_recipe ON meals (recipe_id)",
+        "CREATE INDEX IF NOT EXISTS idx_meals_teacher ON meals (teacher_id)",
+        "CREATE INDEX IF NOT EXISTS idx_gift_cards_date ON gift_cards (date, volunteer_id, teacher_id, hidden, name)",
+        "CREATE INDEX IF NOT EXISTS idx_gift_cards_volunteer ON gift_cards (volunteer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_gift_cards_teacher ON gift_cards (teacher_id)",
+        "CREATE INDEX IF NOT EXISTS idx_recipes_creator ON recipes (creator_id)",
+        "CREATE INDEX IF NOT EXISTS idx_deadlines_month_year ON deadlines (month_year)",
+        "ANALYZE",
+    ]),
+    (3, "unique volunteer and recipe names", [
+        _reject_duplicates("volunteers"),
+        _reject_duplicates("recipes"),
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_volunteers_name ON volunteers (name)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_recipes_name ON recipes (name)",
+    ]),
+    (4, "ranking tables kept up to date by triggers", [
+        """CREATE TABLE IF NOT EXISTS volunteer_rankings (volunteer_id INTEGER PRIMARY KEY REFERENCES volunteers(id),
+           reward_count INTEGER NOT NULL DEFAULT 0)""",
+        "CREATE INDEX IF NOT EXISTS idx_volunteer_rankings_count ON volunteer_rankings (reward_count)",
+        """CREATE TABLE IF NOT EXISTS recipe_rankings (recipe_id INTEGER PRIMARY KEY REFERENCES recipes(id),
+           use_count INTEGER NOT NULL DEFAULT 0)""",
+        "CREATE INDEX IF NOT EXISTS idx_recipe_rankings_count ON recipe_rankings (use_count)",
+        #every volunteer and recipe gets a row, so the page still lists the ones with no signups
+        """CREATE TRIGGER IF NOT EXISTS volunteers_rankings_insert AFTER INSERT ON volunteers BEGIN
+           INSERT OR IGNORE INTO volunteer_rankings (volunteer_id) VALUES (NEW.id); END""",
+        """CREATE TRIGGER IF NOT EXISTS volunteers_rankings_delete AFTER DELETE ON volunteers BEGIN
+           DELETE FROM volunteer_rankings WHERE volunteer_id = OLD.id; END""",
+        """CREATE TRIGGER IF NOT EXISTS recipes_rankings_insert AFTER INSERT ON recipes BEGIN
+           INSERT OR IGNORE INTO recipe_rankings (recipe_id) VALUES (NEW.id); END""",
+        """CREATE TRIGGER IF NOT EXISTS recipes_rankings_delete AFTER DELETE ON recipes BEGIN
+           DELETE FROM recipe_rankings WHERE recipe_id = OLD.id; END""",
+        """CREATE TRIGGER IF NOT EXISTS meals_rankings_insert AFTER INSERT ON meals BEGIN
+           UPDATE volunteer_rankings SET reward_count = reward_count + 1 WHERE volunteer_id = NEW.volunteer_id;
+           UPDATE recipe_rankings SET use_count = use_count + 1 WHERE recipe_id = NEW.recipe_id; END""",
+        """CREATE TRIGGER IF NOT EXISTS meals_rankings_delete AFTER DELETE ON meals BEGIN
+           UPDATE volunteer_rankings SET reward_count = reward_count - 1 WHERE volunteer_id = OLD.volunteer_id;
+           UPDATE recipe_rankings SET use_count = use_count - 1 WHERE recipe_id = OLD.recipe_id; END""",
+        """CREATE TRIGGER IF NOT EXISTS meals_rankings_update AFTER UPDATE OF volunteer_id, recipe_id ON meals BEGIN
+           UPDATE volunteer_rankings SET reward_count = reward_count - 1 WHERE volunteer_id = OLD.volunteer_id;
+           UPDATE volunteer_rankings SET reward_count = reward_count + 1 WHERE volunteer_id = NEW.volunteer_id;
+           UPDATE recipe_rankings SET use_count = use_count - 1 WHERE recipe_id = OLD.recipe_id;
+           UPDATE recipe_rankings SET use_count = use_count + 1 WHERE recipe_id = NEW.recipe_id; END""",
+        """CREATE TRIGGER IF NOT EXISTS gift_cards_rankings_insert AFTER INSERT ON gift_cards BEGIN
+           UPDATE volunteer_rankings SET reward_count = reward_count + 1 WHERE volunteer_id = NEW.volunteer_id; END""",
+        """CREATE TRIGGER IF NOT EXISTS gift_cards_rankings_delete AFTER DELETE ON gift_cards BEGIN
+           UPDATE volunteer_rankings SET reward_count = reward_count - 1 WHERE volunteer_id = OLD.volunteer_id; END""",
+        """CREATE TRIGGER IF NOT EXISTS gift_cards_rankings_update AFTER UPDATE OF volunteer_id ON gift_cards BEGIN
+           UPDATE volunteer_rankings SET reward_count = reward_count - 1 WHERE volunteer_id = OLD.volunteer_id;
+           UPDATE volunteer_rankings SET reward_count = reward_count + 1 WHERE volunteer_id = NEW.volunteer_id; END""",
+        _rebuild_live_rankings,
+    ]),
+    (5, "outbox for background email sending", [
+        """CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY, batch TEXT NOT NULL, sender TEXT,
+           to_addr TEXT NOT NULL, cc_addr TEXT, subject TEXT NOT NULL, body_text TEXT NOT NULL, body_html TEXT,
+           status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT,
+           next_attempt_at REAL NOT NULL DEFAULT 0, claimed_at REAL, created_at TEXT, sent_at TEXT)""",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, next_attempt_at)",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_batch ON outbox (batch, status)",
+    ]),
+    (6, "resized recipe image variants", [
+        _add_column("recipes", "thumb_url", "TEXT"),
+        _add_column("recipes", "medium_url", "TEXT"),
+    ]),
+    (7, "full text search over recipes", [
+        #rowid is the recipe id. prefix indexes keep "chick*" style lookups fast
+        """CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(name, ingredients, instructions, creator_name,
+           tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""",
+        """CREATE TRIGGER IF NOT EXISTS recipes_fts_insert AFTER INSERT ON recipes BEGIN
+           INSERT INTO recipes_fts (rowid, name, ingredients, instructions, creator_name)
+           VALUES (NEW.id, NEW.name, NEW.ingredients, NEW.instructions,
+           (SELECT name FROM volunteers WHERE id = NEW.creator_id)); END""",
+        """CREATE TRIGGER IF NOT EXISTS recipes_fts_delete AFTER DELETE ON recipes BEGIN
+           DELETE FROM recipes_fts WHERE rowid = OLD.id; END""",
+        """CREATE TRIGGER IF NOT EXISTS recipes_fts_update AFTER UPDATE OF name, ingredients, instructions, creator_id
+           ON recipes BEGIN
+           DELETE FROM recipes_fts WHERE rowid = OLD.id;
+           INSERT INTO recipes_fts (rowid, name, ingredients, instructions, creator_name)
+           VALUES (NEW.id, NEW.name, NEW.ingredients, NEW.instructions,
+           (SELECT name FROM volunteers WHERE id = NEW.creator_id)); END""",
+        """CREATE TRIGGER IF NOT EXISTS volunteers_fts_update AFTER UPDATE OF name ON volunteers BEGIN
+           UPDATE recipes_fts SET creator_name = NEW.name WHERE rowid IN (SELECT id FROM recipes WHERE creator_id = NEW.id); END""",
+        "DELETE FROM recipes_fts",
+        """INSERT INTO recipes_fts (rowid, name, ingredients, instructions, creator_name)
+           SELECT recipes.id, recipes.name, ingredients, instructions, volunteers.name
+           FROM recipes LEFT JOIN volunteers ON volunteers.id = recipes.creator_id""",
+    ]),
+    (8, "cleaned recipe lines", [
+        _add_column("recipes", "ingredient_lines", "TEXT"),
+        _add_column("recipes", "instruction_lines", "TEXT"),
+        _backfill_recipe_lines,
+    ]),
+    (9, "season archive", [
+        #finished school years moved out of the live tables by `flask season-rollover`.
+        #rows keep their original id, but sqlite may hand that id out again once the live
+        #table is emptied, so the archive has its own rowid
+        """CREATE TABLE IF NOT EXISTS meals_archive (id INTEGER NOT NULL, recipe_id INTEGER REFERENCES recipes(id),
+           date TEXT NOT NULL, volunteer_id INTEGER REFERENCES volunteers(id),
+           teacher_id INTEGER REFERENCES teachers(id), season INTEGER NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS gift_cards_archive (id INTEGER NOT NULL, name TEXT NOT NULL, date TEXT NOT NULL,
+           volunteer_id INTEGER REFERENCES volunteers(id), teacher_id INTEGER REFERENCES teachers(id),
+           hidden BOOLEAN NOT NULL DEFAULT 0, season INTEGER NOT NULL)""",
+        "CREATE INDEX IF NOT EXISTS idx_meals_archive_date ON meals_archive (date)",
+        "CREATE INDEX IF NOT EXISTS idx_meals_archive_volunteer ON meals_archive (volunteer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_meals_archive_recipe ON meals_archive (recipe_id)",
+        "CREATE INDEX IF NOT EXISTS idx_gift_cards_archive_date ON gift_cards_archive (date)",
+        "CREATE INDEX IF NOT EXISTS idx_gift_cards_archive_volunteer ON gift_cards_archive (volunteer_id)",
+        """CREATE TABLE IF NOT EXISTS season_archives (season INTEGER PRIMARY KEY, meals INTEGER NOT NULL,
+           gift_cards INTEGER NOT NULL, archived_at TEXT NOT NULL)""",
+        #live and archived rows together, for the pages that are asked for past seasons
+        """CREATE VIEW IF NOT EXISTS all_meals AS
+           SELECT id, recipe_id, date, volunteer_id, teacher_id FROM meals
+           UNION ALL SELECT id, recipe_id, date, volunteer_id, teacher_id FROM meals_archive""",
+        """CREATE VIEW IF NOT EXISTS all_gift_cards AS
+           SELECT id, name, date, volunteer_id, teacher_id, hidden FROM gift_cards
+           UNION ALL SELECT id, name, date, volunteer_id, teacher_id, hidden FROM gift_cards_archive""",
+        _add_column("volunteer_rankings", "archived_count", "INTEGER NOT NULL DEFAULT 0"),
+        _add_column("recipe_rankings", "archived_count", "INTEGER NOT NULL DEFAULT 0"),
+        rebuild_rankings,
+    ]),
+    (10, "table generations for cross-process caches", [
+        "CREATE TABLE IF NOT EXISTS table_generations (name TEXT PRIMARY KEY, generation INTEGER NOT NULL DEFAULT 0)",
+        _track_generations("meals", "gift_cards", "recipes", "deadlines", "volunteers", "teachers",
+                           "volunteer_codes", "teacher_codes"),
+    ]),
+    (11, "reward events for the teacher page", [
+        #AUTOINCREMENT so ids never go backwards; clients resume from the last id they saw
+        """CREATE TABLE IF NOT EXISTS reward_events (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL,
+           reward_type TEXT NOT NULL, reward_id INTEGER NOT NULL, teacher_name TEXT, created_at TEXT NOT NULL)""",
+        """CREATE TRIGGER IF NOT EXISTS meals_reward_event AFTER UPDATE OF teacher_id ON meals
+           WHEN OLD.teacher_id IS NOT NEW.teacher_id BEGIN
+           INSERT INTO reward_events (type, reward_type, reward_id, teacher_name, created_at)
+           VALUES (CASE WHEN NEW.teacher_id IS NULL THEN 'unclaim' ELSE 'claim' END, 'meals', NEW.id,
+           (SELECT name FROM teachers WHERE id = NEW.teacher_id), datetime('now')); END""",
+        """CREATE TRIGGER IF NOT EXISTS gift_cards_reward_event AFTER UPDATE OF teacher_id ON gift_cards
+           WHEN OLD.teacher_id IS NOT NEW.teacher_id BEGIN
+           INSERT INTO reward_events (type, reward_type, reward_id, teacher_name, created_at)
+           VALUES (CASE WHEN NEW.teacher_id IS NULL THEN 'unclaim' ELSE 'claim' END, 'gift_cards', NEW.id,
+           (SELECT name FROM teachers WHERE id = NEW.teacher_id), datetime('now')); END""",
+        """CREATE TRIGGER IF NOT EXISTS gift_cards_hidden_event AFTER UPDATE OF hidden ON gift_cards
+           WHEN OLD.hidden IS NOT NEW.hidden BEGIN
+           INSERT INTO reward_events (type, reward_type, reward_id, created_at)
+           VALUES (CASE WHEN NEW.hidden THEN 'hide' ELSE 'show' END, 'gift_cards', NEW.id, datetime('now')); END""",
+        #keep the newest 10000 events, trimming every 1000
+        """CREATE TRIGGER IF NOT EXISTS reward_events_trim AFTER INSERT ON reward_events WHEN NEW.id % 1000 = 0 BEGIN
+           DELETE FROM reward_events WHERE id <= NEW.id - 10000; END""",
+    ]),
+    (12, "reminder delivery ledger", [
+        #one row per meal a reminder digest told its teacher about, pointing at the digest's outbox row
+        """CREATE TABLE IF NOT EXISTS reminder_deliveries (meal_id INTEGER NOT NULL, recipient TEXT NOT NULL,
+           template_version INTEGER NOT NULL, window_start TEXT, outbox_id INTEGER REFERENCES outbox(id),
+           PRIMARY KEY (meal_id, recipient, template_version))""",
+    ]),
+    (13, "dropoff capacity per day", [
+        #most meals and gift cards dropped off on one day of the month, NULL for DROPOFF_MAX_PER_DAY
+        _add_column("deadlines", "max_per_day", "INTEGER"),
+    ]),
+    (14, "forget reminder deliveries of deleted meals", [
+        #meal ids are reused once the newest meals are deleted (a season rollover empties the
+        #table), and a new meal must not look like it was already reminded
+        "DELETE FROM reminder_deliveries WHERE meal_id NOT IN (SELECT id FROM meals)",
+        """CREATE TRIGGER IF NOT EXISTS reminder_deliveries_meal_delete AFTER DELETE ON meals BEGIN
+           DELETE FROM reminder_deliveries WHERE meal_id = OLD.id; END""",
+    ]),
+    (15, "reminder deliveries per volunteer", [
+        #volunteers used to be copied on their teacher's digest and now get their own. record
+        #them as told about every meal they were copied on, so they aren't sent it again
+        """INSERT OR IGNORE INTO reminder_deliveries (meal_id, recipient, template_version, window_start, outbox_id)
+           SELECT sent.meal_id, volunteers.email, sent.template_version, sent.window_start, sent.outbox_id
+           FROM reminder_deliveries AS sent JOIN meals ON meals.id = sent.meal_id
+           JOIN volunteers ON volunteers.id = meals.volunteer_id
+           JOIN teachers ON teachers.id = meals.teacher_id AND teachers.email = sent.recipient
+           WHERE volunteers.email IS NOT NULL AND volunteers.email <> ''""",
+    ]),
+]
+
+def current_version(db):
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+#apply every migration newer than the database, oldest first. BEGIN IMMEDIATE plus the
+#version re-check makes it safe for several workers to migrate the same file at startup
+def migrate(db, target=None):
+    applied = []
+    for version, name, steps in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(db) >= version:
+                db.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(db)
+                else:
+                    db.execute(step)
+            db.execute(f"PRAGMA user_version = {int(version)}")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        applied.append((version, name))
+    return applied
@@ -0,0 +1,95 @@
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+#rendered pages kept in memory, least recently used first out once they pass a byte budget.
+#every entry is keyed by the tables it was built from and their generation counters.
+#query_db bumps a table's generation whenever it writes to it, so a write makes every
+#page built from the old data unreachable and it ages out of the lru. a hit never
+#touches sqlite.
+#
+#these local generations only see writes made by this process. `shared` (the
+#Generations from cache.py) adds each table's counter from the database, which every
+#worker's writes move, so a page is also rebuilt after another process writes. max_age
+#is a backstop for tables the shared counters don't cover.
+
+#the table a write statement changes
+WRITE_TABLE = re.compile(r"^\s*(?:insert(?:\s+or\s+\w+)?\s+into|replace\s+into|update(?:\s+or\s+\w+)?|delete\s+from)\s+[\"`\[]?(\w+)",
+                         re.IGNORECASE)
+
+def written_table(sql):
+    match = WRITE_TABLE.match(sql)
+    return match.group(1).lower() if match else None
+
+class PageCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_age=10.0, shared=None):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._shared = shared
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def generation(self, table):
+        if self._shared is None:
+            return self._generations.get(table, 0)
+        return (self._generations.get(table, 0), self._shared.get(table))
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+
+    #call after running a statement; bumps the table it wrote to, if any
+    def note_write(self, sql):
+        table = written_table(sql)
+        if table:
+            self.bump(table)
+
+    #the cached value for `key` built from `tables`, or build() stored under it.
+    #`size` measures a value in bytes for the budget, or returns None to not keep it
+    def get_or_build(self, key, tables, build, size=sys.getsizeof):
+        with self._lock:
+            full_key = (key, tuple((table, self.generation(table)) for table in tables))
+            entry = self._entries.get(full_key)
+            if entry is not None and time.monotonic() - entry[2] < self.max_age:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = build()
+        nbytes = size(value)
+        if nbytes is None or nbytes > self.max_bytes:
+            return value
+        with self._lock:
+            #a write that landed while building changed the key, so this copy is dropped
+            if full_key[1] != tuple((table, self.generation(table)) for table in tables):
+                return value
+            old = self._entries.pop(full_key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[full_key] = (value, nbytes, time.monotonic())
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else None}
@@ -0,0 +1,72 @@
+import base64
+import binascii
+import json
+from datetime import date
+from typing import NamedTuple, Optional
+
+#keyset pagination for the list pages. instead of OFFSET, a page starts right after the
+#sort key of the last row shown, so page 50 costs the same as page 1 and rows added or
+#removed between clicks don't shift what the next page shows.
+#
+#`keys` is the sort order as (sql expression, record field) pairs, ending in a unique
+#column so every row has a distinct key, e.g. [("meals.date", "date"), ("meals.id", "meal_id")].
+#key columns must not be NULL. cursors are opaque url-safe strings that remember the
+#direction and the key of the row the page is relative to.
+
+class Page(NamedTuple):
+    rows: list
+    next: Optional[str]
+    prev: Optional[str]
+
+def encode_cursor(direction, values):
+    values = [value.isoformat() if isinstance(value, date) else value for value in values]
+    raw = json.dumps([direction, values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+#(direction, values) from a cursor, or None for a missing or malformed one. cursors come
+#from the url, so anything that isn't exactly what encode_cursor makes is ignored
+def decode_cursor(cursor, length):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, values = json.loads(raw)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if direction not in ("n", "p") or not isinstance(values, list) or len(values) != length:
+        return None
+    if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+        return None
+    return direction, values
+
+#one page of `select` (a query with no WHERE or ORDER BY) filtered by `where`/`args`,
+#`per_page` rows after or before `cursor`. `query` is query_db from app.py
+def paginate(query, select, keys, where=None, args=(), cursor=None, per_page=50, descending=False):
+    decoded = decode_cursor(cursor, len(keys))
+    backwards = decoded is not None and decoded[0] == "p"
+    ascending = descending == backwards
+    conditions = [where] if where else []
+    params = list(args)
+    if decoded is not None:
+        columns = ", ".join(expression for expression, _ in keys)
+        placeholders = ", ".join("?" * len(keys))
+        conditions.append(f"({columns}) {'>' if ascending else '<'} ({placeholders})")
+        params.extend(decoded[1])
+    sql = select
+    if conditions:
+        sql += " WHERE " + " AND ".join(f"({condition})" for condition in conditions)
+    sql += " ORDER BY " + ", ".join(f"{expression} {'ASC' if ascending else 'DESC'}" for expression, _ in keys)
+    sql += " LIMIT ?"
+    rows = query(sql, params + [per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    has_next = True if backwards else more
+    has_prev = more if backwards else decoded is not None
+    if not rows:
+        return Page(rows, None, None)
+    key = lambda row: [row[field] for _, field in keys]
+    return Page(rows,
+                encode_cursor("n", key(rows[-1])) if has_next else None,
+                encode_cursor("p", key(rows[0])) if has_prev else None)
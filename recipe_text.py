@@ -0,0 +1,38 @@
+import json
+import re
+
+#how recipe ingredients and instructions are tidied for display. this runs once when a
+#recipe is saved, and the lines are stored as json arrays next to the raw text the
+#volunteer typed (which the edit form keeps showing).
+
+#a leading bullet ("-", "*", "•") or step number ("3.") the recipe page adds back itself
+LIST_MARKER = re.compile(r"^\s*(?:[\-\*\•]|\d+\.)\s*")
+#anything other than word characters, whitespace and basic punctuation
+STRAY_CHARACTERS = re.compile(r"[^\w\s.,()-]")
+
+def clean_lines(text):
+    """Split text into display lines without list markers, stray symbols or blank lines.
+
+    >>> clean_lines("- 2 cups flour\\n\\n* 1 tsp salt!\\n• butter (soft)")
+    ['2 cups flour', '1 tsp salt', 'butter (soft)']
+    >>> clean_lines("1. Preheat to 350°F.\\r\\n2.Mix well ;)\\n  ---  ")
+    ['Preheat to 350F.', 'Mix well )', '--']
+    >>> clean_lines(None)
+    []
+    """
+    lines = []
+    for line in (text or "").splitlines():
+        line = STRAY_CHARACTERS.sub("", LIST_MARKER.sub("", line)).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+#what gets stored in recipes.ingredient_lines / instruction_lines
+def lines_json(text):
+    return json.dumps(clean_lines(text), ensure_ascii=False)
+
+#the stored lines, or the raw text cleaned on the spot for a row written before they existed
+def stored_lines(stored, text):
+    if stored is None:
+        return clean_lines(text)
+    return json.loads(stored)
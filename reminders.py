@@ -0,0 +1,163 @@
+from typing import NamedTuple
+
+from markupsafe import escape
+
+from db import fetch_records
+
+#reminder emails for a dropoff window, one digest per recipient: each teacher gets the
+#meals coming to them with who is bringing each, and each volunteer gets the meals they
+#are delivering, so nobody's address is shown to the other volunteers. every meal a
+#digest covers is written to the reminder_deliveries ledger under (meal, recipient,
+#template version) in the same transaction that queues the digest, so sending again only
+#picks up meals a recipient hasn't been told about yet (new signups, a changed teacher, or
+#a digest that failed for good). changing the wording below and bumping TEMPLATE_VERSION
+#sends everything once more.
+
+TEMPLATE_VERSION = 2
+
+class Digest(NamedTuple):
+    to: str
+    name: str
+    role: str
+    meals: list
+
+#(meal, recipient) pairs in the window with a teacher that haven't been queued (or whose
+#digest failed): the teacher and the volunteer of every meal
+PENDING = """WITH dropoffs AS (SELECT meals.id AS meal_id, date AS dropoff_date, recipes.name AS meal_name,
+             volunteers.name AS volunteer_name, volunteers.email AS volunteer_email, teachers.name AS teacher_name,
+             teachers.email AS teacher_email FROM meals JOIN recipes ON recipes.id = meals.recipe_id
+             JOIN volunteers ON volunteers.id = meals.volunteer_id JOIN teachers ON teachers.id = meals.teacher_id
+             WHERE date BETWEEN :start AND :end),
+             recipients AS (SELECT 'teacher' AS role, teacher_email AS recipient, teacher_name AS recipient_name, dropoffs.*
+             FROM dropoffs UNION ALL
+             SELECT 'volunteer', volunteer_email, volunteer_name, dropoffs.* FROM dropoffs)
+             SELECT recipients.* FROM recipients
+             LEFT JOIN reminder_deliveries AS sent ON sent.meal_id = recipients.meal_id AND sent.recipient = recipients.recipient
+             AND sent.template_version = :version
+             LEFT JOIN outbox ON outbox.id = sent.outbox_id
+             WHERE recipients.recipient IS NOT NULL AND recipients.recipient <> ''
+             AND (sent.meal_id IS NULL OR outbox.status IS 'failed')
+             ORDER BY recipients.recipient, role, dropoff_date, meal_name"""
+
+#group rows (from PENDING) into one digest per recipient address and role
+def digests(rows):
+    grouped = {}
+    for row in rows:
+        key = (row["recipient"], row["role"])
+        digest = grouped.get(key)
+        if digest is None:
+            digest = grouped[key] = Digest(row["recipient"], row["recipient_name"], row["role"], [])
+        digest.meals.append(row)
+    return list(grouped.values())
+
+def _date(day):
+    return day.strftime("%A, %B ") + str(day.day)
+
+#the volunteer bringing a meal, with their address when they have one, as (text, html)
+def _volunteer(meal):
+    name, email = meal["volunteer_name"], meal["volunteer_email"]
+    if not email:
+        return name, f"<b>{escape(name)}</b>"
+    return f"{name} ({email})", f"<b>{escape(name)}</b> ({escape(email)})"
+
+#intro, list items and note of a teacher's digest, as (text, html) pairs
+def _teacher_parts(meals):
+    if len(meals) == 1:
+        meal = meals[0]
+        by = _volunteer(meal)
+        intro = (f"your meal, {meal['meal_name']}, will be delivered on the afternoon of "
+                 f"{_date(meal['dropoff_date'])} by {by[0]} at the front office.",
+                 f"your meal, <b>{escape(meal['meal_name'])}</b>, will be delivered on the afternoon of "
+                 f"<b>{_date(meal['dropoff_date'])}</b> by {by[1]} at the front office.")
+        items = []
+        note = ("Please note that the parent volunteer has selected this date and it may not be changed. " +
+                ("Please let the volunteer know at the address above if you will be out of school on this date."
+                 if meal["volunteer_email"] else
+                 "Please let the coordinator know by replying to this email if you will be out of school on this date."))
+    else:
+        intro = ("these meals will be delivered to you at the front office:",) * 2
+        items = []
+        for meal in meals:
+            by = _volunteer(meal)
+            items.append((f"{meal['meal_name']}, on the afternoon of {_date(meal['dropoff_date'])}, by {by[0]}",
+                          f"<b>{escape(meal['meal_name'])}</b>, on the afternoon of <b>{_date(meal['dropoff_date'])}</b>, "
+                          f"by {by[1]}"))
+        if all(meal["volunteer_email"] for meal in meals):
+            contact = "each volunteer know at the address listed"
+        elif any(meal["volunteer_email"] for meal in meals):
+            contact = "each volunteer know at the address listed (or the coordinator, by replying to this email, where none is listed)"
+        else:
+            contact = "the coordinator know by replying to this email"
+        note = ("Please note that the parent volunteers have selected these dates and they may not be changed. "
+                f"Please let {contact} if you will be out of school on any of these dates.")
+    closing = ("If you like the meal or would like to provide feedback to make this program better, our volunteers "
+               "would love to hear from you!")
+    return intro, items, note, closing
+
+def _volunteer_parts(meals):
+    if len(meals) == 1:
+        meal = meals[0]
+        intro = (f"you are delivering {meal['meal_name']} to {meal['teacher_name']} on the afternoon of "
+                 f"{_date(meal['dropoff_date'])} at the front office.",
+                 f"you are delivering <b>{escape(meal['meal_name'])}</b> to <b>{escape(meal['teacher_name'])}</b> "
+                 f"on the afternoon of <b>{_date(meal['dropoff_date'])}</b> at the front office.")
+        items = []
+    else:
+        intro = ("you are delivering these meals at the front office:",) * 2
+        items = [(f"{meal['meal_name']} for {meal['teacher_name']}, on the afternoon of {_date(meal['dropoff_date'])}",
+                  f"<b>{escape(meal['meal_name'])}</b> for <b>{escape(meal['teacher_name'])}</b>, on the afternoon of "
+                  f"<b>{_date(meal['dropoff_date'])}</b>") for meal in meals]
+    note = "If something comes up and you can't make a delivery, please let the coordinator know as soon as possible."
+    closing = "Thank you for cooking for our teachers!"
+    return intro, items, note, closing
+
+#the outbox message for a digest
+def digest_message(digest, sender, coordinator, subject):
+    parts = _teacher_parts if digest.role == "teacher" else _volunteer_parts
+    intro, items, note, closing = parts(digest.meals)
+    items_text = "\n\n" + "\n".join(f"- {text}" for text, _ in items) if items else ""
+    items_html = "\n            <ul>" + "".join(f"<li>{html}</li>" for _, html in items) + "</ul>" if items else ""
+    text = (
+        f"Dear {digest.name},\n\nThis email comes from the Meals of Gratitude program letting you "
+        f"know that {intro[0]}{items_text}\n\n{note}\n\n{closing}\n\n"
+        f"Sincerely,\n\n{coordinator}\n\nMeals of Gratitude Coordinator"
+    )
+    html = f"""
+    <html>
+        <body>
+            <p>Dear {escape(digest.name)},</p>
+            <p>This email comes from the Meals of Gratitude program letting you know that {intro[1]}</p>{items_html}
+            <p>{note}</p>
+            <p>{closing}</p>
+            <p>Sincerely,<br>
+            {escape(coordinator)}<br>
+            Meals of Gratitude Coordinator</p>
+        </body>
+    </html>
+    """
+    return {"sender": sender, "to": digest.to, "cc": None, "subject": subject, "text": text, "html": html}
+
+#queue a digest for every recipient with meals in [start, end] they haven't been sent, on
+#the writer connection `db`, signed by `coordinator`. returns the digests; with dry_run
+#nothing is queued or recorded
+def send_reminders(db, mailer, sender, coordinator, subject, start, end, batch, dry_run=False):
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        cur = db.cursor()
+        cur.row_factory = None
+        rows = fetch_records(cur.execute(PENDING, {"start": start, "end": end, "version": TEMPLATE_VERSION}))
+        pending = digests(rows)
+        if dry_run or not pending:
+            db.rollback()
+            return pending
+        ids = mailer.enqueue(db, [digest_message(digest, sender, coordinator, subject) for digest in pending], batch)
+        db.executemany("""INSERT INTO reminder_deliveries (meal_id, recipient, template_version, window_start, outbox_id)
+                          VALUES (?, ?, ?, ?, ?) ON CONFLICT (meal_id, recipient, template_version)
+                          DO UPDATE SET outbox_id = excluded.outbox_id""",
+                       [(meal["meal_id"], digest.to, TEMPLATE_VERSION, start, outbox_id)
+                        for digest, outbox_id in zip(pending, ids) for meal in digest.meals])
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return pending
@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing import NamedTuple
+
+#moving finished school years out of meals and gift_cards. every page that works on the
+#current month reads the live tables, so keeping only the current season there keeps
+#them small however many years the program runs. archived rows go to meals_archive and
+#gift_cards_archive in the same database, so the move is one transaction: either every
+#row of the season is in the archive or none of them are.
+#
+#the ranking triggers take a point off reward_count and use_count for every deleted row,
+#so the same counts are added to archived_count first and the all-time totals never change.
+
+#the school year a yyyy-mm-dd date column falls in (seasons start august 1)
+SEASON = "CAST(strftime('%Y', date) AS INTEGER) - (strftime('%m', date) < '08')"
+
+class RolloverResult(NamedTuple):
+    seasons: list
+    meals: int
+    gift_cards: int
+
+#(season, meals, gift cards) for every season with live rows dated before `before`
+def pending_seasons(db, before):
+    return db.execute(f"""SELECT season, SUM(meal), SUM(1 - meal) FROM
+                          (SELECT {SEASON} AS season, 1 AS meal FROM meals WHERE date < :before
+                           UNION ALL SELECT {SEASON}, 0 FROM gift_cards WHERE date < :before)
+                          GROUP BY season ORDER BY season""", {"before": before}).fetchall()
+
+#seasons already archived, oldest first
+def archived_seasons(db):
+    return [row[0] for row in db.execute("SELECT season FROM season_archives ORDER BY season")]
+
+#the first date still in the live tables, or None if nothing has been archived
+def live_since(db):
+    season = db.execute("SELECT MAX(season) FROM season_archives").fetchone()[0]
+    return None if season is None else f"{season + 1}-08-01"
+
+#move every meal and gift card dated before `before` (an iso date, normally the august 1
+#that starts the current season) into the archive. `db` is the writer connection
+def roll_over(db, before, dry_run=False):
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        pending = pending_seasons(db, before)
+        result = RolloverResult([row[0] for row in pending], sum(row[1] for row in pending),
+                                sum(row[2] for row in pending))
+        if dry_run or not pending:
+            db.rollback()
+            return result
+        db.execute("""UPDATE volunteer_rankings SET archived_count = archived_count + moved.n FROM
+                      (SELECT volunteer_id, COUNT(*) AS n FROM
+                       (SELECT volunteer_id FROM meals WHERE date < :before
+                        UNION ALL SELECT volunteer_id FROM gift_cards WHERE date < :before)
+                       GROUP BY volunteer_id) AS moved
+                      WHERE volunteer_rankings.volunteer_id = moved.volunteer_id""", {"before": before})
+        db.execute("""UPDATE recipe_rankings SET archived_count = archived_count + moved.n FROM
+                      (SELECT recipe_id, COUNT(*) AS n FROM meals WHERE date < :before GROUP BY recipe_id) AS moved
+                      WHERE recipe_rankings.recipe_id = moved.recipe_id""", {"before": before})
+        db.execute(f"""INSERT INTO meals_archive (id, recipe_id, date, volunteer_id, teacher_id, season)
+                       SELECT id, recipe_id, date, volunteer_id, teacher_id, {SEASON} FROM meals
+                       WHERE date < :before ORDER BY date, id""", {"before": before})
+        db.execute(f"""INSERT INTO gift_cards_archive (id, name, date, volunteer_id, teacher_id, hidden, season)
+                       SELECT id, name, date, volunteer_id, teacher_id, hidden, {SEASON} FROM gift_cards
+                       WHERE date < :before ORDER BY date, id""", {"before": before})
+        #a season can be rolled over in parts (say, signups added late), so the totals add up
+        now = datetime.now().isoformat(timespec="seconds")
+        db.executemany("""INSERT INTO season_archives (season, meals, gift_cards, archived_at) VALUES (?, ?, ?, ?)
+                          ON CONFLICT (season) DO UPDATE SET meals = meals + excluded.meals,
+                          gift_cards = gift_cards + excluded.gift_cards, archived_at = excluded.archived_at""",
+                       [(season, meals, gift_cards, now) for season, meals, gift_cards in pending])
+        db.execute("DELETE FROM meals WHERE date < ?", (before,))
+        db.execute("DELETE FROM gift_cards WHERE date < ?", (before,))
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return result
@@ -0,0 +1,47 @@
+import re
+from markupsafe import escape
+
+#ranked recipe search over the recipes_fts table (see migration 7)
+
+#bm25 column weights: name, ingredients, instructions, creator_name
+WEIGHTS = (10.0, 2.0, 1.0, 5.0)
+
+TOKEN = re.compile(r"\w+")
+
+#snippet() marks matches with these control characters so the text can be html-escaped
+#before they become <mark> tags
+MARK_OPEN, MARK_CLOSE = "\x02", "\x03"
+
+#turn what the user typed into an fts5 query: every word must match, the last one as a
+#prefix so results show up while they're still typing. None if there are no words
+def fts_query(text):
+    tokens = TOKEN.findall((text or "").lower())
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    return " ".join(terms)
+
+def highlight(snippet):
+    if not snippet:
+        return ""
+    return str(escape(snippet)).replace(MARK_OPEN, "<mark>").replace(MARK_CLOSE, "</mark>")
+
+#one page of matching recipes, best match first, plus whether there is another page.
+#an empty search lists every recipe by name
+def search_recipes(query_db, text, page=1, per_page=20):
+    match = fts_query(text)
+    offset = (page - 1) * per_page
+    if match is None:
+        rows = query_db("""SELECT recipes.id, recipes.name AS recipe_name, volunteers.name AS volunteer_name,
+                        image_url, thumb_url, NULL AS snippet FROM recipes JOIN volunteers
+                        ON recipes.creator_id = volunteers.id ORDER BY recipe_name LIMIT ? OFFSET ?""",
+                        (per_page + 1, offset))
+    else:
+        rows = query_db(f"""SELECT recipes.id, recipes.name AS recipe_name, volunteers.name AS volunteer_name,
+                        image_url, thumb_url,
+                        snippet(recipes_fts, -1, '{MARK_OPEN}', '{MARK_CLOSE}', '…', 12) AS snippet
+                        FROM recipes_fts JOIN recipes ON recipes.id = recipes_fts.rowid
+                        JOIN volunteers ON recipes.creator_id = volunteers.id
+                        WHERE recipes_fts MATCH ? ORDER BY bm25(recipes_fts, {', '.join(map(str, WEIGHTS))}), recipe_name
+                        LIMIT ? OFFSET ?""", (match, per_page + 1, offset))
+    return rows[:per_page], len(rows) > per_page
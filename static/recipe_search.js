@@ -0,0 +1,92 @@
+//server side search for the recipe grids on /recipes/ and /admin/recipes.
+//typing replaces the grid with ranked results from /recipes/search, "Load more" fetches
+//the next page of them, and clearing the box brings back the page the server rendered
+(function() {
+    const grid = document.getElementById('recipeGrid');
+    const search = document.getElementById('recipeSearch');
+    const loadMore = document.getElementById('loadMore');
+    const noResults = document.getElementById('noResults');
+    const pagers = document.querySelectorAll('.pager');
+    const perPage = grid.dataset.perPage;
+    const editable = grid.dataset.edit == '1';
+    //the school's path prefix, when it has one
+    const root = document.body.dataset.root;
+    const rendered = Array.from(grid.children);
+    let query = '';
+    let next = null;
+    let request = 0;
+
+    function card(recipe) {
+        const col = document.createElement('div');
+        col.className = 'col recipe-card';
+        col.innerHTML = `
+            <div class="card h-100 d-flex flex-column">
+                <div class="ratio ratio-16x9">
+                    <img class="card-img-top" loading="lazy" width="640" height="360" style="object-fit: cover;">
+                </div>
+                <div class="card-body d-flex flex-column justify-content-between">
+                    <h5 class="card-title"><a></a></h5>
+                    <p class="card-text"></p>
+                    <p class="card-text small text-muted snippet"></p>
+                </div>
+            </div>`;
+        col.querySelector('img').src = recipe.image;
+        const link = col.querySelector('.card-title a');
+        link.href = recipe.url;
+        link.textContent = recipe.name;
+        col.querySelector('.card-text').textContent = recipe.volunteer_name;
+        //snippets come back html-escaped with only <mark> tags added
+        col.querySelector('.snippet').innerHTML = recipe.snippet;
+        if (editable) {
+            const edit = document.createElement('a');
+            edit.href = `${root}/admin/edit-recipe-${recipe.id}`;
+            edit.className = 'btn btn-warning';
+            edit.textContent = 'Edit/delete';
+            col.querySelector('.card-body').appendChild(edit);
+        }
+        return col;
+    }
+
+    function showing(searching) {
+        pagers.forEach(pager => pager.style.display = searching ? 'none' : '');
+        loadMore.style.display = searching && next ? '' : 'none';
+        noResults.style.display = grid.children.length == 0 ? '' : 'none';
+    }
+
+    async function load(reset) {
+        const current = ++request;
+        const params = new URLSearchParams({q: query, per_page: perPage});
+        if (!reset && next) {
+            params.set('cursor', next);
+        }
+        const response = await fetch(`${root}/recipes/search?${params}`);
+        const data = await response.json();
+        if (current != request) {
+            return;
+        }
+        if (reset) {
+            grid.replaceChildren();
+        }
+        data.results.forEach(recipe => grid.appendChild(card(recipe)));
+        next = data.next;
+        showing(true);
+    }
+
+    let timer = null;
+    search.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(() => {
+            query = this.value.trim();
+            if (query) {
+                load(true);
+            } else {
+                request++;
+                next = null;
+                grid.replaceChildren(...rendered);
+                showing(false);
+            }
+        }, 200);
+    });
+
+    loadMore.addEventListener('click', () => load(false));
+})();
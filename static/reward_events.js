@@ -0,0 +1,94 @@
+//live updates for the teacher reward page while signups are open. claims made by other
+//teachers replace the signup form with who took it, hidden gift cards disappear, and
+//anything the page can't show in place (a reward freed up or shown again) reloads it.
+//browsers without EventSource, or whose stream keeps failing, poll the state endpoint
+//instead, which answers 304 until something changes
+(function() {
+    const feed = document.getElementById('rewardEvents');
+    if (!feed) {
+        return;
+    }
+    //the school's path prefix, when it has one
+    const root = document.body.dataset.root;
+    let after = feed.dataset.after;
+    let failures = 0;
+
+    function row(type, id) {
+        return document.querySelector(`tr[data-reward="${type}-${id}"]`);
+    }
+
+    function claimed(tr, teacher) {
+        const status = tr.querySelector('.reward-status');
+        if (status.querySelector('form')) {
+            status.textContent = `Signed up for by ${teacher}.`;
+        }
+    }
+
+    function apply(type, event) {
+        const tr = row(event.reward_type, event.reward_id);
+        if (type == 'claim' && tr) {
+            claimed(tr, event.teacher_name);
+        } else if (type == 'hide' && tr) {
+            tr.remove();
+        } else if (type == 'unclaim' || type == 'show' || type == 'reset') {
+            location.reload();
+        }
+    }
+
+    function poll() {
+        fetch(`${root}/teachers/reward-signup/state`, {cache: 'no-cache'})
+            .then(response => response.ok ? response.json() : null)
+            .then(state => {
+                if (!state) {
+                    return;
+                }
+                const open = new Set();
+                for (const type of ['meals', 'gift_cards']) {
+                    for (const reward of state[type]) {
+                        const tr = row(type, reward.id);
+                        open.add(`${type}-${reward.id}`);
+                        if (!tr || (reward.teacher_name === null) != !!tr.querySelector('.reward-status form')) {
+                            //a reward the page doesn't have, or one that was given back
+                            if (!tr || reward.teacher_name === null) {
+                                location.reload();
+                                return;
+                            }
+                            claimed(tr, reward.teacher_name);
+                        }
+                    }
+                }
+                document.querySelectorAll('tr[data-reward]').forEach(tr => {
+                    if (!open.has(tr.dataset.reward)) {
+                        tr.remove();
+                    }
+                });
+            })
+            .catch(() => {});
+    }
+
+    function listen() {
+        const source = new EventSource(`${root}/teachers/reward-signup/events?after=${after}`);
+        for (const type of ['claim', 'unclaim', 'hide', 'show', 'reset']) {
+            source.addEventListener(type, e => {
+                failures = 0;
+                after = e.lastEventId || after;
+                apply(type, JSON.parse(e.data));
+            });
+        }
+        source.onerror = () => {
+            //the server ends each stream after a few minutes and the browser reconnects on
+            //its own; only give up on streaming if it keeps failing
+            if (++failures >= 5) {
+                source.close();
+                setInterval(poll, 10000);
+            }
+        };
+        source.onopen = () => { failures = 0; };
+    }
+
+    if (window.EventSource) {
+        listen();
+    } else {
+        setInterval(poll, 10000);
+    }
+})();
@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+#one deployment serving several schools. each school (a tenant) is reached through its
+#own host name or a path prefix on a shared host, and gets its own sqlite file,
+#connection pool, caches, event feed and mail settings. a tenant is opened by the first
+#request that needs it, and closed again once it has sat idle for idle_seconds, or when
+#more than max_open are open and it is the least recently used one with nothing running.
+
+#the environ key TenantRouter leaves the tenant's name under
+ENVIRON_KEY = "mog.tenant"
+
+SETTINGS = ("host", "prefix", "database", "email", "app_password", "coordinator", "smtp_host", "smtp_port", "smtp_ssl")
+
+class TenantConfig(NamedTuple):
+    name: str
+    database: str
+    host: Optional[str] = None
+    prefix: Optional[str] = None
+    email: Optional[str] = None
+    app_password: Optional[str] = None
+    coordinator: Optional[str] = None
+    smtp_host: Optional[str] = None
+    smtp_port: Optional[int] = None
+    smtp_ssl: bool = True
+
+#read the TENANTS json file: {"<name>": {"host": ..., "prefix": ..., "database": ..., ...}}.
+#anything a school leaves out comes from `defaults`, and its database defaults to
+#<name>.db next to the file. raises ValueError for a file that can't be served
+def load_tenants(path, defaults):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not data:
+        raise ValueError(f"{path}: expected an object of schools")
+    configs = []
+    for name, settings in data.items():
+        if not name.replace("-", "").replace("_", "").isalnum():
+            raise ValueError(f"{path}: school name {name!r} may only use letters, digits, - and _")
+        unknown = set(settings) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f"{path}: unknown settings for {name}: {', '.join(sorted(unknown))}")
+        values = {**defaults, **settings}
+        prefix = values.get("prefix")
+        if prefix is not None and (not prefix.startswith("/") or prefix.endswith("/") or prefix == "/"):
+            raise ValueError(f"{path}: prefix for {name} must look like /{name}")
+        values["database"] = values.get("database") or os.path.join(os.path.dirname(os.path.abspath(path)), f"{name}.db")
+        values["host"] = values["host"].lower() if values.get("host") else None
+        values["smtp_port"] = int(values["smtp_port"]) if values.get("smtp_port") else None
+        configs.append(TenantConfig(name=name, **{key: values.get(key) for key in TenantConfig._fields if key != "name"}))
+    return configs
+
+class _Slot:
+    __slots__ = ("state", "active", "used", "lock")
+
+    def __init__(self):
+        self.state = None
+        self.active = 0
+        self.used = time.monotonic()
+        self.lock = threading.Lock()
+
+#the open tenants of one worker process. `open(config)` builds a tenant's state, an
+#object with busy() (true while it has background work, e.g. mail being sent) and close()
+class TenantRegistry:
+    def __init__(self, configs, open, max_open=8, idle_seconds=600, default=None):
+        self.configs = {config.name: config for config in configs}
+        self._hosts = {}
+        self._prefixes = []
+        self.fallback = None
+        for config in configs:
+            if config.host:
+                if config.host in self._hosts:
+                    raise ValueError(f"host {config.host} is given to both {self._hosts[config.host]} and {config.name}")
+                self._hosts[config.host] = config.name
+            if config.prefix:
+                if any(prefix == config.prefix for prefix, _ in self._prefixes):
+                    raise ValueError(f"prefix {config.prefix} is given to more than one school")
+                self._prefixes.append((config.prefix, config.name))
+            if not config.host and not config.prefix:
+                if self.fallback is not None:
+                    raise ValueError(f"{self.fallback} and {config.name} both have no host or prefix")
+                self.fallback = config.name
+        #longest first, so /east-high wins over /east
+        self._prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+        if default is not None and default not in self.configs:
+            raise ValueError(f"TENANT names {default}, which is not a configured school")
+        self.default_name = default or (configs[0].name if len(configs) == 1 else None)
+        self._open = open
+        self.max_open = max(1, int(max_open))
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._slots = OrderedDict()
+        self._pinned = None
+        self.opens = 0
+        self.closes = 0
+
+    #(name, prefix) of the tenant serving `path` on `host`, or None. an exact host match
+    #wins, then the longest matching prefix, then the school with neither
+    def route(self, host, path):
+        name = self._hosts.get((host or "").rsplit(":", 1)[0].lower())
+        if name is not None:
+            return name, ""
+        for prefix, name in self._prefixes:
+            if path == prefix or path.startswith(prefix + "/"):
+                return name, prefix
+        return (self.fallback, "") if self.fallback else None
+
+    #the state of tenant `name`, opened if needed. every acquire needs a release
+    def acquire(self, name):
+        config = self.configs[name]
+        with self._lock:
+            slot = self._slots.get(name)
+            if slot is None:
+                slot = self._slots[name] = _Slot()
+            slot.active += 1
+            slot.used = time.monotonic()
+            self._slots.move_to_end(name)
+        try:
+            #opening migrates the database, so it happens outside the registry lock
+            with slot.lock:
+                if slot.state is None:
+                    slot.state = self._open(config)
+                    self.opens += 1
+        except BaseException:
+            self.release(name)
+            raise
+        self._evict()
+        return slot.state
+
+    def release(self, name):
+        with self._lock:
+            slot = self._slots.get(name)
+            if slot is not None:
+                slot.active -= 1
+                slot.used = time.monotonic()
+
+    #the tenant used outside requests (cli commands, warm up): TENANT, or the only school.
+    #it stays open for the life of the process
+    def default(self):
+        if self._pinned is None:
+            if self.default_name is None:
+                raise RuntimeError("several schools are configured; choose one with TENANT=<name>")
+            self._pinned = self.acquire(self.default_name)
+        return self._pinned
+
+    #close tenants idle past idle_seconds, and the least recently used ones while more
+    #than max_open are open. tenants serving a request or sending mail are kept
+    def _evict(self):
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            excess = len(self._slots) - self.max_open
+            for name, slot in list(self._slots.items()):
+                if excess <= 0 and now - slot.used < self.idle_seconds:
+                    continue
+                if slot.active or (slot.state is not None and slot.state.busy()):
+                    continue
+                #a slot without state is one whose open failed
+                del self._slots[name]
+                if slot.state is not None:
+                    victims.append(slot.state)
+                excess -= 1
+        for state in victims:
+            state.close()
+            self.closes += 1
+
+    def stats(self):
+        with self._lock:
+            return {"open": list(self._slots), "active": {name: slot.active for name, slot in self._slots.items()},
+                    "opens": self.opens, "closes": self.closes}
+
+#wsgi middleware in front of the flask app: picks the tenant for each request and, for a
+#path prefix, moves the prefix into SCRIPT_NAME so routes and url_for work unchanged
+class TenantRouter:
+    def __init__(self, app, registry):
+        self.app = app
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        route = self.registry.route(environ.get("HTTP_HOST") or environ.get("SERVER_NAME"), path)
+        if route is None:
+            start_response("404 Not Found", [("Content-Type", "text/plain; charset=utf-8")])
+            return [b"No school is served at this address.\n"]
+        name, prefix = route
+        if prefix:
+            if path == prefix:
+                start_response("308 Permanent Redirect", [("Location", environ.get("SCRIPT_NAME", "") + prefix + "/")])
+                return [b""]
+            environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + prefix
+            environ["PATH_INFO"] = path[len(prefix):]
+        environ[ENVIRON_KEY] = name
+        return self.app(environ, start_response)